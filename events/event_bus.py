@@ -1,5 +1,6 @@
 # events/event_bus.py
 from typing import Callable, Dict, List
+import numpy as np
 
 class EventBus:
     def __init__(self):
@@ -13,4 +14,37 @@ class EventBus:
     def publish(self, event_type: str, data=None):
         if event_type in self.subscribers:
             for handler in self.subscribers[event_type]:
-                handler(data)
\ No newline at end of file
+                handler(data)
+
+    def batch_channel(self, event_type: str, capacity: int, dtype) -> 'BatchChannel':
+        """
+        Create a channel that collects records of `event_type` into a
+        preallocated buffer and publishes them as a single event, instead
+        of publishing an event per record.
+        """
+        return BatchChannel(self, event_type, capacity, dtype)
+
+class BatchChannel:
+    """
+    A preallocated structured array of event records. Records are appended
+    with `append`, and `flush` publishes the records collected so far as one
+    event whose data is a structured array (one row per record). The buffer
+    is also flushed whenever it is full.
+    """
+    def __init__(self, event_bus: EventBus, event_type: str, capacity: int, dtype):
+        self.event_bus = event_bus
+        self.event_type = event_type
+        self.buffer = np.empty(capacity, dtype=dtype)
+        self.count = 0
+
+    def append(self, *record) -> None:
+        if self.count == len(self.buffer):
+            self.flush()
+        self.buffer[self.count] = record
+        self.count += 1
+
+    def flush(self) -> None:
+        if self.count:
+            # copy, since the buffer is reused for the next records
+            self.event_bus.publish(self.event_type, self.buffer[:self.count].copy())
+            self.count = 0
@@ -1,4 +1,5 @@
 from model.bh import BarnesHut
+import model.bh_cuda as bh_cuda
 import math
 import pygame
 from pprint import pprint
@@ -7,6 +8,7 @@ from model.body import Body
 import utils.const as const
 import model.forces as forces
 from model.body_list import BodyList
+from model.body_arrays import BodyArrays
 from view.renderer import Renderer
 from controller.controller import Controller
 from model.springs import Springs
@@ -122,13 +124,12 @@ def main():
     gravity = forces.generate_gravitational_force(
         event_bus=event_bus,
         G=const.SIM_GRAVITY)
-    repulsion = forces.generate_repulsion_force(
+    # repulsion and collision damping, fused into a single pass over the pairs
+    contact = forces.generate_contact_force(
        event_bus=event_bus,
        strength=1e3,
        factor=CircleTools.intersection_area,
-       beta=1.5)
-    collision_damping = forces.generate_collision_damping_force(
-       event_bus=event_bus,
+       beta=1.5,
        damping=1e2)
     virtual_spring_field = generate_virtual_spring_field(
         event_bus=event_bus,
@@ -162,18 +163,30 @@ def main():
             pygame.display.update()            
             continue
 
-        barnes_hut.build_tree(bodies)
-        barnes_hut.compute_forces(bodies, gravity)
-        barnes_hut.compute_neighborhood_pairs(const.NEIGHBORHOOD_RADIUS)
-        barnes_hut.compute_local_forces(repulsion)
-        barnes_hut.compute_local_forces(collision_damping)
+        arrays = BodyArrays.from_bodies(bodies)
+        # the quadtree is only needed for Barnes-Hut gravity; the neighbor
+        # pairs are found from the snapshot
+        if len(bodies) < const.DIRECT_GRAVITY_MAX_BODIES:
+            fx, fy = arrays.zero_forces()
+            gravity.all_pairs(arrays, fx, fy)
+            arrays.add_forces(fx, fy)
+        elif len(bodies) >= const.GPU_BARNES_HUT_MIN_BODIES:
+            barnes_hut.build_tree(bodies)
+            bh_cuda.compute_gravity_forces(barnes_hut, bodies, const.SIM_GRAVITY)
+        else:
+            barnes_hut.build_tree(bodies)
+            barnes_hut.compute_gravity_forces(bodies, const.SIM_GRAVITY)
+        barnes_hut.compute_neighborhood_pairs(const.NEIGHBORHOOD_RADIUS, arrays)
+        barnes_hut.compute_local_forces(contact, arrays)
 
         virtual_spring_field(
-            neighbors=barnes_hut.overlapping_pairs,
-            springs=springs)
+            neighbors=barnes_hut.neighbor_indices,
+            springs=springs,
+            arrays=arrays)
         
-        spont_merge(neighbors=barnes_hut.overlapping_pairs,
-                    bodies=bodies)
+        spont_merge(neighbors=barnes_hut.neighbor_indices,
+                    bodies=bodies,
+                    arrays=arrays)
 
         
         SimState().update(pygame.time.get_ticks())
@@ -0,0 +1,271 @@
+import math
+import numpy as np
+
+try:
+    from numba import njit, prange, get_num_threads
+except ImportError:
+    njit = None
+else:
+    from utils._numba_kernels import intersection_area as _intersection_area
+    from utils._numba_kernels import chord_length as _chord_length
+    from utils._numba_kernels import penetration_depth as _penetration_depth
+
+HAS_NUMBA = njit is not None
+
+# Codes for the repulsion factors that have a compiled version, see
+# `generate_repulsion_force`.
+FACTOR_INTERSECTION_AREA = 0
+FACTOR_CHORD_LENGTH = 1
+FACTOR_PENETRATION_DEPTH = 2
+
+if HAS_NUMBA:
+    # Compiled versions of the batched force kernels in `model.forces`.
+    #
+    # Each kernel makes a single pass over the pairs, fusing the displacement,
+    # distance, force and scatter steps. The pairs are split into one chunk
+    # per thread, and each thread accumulates into its own row of a
+    # (num_threads, num_bodies) buffer, so that no two threads write to the
+    # same element. The rows are summed into `fx`, `fy` at the end. The
+    # buffers are allocated outside of the compiled functions so that they
+    # can be cached.
+
+    def _local_buffers(n: int) -> tuple[np.ndarray, np.ndarray]:
+        n_threads = get_num_threads()
+        return np.zeros((n_threads, n)), np.zeros((n_threads, n))
+
+    @njit(cache=True)
+    def _reduce_local(fx, fy, fx_local, fy_local):
+        for t in range(fx_local.shape[0]):
+            for k in range(fx.shape[0]):
+                fx[k] += fx_local[t, k]
+                fy[k] += fy_local[t, k]
+
+    @njit(cache=True, fastmath=True)
+    def _factor(code, r1, r2, d):
+        if code == FACTOR_INTERSECTION_AREA:
+            return _intersection_area(r1, r2, d)
+        if code == FACTOR_CHORD_LENGTH:
+            return _chord_length(r1, r2, d)
+        return _penetration_depth(r1, r2, d)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _gravity(fx_local, fy_local, i_idx, j_idx, px, py, mass, fx, fy, G, eps2):
+        """
+        Gravity between the pairs: body i is pulled towards body j. With
+        fastmath, `1 / sqrt` may be lowered to a reciprocal square root
+        instruction.
+        """
+        n_pairs = i_idx.shape[0]
+        n_threads = fx_local.shape[0]
+        chunk = (n_pairs + n_threads - 1) // n_threads
+        for t in prange(n_threads):
+            for p in range(t * chunk, min(n_pairs, (t + 1) * chunk)):
+                i = i_idx[p]
+                j = j_idx[p]
+                dx = px[j] - px[i]
+                dy = py[j] - py[i]
+                inv_r = 1.0 / math.sqrt(dx * dx + dy * dy + eps2)
+                f = G * mass[i] * mass[j] * inv_r * inv_r * inv_r
+                fx_local[t, i] += f * dx
+                fy_local[t, i] += f * dy
+                fx_local[t, j] -= f * dx
+                fy_local[t, j] -= f * dy
+        _reduce_local(fx, fy, fx_local, fy_local)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _repulsion(fx_local, fy_local, i_idx, j_idx, px, py, radius, fx, fy,
+                   strength, factor_code, slack, beta):
+        """
+        Repulsion between overlapping pairs: body i is pushed away from
+        body j.
+        """
+        n_pairs = i_idx.shape[0]
+        n_threads = fx_local.shape[0]
+        chunk = (n_pairs + n_threads - 1) // n_threads
+        for t in prange(n_threads):
+            for p in range(t * chunk, min(n_pairs, (t + 1) * chunk)):
+                i = i_idx[p]
+                j = j_idx[p]
+                dx = px[i] - px[j]
+                dy = py[i] - py[j]
+                dist_sq = dx * dx + dy * dy
+                min_dist = radius[i] + radius[j] + slack
+                if dist_sq == 0.0 or dist_sq > min_dist * min_dist:
+                    continue
+                dist = math.sqrt(dist_sq)
+                g = _factor(factor_code, radius[i], radius[j], dist)
+                f = strength * g ** beta / dist
+                fx_local[t, i] += f * dx
+                fy_local[t, i] += f * dy
+                fx_local[t, j] -= f * dx
+                fy_local[t, j] -= f * dy
+        _reduce_local(fx, fy, fx_local, fy_local)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _collision_damping(fx_local, fy_local, i_idx, j_idx, px, py, vx, vy,
+                           radius, fx, fy, damping):
+        """
+        Damping of the relative velocity along the normal of overlapping
+        pairs.
+        """
+        n_pairs = i_idx.shape[0]
+        n_threads = fx_local.shape[0]
+        chunk = (n_pairs + n_threads - 1) // n_threads
+        for t in prange(n_threads):
+            for p in range(t * chunk, min(n_pairs, (t + 1) * chunk)):
+                i = i_idx[p]
+                j = j_idx[p]
+                dx = px[j] - px[i]
+                dy = py[j] - py[i]
+                dist_sq = dx * dx + dy * dy
+                radii = radius[i] + radius[j]
+                if dist_sq == 0.0 or dist_sq > radii * radii:
+                    continue
+                dist = math.sqrt(dist_sq)
+                nx = dx / dist
+                ny = dy / dist
+                f = -damping * ((vx[i] - vx[j]) * nx + (vy[i] - vy[j]) * ny)
+                fx_local[t, i] += f * nx
+                fy_local[t, i] += f * ny
+                fx_local[t, j] -= f * nx
+                fy_local[t, j] -= f * ny
+        _reduce_local(fx, fy, fx_local, fy_local)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _contact(fx_local, fy_local, i_idx, j_idx, px, py, vx, vy, radius,
+                 fx, fy, strength, factor_code, slack, beta, damping):
+        """
+        Repulsion plus collision damping, sharing the distance and normal of
+        each pair.
+        """
+        n_pairs = i_idx.shape[0]
+        n_threads = fx_local.shape[0]
+        chunk = (n_pairs + n_threads - 1) // n_threads
+        for t in prange(n_threads):
+            for p in range(t * chunk, min(n_pairs, (t + 1) * chunk)):
+                i = i_idx[p]
+                j = j_idx[p]
+                dx = px[i] - px[j]
+                dy = py[i] - py[j]
+                dist_sq = dx * dx + dy * dy
+                radii = radius[i] + radius[j]
+                min_dist = radii + slack
+                if dist_sq == 0.0 or dist_sq > min_dist * min_dist:
+                    continue
+                dist = math.sqrt(dist_sq)
+                nx = dx / dist
+                ny = dy / dist
+                f = strength * _factor(factor_code, radius[i], radius[j], dist) ** beta
+                if dist <= radii:
+                    f -= damping * ((vx[i] - vx[j]) * nx + (vy[i] - vy[j]) * ny)
+                fx_local[t, i] += f * nx
+                fy_local[t, i] += f * ny
+                fx_local[t, j] -= f * nx
+                fy_local[t, j] -= f * ny
+        _reduce_local(fx, fy, fx_local, fy_local)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _springs(fx_local, fy_local, i_idx, j_idx, group, equilibrium,
+                 break_distance_sq, group_stiffness, group_damping,
+                 group_break_force_sq, px, py, vx, vy, fx, fy, max_force,
+                 broken):
+        """
+        Damped springs between the pairs, see `Springs.update`. Body i is
+        pulled towards body j when the spring is stretched. A spring is
+        marked in `broken` if one of its bodies is missing (index -1), it
+        is stretched beyond its break distance, or its force exceeds its
+        break force; broken springs apply no force. The break tests compare
+        squared lengths, so a square root is only taken for the springs that
+        apply a force, and for the ones whose force is clamped. The
+        stiffness, damping and squared break force are looked up in the
+        (small) tables of the spring's group.
+        """
+        n_springs = i_idx.shape[0]
+        n_threads = fx_local.shape[0]
+        chunk = (n_springs + n_threads - 1) // n_threads
+        for t in prange(n_threads):
+            for p in range(t * chunk, min(n_springs, (t + 1) * chunk)):
+                i = i_idx[p]
+                j = j_idx[p]
+                broken[p] = True
+                if i < 0 or j < 0:
+                    continue
+                dx = px[j] - px[i]
+                dy = py[j] - py[i]
+                l_sq = dx * dx + dy * dy
+                if l_sq > break_distance_sq[p]:
+                    continue
+                broken[p] = False
+                if l_sq < 1e-6:
+                    continue
+                l = math.sqrt(l_sq)
+                inv_l = 1.0 / l
+                g = group[p]
+                scale = group_stiffness[g] * (l - equilibrium[p]) * inv_l
+                f_x = scale * dx - group_damping[g] * (vx[i] - vx[j])
+                f_y = scale * dy - group_damping[g] * (vy[i] - vy[j])
+                f_mag_sq = f_x * f_x + f_y * f_y
+                if f_mag_sq > group_break_force_sq[g]:
+                    broken[p] = True
+                    continue
+                if f_mag_sq > max_force * max_force:
+                    s = max_force / math.sqrt(f_mag_sq)
+                    f_x *= s
+                    f_y *= s
+                fx_local[t, i] += f_x
+                fy_local[t, i] += f_y
+                fx_local[t, j] -= f_x
+                fy_local[t, j] -= f_y
+        _reduce_local(fx, fy, fx_local, fy_local)
+
+    def nb_gravity(i_idx, j_idx, px, py, mass, fx, fy, G, eps2=0.0):
+        _gravity(*_local_buffers(len(fx)), i_idx, j_idx, px, py, mass, fx, fy, G, eps2)
+
+    def nb_repulsion(i_idx, j_idx, px, py, radius, fx, fy,
+                     strength, factor_code, slack, beta):
+        _repulsion(*_local_buffers(len(fx)), i_idx, j_idx, px, py, radius, fx, fy,
+                   strength, factor_code, slack, beta)
+
+    def nb_collision_damping(i_idx, j_idx, px, py, vx, vy, radius, fx, fy,
+                             damping):
+        _collision_damping(*_local_buffers(len(fx)), i_idx, j_idx, px, py, vx, vy,
+                           radius, fx, fy, damping)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def nb_gravity_all_pairs(px, py, mass, fx, fy, G, eps2):
+        """
+        Direct-summation gravity between all pairs of bodies. Each body i
+        streams over all bodies j and accumulates its force in registers, so
+        the bodies are independent (no scatter) and the inner loop is a
+        branch-free sequence of multiply-adds that LLVM vectorizes with the
+        widest SIMD (e.g. AVX2 + FMA) of the host CPU.
+        """
+        n = px.shape[0]
+        for i in prange(n):
+            xi = px[i]
+            yi = py[i]
+            ax = 0.0
+            ay = 0.0
+            for j in range(n):
+                dx = px[j] - xi
+                dy = py[j] - yi
+                r2 = dx * dx + dy * dy + eps2
+                inv_r = 1.0 / math.sqrt(r2) if r2 > 0.0 else 0.0
+                s = mass[j] * inv_r * inv_r * inv_r
+                ax += s * dx
+                ay += s * dy
+            fx[i] += G * mass[i] * ax
+            fy[i] += G * mass[i] * ay
+
+    def nb_contact(i_idx, j_idx, px, py, vx, vy, radius, fx, fy,
+                   strength, factor_code, slack, beta, damping):
+        _contact(*_local_buffers(len(fx)), i_idx, j_idx, px, py, vx, vy, radius,
+                 fx, fy, strength, factor_code, slack, beta, damping)
+
+    def nb_springs(i_idx, j_idx, group, equilibrium, break_distance_sq,
+                   group_stiffness, group_damping, group_break_force_sq,
+                   px, py, vx, vy, fx, fy, max_force, broken):
+        _springs(*_local_buffers(len(fx)), i_idx, j_idx, group, equilibrium,
+                 break_distance_sq, group_stiffness, group_damping,
+                 group_break_force_sq, px, py, vx, vy, fx, fy, max_force,
+                 broken)
@@ -1,7 +1,13 @@
+import math
+import numpy as np
+from scipy.spatial import cKDTree
 from pygame.math import Vector2 as vec2
 from model.body import Body
 from typing import List, Tuple, Callable, Optional
 from model.body_list import BodyList
+from model.body_arrays import BodyArrays
+import model._force_kernels as kernels
+import utils.const as const
 
 class Node:
     """
@@ -13,6 +19,10 @@ class Node:
         The spatial center of this node.
     width : float
         The width of the region represented by this node.
+    half_width : float
+        Half the width of the region (cached, used by the spatial tests).
+    quarter_width : float
+        A quarter of the width of the region (cached, used by subdivision).
     mass : float
         The total mass of the bodies contained within this region.
     mass_center : vec2
@@ -25,6 +35,8 @@ class Node:
     def __init__(self, center : vec2, width : float):
         self.center = center
         self.width = width
+        self.half_width = width * 0.5
+        self.quarter_width = width * 0.25
         self.mass = 0.0
         self.mass_center = vec2(0, 0)
         self.body = None
@@ -46,6 +58,51 @@ class Node:
     def area(self):
         return self.width ** 2
         
+class FlatTree:
+    """
+    The Barnes-Hut quadtree flattened into parallel arrays (one entry per
+    node) so that it can be uploaded to the GPU.
+
+    Attributes:
+    -----------
+    mass_center : np.ndarray
+        (num_nodes, 2) center of mass of each node.
+    mass : np.ndarray
+        (num_nodes,) total mass of each node.
+    width : np.ndarray
+        (num_nodes,) width of the region of each node.
+    children : np.ndarray
+        (num_nodes, 4) indices of the children of each node, or -1 for leaves.
+    body : np.ndarray
+        (num_nodes,) index of the body held by a leaf, or -1.
+    """
+    def __init__(self, root: Node, bodies: BodyList):
+        index = {id(body): i for i, body in enumerate(bodies)}
+
+        nodes = [root]
+        for node in nodes:
+            nodes.extend(node.children)
+
+        n = len(nodes)
+        self.mass_center = np.zeros((n, 2), dtype=np.float64)
+        self.mass = np.zeros(n, dtype=np.float64)
+        self.width = np.zeros(n, dtype=np.float64)
+        self.children = np.full((n, 4), -1, dtype=np.int32)
+        self.body = np.full(n, -1, dtype=np.int32)
+
+        # `nodes` is in breadth-first order, so the children of each internal
+        # node are stored contiguously starting at `next_child`.
+        next_child = 1
+        for k, node in enumerate(nodes):
+            self.mass_center[k] = node.mass_center.x, node.mass_center.y
+            self.mass[k] = node.mass
+            self.width[k] = node.width
+            if node.body is not None:
+                self.body[k] = index.get(id(node.body), -1)
+            if node.children:
+                self.children[k] = range(next_child, next_child + 4)
+                next_child += 4
+
 class BarnesHut:
     """
     Barnes-Hut algorithm for efficient N-body simulation.
@@ -69,6 +126,8 @@ class BarnesHut:
         Builds the quadtree for a given set of bodies.
     compute_forces(bodies, force_model, region_center, region_width):
         Computes forces on each body in the system using the provided force model.
+    compute_gravity_forces(bodies, G, eps2):
+        Computes gravitational forces on each body without a force model callback.
     """
 
     def __init__(self, theta : float = 0.5):
@@ -81,7 +140,21 @@ class BarnesHut:
         """
         self.theta = theta
         self.root = None
-        self.overlapping_pairs : List[Tuple[Body, Body]] = []
+        self._overlapping_pairs : Optional[List[Tuple[Body, Body]]] = []
+        # the neighboring pairs as indices into `_neighbor_arrays`
+        self.neighbor_indices : Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._neighbor_arrays : Optional[BodyArrays] = None
+
+    @property
+    def overlapping_pairs(self) -> List[Tuple[Body, Body]]:
+        """
+        The neighboring pairs of bodies. When they were found from a
+        `BodyArrays` snapshot, the list is only built on first use, from
+        `neighbor_indices`.
+        """
+        if self._overlapping_pairs is None:
+            self._overlapping_pairs = self._neighbor_arrays.pairs(*self.neighbor_indices)
+        return self._overlapping_pairs
 
     def _insert_body(self, node: Node, body: Body) -> None:
         if node.body is None and node.is_leaf():
@@ -123,10 +196,12 @@ class BarnesHut:
         bool
             True if the body is within the bounds of the node's region, False otherwise.
         """
-        half_width = node.width / 2
+        hw = node.half_width
+        cx, cy = node.center.x, node.center.y
+        pos = body.pos
         return (
-            node.center.x - half_width <= body.pos.x < node.center.x + half_width and
-            node.center.y - half_width <= body.pos.y < node.center.y + half_width
+            cx - hw <= pos.x < cx + hw and
+            cy - hw <= pos.y < cy + hw
         )
 
     def _subdivide(self, node : Node) -> None:
@@ -138,8 +213,8 @@ class BarnesHut:
         node : Node
             The node to subdivide into four children.
         """
-        half_width = node.width / 2
-        quarter_width = node.width / 4
+        half_width = node.half_width
+        quarter_width = node.quarter_width
         for dx in [-quarter_width, quarter_width]:
             for dy in [-quarter_width, quarter_width]:
                 child_center = node.center + vec2(dx, dy)
@@ -209,15 +284,15 @@ class BarnesHut:
         if bodies is None or len(bodies) == 0:
             return
             
+        if region_center is None or region_width is None:
+            pos = bodies.positions()
+
         if region_center is None:
-            region_center = vec2(0, 0)
-            for body in bodies:
-                region_center += body.pos
-            region_center /= len(bodies)
+            region_center = vec2(*pos.mean(axis=0))
 
         if region_width is None:
-            max_distance = max((body.pos - region_center).length() for body in bodies)
-            region_width = 2 * max_distance
+            d2 = ((pos - region_center) ** 2).sum(axis=1)
+            region_width = 2 * math.sqrt(d2.max())
 
         self.root = Node(region_center, region_width)
         for body in bodies:
@@ -255,7 +330,9 @@ class BarnesHut:
     def clear(self):
         """Clear the quadtree."""
         self.root = None
-        self.overlapping_pairs = []
+        self._overlapping_pairs = []
+        self.neighbor_indices = None
+        self._neighbor_arrays = None
 
     def compute_forces(self,
                        bodies : BodyList,
@@ -278,6 +355,66 @@ class BarnesHut:
             force = self._calculate_force(body, self.root, force_model)
             body.force += force
 
+    def compute_gravity_forces(self,
+                               bodies: BodyList,
+                               G: float,
+                               eps2: float = 0.0) -> None:
+        """
+        Compute gravitational forces on each body using the Barnes-Hut
+        approximation.
+
+        This is a specialization of `compute_forces` for gravity: the force
+        is evaluated inline during an iterative traversal of the tree, rather
+        than through a `force_model` callback at every accepted node.
+
+        Parameters:
+        -----------
+        bodies : BodyList
+            A list of body objects.
+        G : float
+            The gravitational constant.
+        eps2 : float, optional
+            Squared softening length added to the squared distance to avoid
+            the singularity at close range (default is 0.0, no softening).
+        """
+        if self.root is None:
+            return
+
+        theta = self.theta
+        sqrt = math.sqrt
+        for body in bodies:
+            pos = body.pos
+            x, y = pos.x, pos.y
+            fx = fy = 0.0
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                if node.mass == 0:
+                    continue
+
+                children = node.children
+                if not children and node.body is body:
+                    continue
+
+                center = node.mass_center
+                dx = center.x - x
+                dy = center.y - y
+                d2 = dx * dx + dy * dy
+                if d2 == 0:
+                    continue
+
+                if not children or node.width < theta * sqrt(d2):
+                    r2 = d2 + eps2
+                    f = node.mass / (r2 * sqrt(r2))
+                    fx += f * dx
+                    fy += f * dy
+                else:
+                    stack.extend(children)
+
+            k = G * body.mass
+            body.force.x += k * fx
+            body.force.y += k * fy
+
     def _bodies_near(self, body1: Body, body2: Body, near_threshold: float) -> bool:
         delta_pos = body1.pos - body2.pos
         dist_val = delta_pos.length()
@@ -285,10 +422,10 @@ class BarnesHut:
         return dist_val < near_dist
 
     def _regions_overlap(self, body: Body, node: Node, near_threshold: float) -> bool:
-        half_width = node.width / 2
+        reach = body.radius + node.half_width + near_threshold
         dx = abs(body.pos.x - node.center.x)
         dy = abs(body.pos.y - node.center.y)
-        return dx < (body.radius + half_width + near_threshold) and dy < (body.radius + half_width + near_threshold)
+        return dx < reach and dy < reach
 
     def _check_near(self, node: Node, root: Node, checked: set, near_threshold: float) -> None:
         if root.is_leaf():
@@ -305,7 +442,8 @@ class BarnesHut:
                     self._check_near(node, child, checked, near_threshold)
 
     def compute_neighborhood_pairs(self,
-                                   neighbor_threshold = 10.0) -> None:
+                                   neighbor_threshold = 10.0,
+                                   arrays: Optional[BodyArrays] = None) -> None:
         """
         Compute all nearby pairs of bodies in the quadtree.
 
@@ -316,13 +454,76 @@ class BarnesHut:
             We compute their distance (if they overlap, they have 0 distance),
             and if the distance is less than the threshold, we consider them
             neighbors.
+        arrays : Optional[BodyArrays]
+            A snapshot of the bodies. If given, the pairs are found with a
+            k-d tree query over the snapshot instead of traversing the
+            quadtree, and are stored as index arrays in `neighbor_indices`.
+            `overlapping_pairs` is then only built if it is used.
         """
+        if arrays is not None:
+            self.neighbor_indices = BarnesHut._near_pairs(arrays, neighbor_threshold)
+            self._neighbor_arrays = arrays
+            self._overlapping_pairs = None
+            return
+
         if self.root is None:
             return
-        
+
+        if self._overlapping_pairs is None:
+            self._overlapping_pairs = []
+            self.neighbor_indices = None
+            self._neighbor_arrays = None
         checked = set()
         self._compute_neighborhood_pairs(self.root, checked, neighbor_threshold)
 
+    @staticmethod
+    def _near_pairs(arrays: BodyArrays, near_threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The pairs of bodies in `arrays` that are nearer than the sum of
+        their radii plus `near_threshold` (the condition of `_bodies_near`),
+        each once, as two arrays of indices.
+
+        The pairs are found with a k-d tree. All the pairs within twice the
+        largest radius of the typical bodies plus the threshold are queried
+        at once. The few bodies much larger than that (the product of many
+        merges) would widen this query for every body, so each of them is
+        queried on its own, with its own reach.
+        """
+        n = len(arrays)
+        if n < 2:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        x = arrays.pos_x
+        y = arrays.pos_y
+        radius = arrays.radius
+        tree = cKDTree(np.column_stack((x, y)))
+
+        large = radius > 2 * np.median(radius)
+        pairs = tree.query_pairs(2 * radius[~large].max() + near_threshold,
+                                 output_type='ndarray').astype(np.intp, copy=False)
+        i_idx = pairs[:, 0]
+        j_idx = pairs[:, 1]
+        if large.any():
+            small = ~(large[i_idx] | large[j_idx])
+            i_idx = [i_idx[small]]
+            j_idx = [j_idx[small]]
+            big = np.flatnonzero(large)
+            reach = radius[big] + radius.max() + near_threshold
+            for i, near in zip(big.tolist(), tree.query_ball_point(tree.data[big], reach)):
+                near = np.asarray(near, dtype=np.intp)
+                # a pair of two large bodies is kept from the lower index only
+                near = near[~large[near] | (near > i)]
+                i_idx.append(np.full(len(near), i, dtype=np.intp))
+                j_idx.append(near)
+            i_idx = np.concatenate(i_idx)
+            j_idx = np.concatenate(j_idx)
+
+        dx = x[j_idx] - x[i_idx]
+        dy = y[j_idx] - y[i_idx]
+        near_dist = radius[i_idx] + radius[j_idx] + near_threshold
+        near = dx * dx + dy * dy < near_dist * near_dist
+        return i_idx[near], j_idx[near]
+
     def _compute_neighborhood_pairs(self, node: Node, checked: set, near_threshold: float) -> None:
         if node.is_leaf():
             if node.body is not None:
@@ -332,23 +533,72 @@ class BarnesHut:
                 self._compute_neighborhood_pairs(child, checked, near_threshold)
 
     def compute_local_forces(self,
-                             force_model: Callable[[Body, Body], vec2]) -> None:
+                             force_model: Callable[[Body, Body], vec2],
+                             arrays: Optional[BodyArrays] = None,
+                             forces: Optional[tuple[np.ndarray, np.ndarray]] = None) -> None:
         """
         Compute local forces between relevant body pairs using a provided force model.
         
         Parameters:
         -----------
-        bodies : BodyList
-            A list of body objects.
         force_model : function
             A user-defined local force model function that calculates the force between two bodies.
             It should have the signature: force_model(body1: Body, body2: Body) -> vec2
+        arrays : Optional[BodyArrays]
+            A snapshot of the bodies. If given and the force model has a
+            batched kernel (a `batch` attribute, see `model.forces`), the
+            forces for all the overlapping pairs are computed in one batch.
+            Otherwise, if the force model has a `components` attribute, it is
+            used to accumulate the forces as plain floats.
+        forces : Optional[tuple[np.ndarray, np.ndarray]]
+            Per-body force arrays `(fx, fy)` for `arrays`. If given, the
+            batched kernel accumulates into them instead of adding the forces
+            to the bodies, so that the caller can write the forces of several
+            models back to the bodies at once with `arrays.add_forces`. The
+            other paths always add the forces to the bodies.
         """
         #if self.root is None:
         #    raise ValueError("Quadtree has not been built yet. Call build_tree() first.")
 
-        # Compute local forces for each overlapping pair in the body list
-        for body1, body2 in self.overlapping_pairs:
-            force = force_model(body1, body2)
-            body1.force += force
-            body2.force -= force  # Apply Newton's third law
\ No newline at end of file
+        batch = getattr(force_model, "batch", None)
+        if arrays is not None and batch is not None:
+            if self.neighbor_indices is not None and self._neighbor_arrays is arrays:
+                i_idx, j_idx = self.neighbor_indices
+            else:
+                i_idx, j_idx = arrays.pair_indices(self.overlapping_pairs)
+            if not len(i_idx):
+                return
+            fx, fy = arrays.zero_forces() if forces is None else forces
+            if kernels.HAS_NUMBA:
+                batch(arrays, i_idx, j_idx, fx, fy)
+            else:
+                arrays.run_minibatches(batch, i_idx, j_idx, fx, fy,
+                                       const.MINIBATCH_MIN_PAIRS,
+                                       const.MINIBATCH_WORKERS)
+            if forces is None:
+                arrays.add_forces(fx, fy)
+            return
+
+        components = getattr(force_model, "components", None)
+        if components is not None:
+            # Accumulate plain floats in place, without a vec2 per pair
+            for body1, body2 in self.overlapping_pairs:
+                fx, fy = components(body1, body2)
+                if fx or fy:
+                    f1 = body1.force
+                    f2 = body2.force
+                    f1.x += fx
+                    f1.y += fy
+                    f2.x -= fx  # Apply Newton's third law
+                    f2.y -= fy
+        else:
+            # Compute local forces for each overlapping pair in the body list
+            for body1, body2 in self.overlapping_pairs:
+                force = force_model(body1, body2)
+                body1.force += force
+                body2.force -= force  # Apply Newton's third law
+
+        # Publish any events the force model collected during the pass
+        flush_events = getattr(force_model, "flush_events", None)
+        if flush_events is not None:
+            flush_events()
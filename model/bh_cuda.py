@@ -0,0 +1,118 @@
+import math
+import numpy as np
+from model.bh import BarnesHut, FlatTree
+from model.body_list import BodyList
+
+try:
+    from numba import cuda
+except ImportError:
+    cuda = None
+
+# Maximum number of pending nodes per thread during traversal. Each level of
+# the tree pushes at most 3 extra entries, so this bounds the depth at ~40.
+STACK_SIZE = 128
+THREADS_PER_BLOCK = 256
+
+if cuda is not None:
+    @cuda.jit
+    def _gravity_kernel(mass_center, mass, width, children, leaf_body,
+                        pos, body_mass, force, G, theta):
+        i = cuda.grid(1)
+        if i >= pos.shape[0]:
+            return
+
+        stack = cuda.local.array(STACK_SIZE, dtype=np.int32)
+        stack[0] = 0
+        top = 1
+
+        x = pos[i, 0]
+        y = pos[i, 1]
+        m = body_mass[i]
+        fx = 0.0
+        fy = 0.0
+        while top > 0:
+            top -= 1
+            k = stack[top]
+            if mass[k] == 0.0:
+                continue
+
+            is_leaf = children[k, 0] < 0
+            if is_leaf and leaf_body[k] == i:
+                continue
+
+            dx = mass_center[k, 0] - x
+            dy = mass_center[k, 1] - y
+            d2 = dx * dx + dy * dy
+            if d2 == 0.0:
+                continue
+
+            d = math.sqrt(d2)
+            # Also fall back to the center of mass approximation if the stack
+            # is full, rather than silently dropping the children.
+            if is_leaf or width[k] < theta * d or top + 4 > STACK_SIZE:
+                f = G * m * mass[k] / (d2 * d)
+                fx += f * dx
+                fy += f * dy
+            else:
+                for c in range(4):
+                    stack[top] = children[k, c]
+                    top += 1
+
+        force[i, 0] = fx
+        force[i, 1] = fy
+
+def is_available() -> bool:
+    """
+    Check if a CUDA device is available for the GPU Barnes-Hut backend.
+    """
+    return cuda is not None and cuda.is_available()
+
+def compute_gravity_forces(barnes_hut: BarnesHut,
+                           bodies: BodyList,
+                           G: float) -> None:
+    """
+    Compute the gravitational forces on each body using the Barnes-Hut tree
+    in `barnes_hut`, with one GPU thread per body traversing the tree.
+
+    Falls back to `BarnesHut.compute_gravity_forces` on the CPU when no CUDA
+    device is available.
+
+    Parameters:
+    -----------
+    barnes_hut : BarnesHut
+        A Barnes-Hut instance whose tree has been built for `bodies`.
+    bodies : BodyList
+        The bodies to compute forces for.
+    G : float
+        The gravitational constant.
+    """
+    if barnes_hut.root is None or len(bodies) == 0:
+        return
+
+    if not is_available():
+        barnes_hut.compute_gravity_forces(bodies, G)
+        return
+
+    tree = FlatTree(barnes_hut.root, bodies)
+    n = len(bodies)
+    pos = bodies.positions()
+    mass = np.fromiter((body.mass for body in bodies), dtype=np.float64, count=n)
+
+    d_force = cuda.device_array((n, 2), dtype=np.float64)
+    blocks = (n + THREADS_PER_BLOCK - 1) // THREADS_PER_BLOCK
+    _gravity_kernel[blocks, THREADS_PER_BLOCK](
+        cuda.to_device(tree.mass_center),
+        cuda.to_device(tree.mass),
+        cuda.to_device(tree.width),
+        cuda.to_device(tree.children),
+        cuda.to_device(tree.body),
+        cuda.to_device(pos),
+        cuda.to_device(mass),
+        d_force,
+        G,
+        barnes_hut.theta)
+    force = d_force.copy_to_host()
+
+    for i, body in enumerate(bodies):
+        body.force.x += force[i, 0]
+        body.force.y += force[i, 1]
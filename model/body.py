@@ -1,7 +1,7 @@
 import utils.const as const
 from pygame.math import Vector2 as vec2
 import math
-from typing import Tuple
+from typing import Optional, Tuple
 from model.sim_state import SimState
 
 class Body:
@@ -94,6 +94,24 @@ class Body:
         """
         self._old_pos = self._pos - value * SimState().time_step
     
+    def add_velocity(self, dv: vec2, dt: Optional[float] = None) -> None:
+        """
+        Add `dv` to the velocity of the body. This is equivalent to
+        `body.vel += dv`, but shifts the old position in place instead of
+        computing the velocity and then setting it.
+
+        Parameters:
+        -----------
+        dv : vec2
+            The change in velocity.
+        dt : float, optional
+            The time step. If None, it is read from `SimState`.
+        """
+        if dt is None:
+            dt = SimState().time_step
+        self._old_pos.x -= dv.x * dt
+        self._old_pos.y -= dv.y * dt
+
     def reset_force(self) -> None:
         self.force = vec2(0, 0)
 
@@ -114,7 +132,23 @@ class Body:
         """
         self.force += force
 
-    def update(self) -> None:
+    def add_force_xy(self, fx: float, fy: float) -> None:
+        """
+        Accumulate a force given by its components, without allocating a
+        `vec2` for it.
+
+        Parameters:
+        -----------
+        fx : float
+            The x component of the force.
+        fy : float
+            The y component of the force.
+        """
+        force = self.force
+        force.x += fx
+        force.y += fy
+
+    def update(self, dt: Optional[float] = None) -> None:
         """
         This implements the Verlet integration method:
 
@@ -126,10 +160,17 @@ class Body:
         which means that the error in the position is proportional to the square
         of the time step, and the error in the velocity is proportional to the
         time step.
+
+        Parameters:
+        -----------
+        dt : float, optional
+            The time step. If None, it is read from `SimState`. Callers that
+            update many bodies should read it once and pass it in.
         """
         tmp_pos = self._pos.copy()
         a = self.force / self.mass
-        dt = SimState().time_step
+        if dt is None:
+            dt = SimState().time_step
 
         self._pos += self._pos - self._old_pos + a * dt ** 2
         self._old_pos = tmp_pos
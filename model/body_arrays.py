@@ -0,0 +1,199 @@
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from model.body import Body
+from model.sim_state import SimState
+
+@dataclass
+class BodyArrays:
+    """
+    A structure-of-arrays snapshot of a list of bodies (positions, velocities,
+    masses, radii), so that pairwise forces can be computed by batched kernels
+    over arrays of pair indices instead of one `Body` pair at a time.
+
+    The snapshot is taken once per time step, after the bodies have moved,
+    and the forces computed from it are written back to the bodies with
+    `add_forces`.
+
+    Attributes:
+    -----------
+    bodies : list[Body]
+        The bodies, in the same order as the arrays.
+    pos_x, pos_y : np.ndarray
+        The positions of the bodies.
+    vel_x, vel_y : np.ndarray
+        The velocities of the bodies.
+    mass : np.ndarray
+        The masses of the bodies.
+    radius : np.ndarray
+        The radii of the bodies.
+    index : dict[int, int]
+        Maps `id(body)` to the index of the body in the arrays.
+    """
+    bodies: list[Body]
+    pos_x: np.ndarray
+    pos_y: np.ndarray
+    vel_x: np.ndarray
+    vel_y: np.ndarray
+    mass: np.ndarray
+    radius: np.ndarray
+    index: dict[int, int]
+    _pairs: Optional[list] = field(default=None, repr=False)
+    _pair_indices: Optional[tuple] = field(default=None, repr=False)
+
+    @staticmethod
+    def from_bodies(bodies: Iterable[Body]) -> 'BodyArrays':
+        """
+        Take a snapshot of `bodies`.
+        """
+        bodies = list(bodies)
+        n = len(bodies)
+        pos = [body.pos for body in bodies]
+        pos_x = np.fromiter((p.x for p in pos), dtype=np.float64, count=n)
+        pos_y = np.fromiter((p.y for p in pos), dtype=np.float64, count=n)
+
+        # The velocities are (pos - old_pos) / dt, as in `Body.vel`, but the
+        # time step is 0 before the first `SimState().update` (and on a frame
+        # where two updates get the same tick), so then they are zero
+        # instead of dividing by zero
+        dt = SimState().time_step
+        if dt > 0:
+            old = [body._old_pos for body in bodies]
+            vel_x = (pos_x - np.fromiter((p.x for p in old), dtype=np.float64, count=n)) / dt
+            vel_y = (pos_y - np.fromiter((p.y for p in old), dtype=np.float64, count=n)) / dt
+        else:
+            vel_x = np.zeros(n)
+            vel_y = np.zeros(n)
+
+        return BodyArrays(
+            bodies=bodies,
+            pos_x=pos_x,
+            pos_y=pos_y,
+            vel_x=vel_x,
+            vel_y=vel_y,
+            mass=np.fromiter((body.mass for body in bodies), dtype=np.float64, count=n),
+            radius=np.fromiter((body.radius for body in bodies), dtype=np.float64, count=n),
+            index={id(body): i for i, body in enumerate(bodies)})
+
+    def __len__(self) -> int:
+        return len(self.bodies)
+
+    def pair_indices(self, pairs: list[tuple[Body, Body]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Convert a list of body pairs into two arrays of indices into the
+        snapshot. The result is cached for the last list of pairs, since
+        several force models are usually applied to the same pairs.
+        """
+        if self._pairs is not pairs or len(self._pair_indices[0]) != len(pairs):
+            n = len(pairs)
+            index = self.index
+            i_idx = np.fromiter((index[id(body1)] for body1, _ in pairs), dtype=np.intp, count=n)
+            j_idx = np.fromiter((index[id(body2)] for _, body2 in pairs), dtype=np.intp, count=n)
+            self._pairs = pairs
+            self._pair_indices = (i_idx, j_idx)
+        return self._pair_indices
+
+    def as_indices(self, neighbors) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The pairs `neighbors` as two arrays of indices into the snapshot.
+        They are either already given as index arrays, an `(i_idx, j_idx)`
+        tuple (see `BarnesHut.neighbor_indices`), or as a list of body pairs.
+        """
+        if isinstance(neighbors, tuple):
+            return neighbors
+        return self.pair_indices(neighbors)
+
+    def pairs(self, i_idx: np.ndarray, j_idx: np.ndarray) -> list[tuple[Body, Body]]:
+        """
+        Convert two arrays of indices into the snapshot into a list of body
+        pairs, the inverse of `pair_indices`. The result is cached like
+        `pair_indices`, so converting it back is free.
+        """
+        bodies = self.bodies
+        pairs = [(bodies[i], bodies[j]) for i, j in zip(i_idx.tolist(), j_idx.tolist())]
+        self._pairs = pairs
+        self._pair_indices = (i_idx, j_idx)
+        return pairs
+
+    def zero_forces(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Allocate per-body force accumulators for the batched kernels.
+        """
+        n = len(self.bodies)
+        return np.zeros(n, dtype=np.float64), np.zeros(n, dtype=np.float64)
+
+    @staticmethod
+    def accumulate_pair_forces(i_idx: np.ndarray,
+                               j_idx: np.ndarray,
+                               pfx: np.ndarray,
+                               pfy: np.ndarray,
+                               fx: np.ndarray,
+                               fy: np.ndarray) -> None:
+        """
+        Add the pair forces `pfx`, `pfy` to bodies `i_idx` and subtract them
+        from bodies `j_idx` (Newton's third law).
+
+        Both ends of the pairs are scattered with a single `np.bincount` per
+        axis, which sums repeated indices in one pass.
+        """
+        n = len(fx)
+        idx = np.concatenate((i_idx, j_idx))
+        fx += np.bincount(idx, weights=np.concatenate((pfx, -pfx)), minlength=n)
+        fy += np.bincount(idx, weights=np.concatenate((pfy, -pfy)), minlength=n)
+
+    def run_minibatches(self,
+                        batch: Callable[['BodyArrays', np.ndarray, np.ndarray, np.ndarray, np.ndarray], None],
+                        i_idx: np.ndarray,
+                        j_idx: np.ndarray,
+                        fx: np.ndarray,
+                        fy: np.ndarray,
+                        min_pairs: int,
+                        workers: int) -> None:
+        """
+        Run a batched force kernel (see `model.forces`) over the pairs, split
+        into contiguous minibatches of at least `min_pairs` pairs that run
+        on a thread pool of `workers` threads. Each minibatch accumulates
+        into its own force arrays, which are summed into `fx`, `fy` once all
+        of them are done.
+
+        This only pays off for kernels that spend their time in NumPy array
+        loops, which release the GIL. The numba kernels are already parallel
+        and must not be called from several threads at once.
+        """
+        n_batches = min(workers, len(i_idx) // max(min_pairs, 1))
+        if n_batches < 2:
+            batch(self, i_idx, j_idx, fx, fy)
+            return
+
+        def run(bounds: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+            lo, hi = bounds
+            bfx, bfy = self.zero_forces()
+            batch(self, i_idx[lo:hi], j_idx[lo:hi], bfx, bfy)
+            return bfx, bfy
+
+        edges = np.linspace(0, len(i_idx), n_batches + 1).astype(np.intp).tolist()
+        for bfx, bfy in _executor(workers).map(run, zip(edges[:-1], edges[1:])):
+            fx += bfx
+            fy += bfy
+
+    def add_forces(self, fx: np.ndarray, fy: np.ndarray) -> None:
+        """
+        Add the per-body forces `fx`, `fy` to the forces of the bodies.
+        """
+        for body, x, y in zip(self.bodies, fx.tolist(), fy.tolist()):
+            if x or y:
+                f = body.force
+                f.x += x
+                f.y += y
+
+_executors: dict[int, ThreadPoolExecutor] = {}
+
+def _executor(workers: int) -> ThreadPoolExecutor:
+    """
+    The shared thread pool with `workers` threads, made on first use.
+    """
+    executor = _executors.get(workers)
+    if executor is None:
+        executor = _executors[workers] = ThreadPoolExecutor(max_workers=workers)
+    return executor
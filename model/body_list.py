@@ -1,11 +1,15 @@
 from model.body import Body
+from model.sim_state import SimState
 import numpy as np
+from pygame.math import Vector2 as vec2
 from typing import Optional
 
 class BodyList:
     def __init__(self, max_bodies: int):
         self.bodies: np.ndarray = np.empty(max_bodies, dtype=object)
         self.count = 0
+        # ids of the bodies in the list, for O(1) membership tests
+        self._ids: set[int] = set()
 
     @staticmethod
     def from_list(bodies: list[Body], max_bodies: Optional[int] = None) -> 'BodyList':
@@ -24,23 +28,39 @@ class BodyList:
         return self.bodies[index]
     
     def __setitem__(self, index: int, value: Body) -> None:
+        old = self.bodies[index]
+        if old is not None:
+            self._ids.discard(id(old))
         self.bodies[index] = value
+        if value is not None:
+            self._ids.add(id(value))
 
     def add(self, value: Body) -> None:
         if self.count < len(self.bodies):
             self.bodies[self.count] = value
             self.count += 1
+            self._ids.add(id(value))
         else:
             raise IndexError("BodyList is full. Cannot add more bodies.")
 
     def remove(self, index) -> None:
         if 0 <= index < self.count:
+            self._ids.discard(id(self.bodies[index]))
             self.bodies[index:self.count-1] = self.bodies[index+1:self.count]
             self.bodies[self.count-1] = None
             self.count -= 1
         else:
             raise IndexError("Index out of range.")
 
+    @property
+    def ids(self) -> set[int]:
+        """
+        The ids of the bodies in the list. This is the live set that the
+        list maintains, so hot loops can test membership with
+        `id(body) in ids` without a method call per test; do not modify it.
+        """
+        return self._ids
+
     @property
     def num_bodies(self) -> int:
         return self.count
@@ -52,14 +72,48 @@ class BodyList:
     def clear(self) -> None:
         self.bodies.fill(None)
         self.count = 0
+        self._ids.clear()
+
+    def positions(self) -> np.ndarray:
+        """
+        Get the positions of the bodies as an (N, 2) array.
+        """
+        return np.fromiter(
+            (c for body in self.bodies[:self.count] for c in body.pos),
+            dtype=np.float64,
+            count=2 * self.count).reshape(self.count, 2)
+
+    def velocities(self) -> np.ndarray:
+        """
+        Get the velocities of the bodies as an (N, 2) array.
+        """
+        return np.fromiter(
+            (c for body in self.bodies[:self.count] for c in body.vel),
+            dtype=np.float64,
+            count=2 * self.count).reshape(self.count, 2)
+
+    def masses(self) -> np.ndarray:
+        """
+        Get the masses of the bodies as an (N,) array.
+        """
+        return np.fromiter(
+            (body.mass for body in self.bodies[:self.count]),
+            dtype=np.float64,
+            count=self.count)
 
     def reset_forces(self) -> None:
-        for i in range(self.count):
-            self.bodies[i].reset_force()
+        """
+        Zero the forces of all the bodies. This inlines `Body.reset_force`
+        over a plain list of the bodies, instead of indexing the object
+        array and making a method call per body.
+        """
+        for body in self.bodies[:self.count].tolist():
+            body.force = vec2()
 
     def update(self) -> None:
+        dt = SimState().time_step
         for i in range(self.count):
-            self.bodies[i].update()
+            self.bodies[i].update(dt)
 
     def __iter__(self):
         for i in range(self.count):
@@ -69,12 +123,13 @@ class BodyList:
         return self.count
     
     def __contains__(self, item: Body) -> bool:
-        return any(self.bodies[i] == item for i in range(self.count))
+        return id(item) in self._ids
     
     def index(self, item: Body) -> int:
-        for i in range(self.count):
-            if self.bodies[i] == item:
-                return i
+        if id(item) in self._ids:
+            for i in range(self.count):
+                if self.bodies[i] is item:
+                    return i
         raise ValueError(f"Body {item} not found in BodyList.")
     
     def __str__(self) -> str:
@@ -1,3 +1,4 @@
+from math import sqrt
 from utils.circle_tools import CircleTools
 
 class Circle:
@@ -5,17 +6,26 @@ class Circle:
         self.center = center
         self.radius = radius
 
+    def d2_to(self, other: "Circle") -> float:
+        """
+        Squared distance between the centers of the two circles.
+        """
+        dx = self.center.x - other.center.x
+        dy = self.center.y - other.center.y
+        return dx * dx + dy * dy
+
     def intersect(self, other: "Circle") -> bool:
-        return CircleTools.intersect(self.radius, other.radius, (self.center - other.center).length())
+        r = self.radius + other.radius
+        return self.d2_to(other) < r * r
     
     def intersection_area(self, other: "Circle") -> float:
-        return CircleTools.intersection_area(self.radius, other.radius, (self.center - other.center).length())
+        return CircleTools.intersection_area(self.radius, other.radius, sqrt(self.d2_to(other)))
     
     def chord_length(self, other: "Circle") -> float:
-        return CircleTools.chord_length(self.radius, other.radius, (self.center - other.center).length())
+        return CircleTools.chord_length(self.radius, other.radius, sqrt(self.d2_to(other)))
 
     def penetration_depth(self, other: "Circle") -> float:
-        return CircleTools.penetration_depth(self.radius, other.radius, (self.center - other.center).length())        
+        return CircleTools.penetration_depth(self.radius, other.radius, sqrt(self.d2_to(other)))
     
     def centroid(self):
         return self.center
@@ -1,10 +1,135 @@
 import math
+import numpy as np
+from dataclasses import dataclass
 from typing import Optional
 from model.body import Body
+from model.sim_state import SimState
 from model.convex_hull import ConvexHull
-from model.axis_aligned_bounding_box import AABB
+from scipy.spatial import ConvexHull as Qhull, QhullError
 from pygame.math import Vector2 as vec2
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+def _moments_numpy(px: np.ndarray, py: np.ndarray,
+                   vx: np.ndarray, vy: np.ndarray,
+                   m: np.ndarray) -> tuple:
+    """
+    Compute the moments of a set of bodies given as arrays of positions,
+    velocities, and masses.
+
+    Returns:
+    --------
+    tuple
+        (mass, cx, cy, cvx, cvy, gx, gy, I, L, E_int, r2_max): the total mass,
+        the center of mass, the center of mass velocity, the centroid, the
+        moment of inertia, angular momentum, and internal energy about the
+        center of mass, and the largest squared distance from the centroid.
+    """
+    mass = m.sum()
+    cx = (px @ m) / mass
+    cy = (py @ m) / mass
+    cvx = (vx @ m) / mass
+    cvy = (vy @ m) / mass
+    gx = px.mean()
+    gy = py.mean()
+
+    dx = px - cx
+    dy = py - cy
+    dvx = vx - cvx
+    dvy = vy - cvy
+    inertia = m @ (dx * dx + dy * dy)
+    angular_momentum = m @ (dx * vy - dy * vx)
+    internal_energy = 0.5 * (m @ (dvx * dvx + dvy * dvy))
+
+    dx = px - gx
+    dy = py - gy
+    r2_max = (dx * dx + dy * dy).max()
+    return (mass, cx, cy, cvx, cvy, gx, gy,
+            inertia, angular_momentum, internal_energy, r2_max)
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _moments_jit(px, py, vx, vy, m):
+        """
+        Compiled version of `_moments_numpy`, which makes one pass over the
+        bodies for the first-order moments and one for the second-order
+        moments, without temporary arrays.
+        """
+        n = px.shape[0]
+        mass = 0.0
+        sx = sy = svx = svy = gx = gy = 0.0
+        for i in range(n):
+            mi = m[i]
+            mass += mi
+            sx += mi * px[i]
+            sy += mi * py[i]
+            svx += mi * vx[i]
+            svy += mi * vy[i]
+            gx += px[i]
+            gy += py[i]
+        cx = sx / mass
+        cy = sy / mass
+        cvx = svx / mass
+        cvy = svy / mass
+        gx /= n
+        gy /= n
+
+        inertia = angular_momentum = internal_energy = 0.0
+        r2_max = 0.0
+        for i in range(n):
+            mi = m[i]
+            dx = px[i] - cx
+            dy = py[i] - cy
+            dvx = vx[i] - cvx
+            dvy = vy[i] - cvy
+            inertia += mi * (dx * dx + dy * dy)
+            angular_momentum += mi * (dx * vy[i] - dy * vx[i])
+            internal_energy += mi * (dvx * dvx + dvy * dvy)
+            dx = px[i] - gx
+            dy = py[i] - gy
+            r2 = dx * dx + dy * dy
+            if r2 > r2_max:
+                r2_max = r2
+        return (mass, cx, cy, cvx, cvy, gx, gy,
+                inertia, angular_momentum, 0.5 * internal_energy, r2_max)
+
+    _moments = _moments_jit
+else:
+    _moments = _moments_numpy
+
+@dataclass(slots=True)
+class CompositeStats:
+    """
+    Summary statistics of a composite body, as computed by
+    `CompositeBody.statistics`. A single instance can be reused across time
+    steps by passing it to `statistics` to be filled in place.
+    """
+    mass: float = 0.0
+    center_of_mass: vec2 = None
+    center_of_mass_velocity: vec2 = None
+    average_mass: float = 0.0
+    linear_momentum: vec2 = None
+    moment_of_inertia: float = 0.0
+    bounding_radius: float = 0.0
+    kinetic_energy: float = 0.0
+    internal_energy: float = 0.0
+    rotational_energy: float = 0.0
+    total_energy: float = 0.0
+    angular_velocity_radians: float = 0.0
+    angular_velocity_degrees: float = 0.0
+    angular_momentum: float = 0.0
+    rotation_period: Optional[float] = None  # Period in seconds for one full rotation
+    hull_area: float = 0.0
+    hull_density: Optional[float] = None
+    velocity_magnitude: float = 0.0  # Speed of the composite
+    total_momentum: float = 0.0  # Magnitude of the linear momentum
+    momentum_to_energy_ratio: Optional[float] = None
+    num_bodies: int = 0
+    temperature: Optional[float] = None  # Hypothetical, if we model temperature
+
 class CompositeBody:
     """
     A class to represent a set of bodies as a single composte body,
@@ -15,31 +140,144 @@ class CompositeBody:
     Note that this is a transient simulation object. Each time step, we
     reconstruct composite bodies from spring networks, so we do not need
     to worry about the state of the composite body between time steps.
+
+    Aggregates (total mass, center of mass, etc.) are computed together on
+    first use by `_accumulate` and cached, since many of them are derived
+    from one another. A composite that outlives a time step must call
+    `update` (or `invalidate`) after the bodies move so that the cached
+    values are recomputed.
+
+    The aggregates are NumPy reductions over a structure-of-arrays snapshot
+    of the bodies (positions, velocities, masses, colors), which is gathered
+    by `_build_soa` into buffers that are reused for as long as the composite
+    lives.
     """
     def __init__(self, bodies: list[Body]):
         self.bodies = bodies
+        self._soa = np.empty((5, 0), dtype=np.float64)
+        self._colors = np.empty((0, 3), dtype=np.float64)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """
+        Clear the cached aggregates of the composite.
+        """
+        self._px = None
+        self._py = None
+        self._vx = None
+        self._vy = None
+        self._m = None
+        self._color = None
+        self._mass = None
+        self._com = None
+        self._com_vel = None
+        self._centroid = None
+        self._inertia = None
+        self._angular_momentum = None
+        self._internal_energy = None
+        self._bounding_radius = None
+        self._average_color = None
+        self._hull_area = None
+
+    def _build_soa(self) -> None:
+        """
+        Gather the positions, velocities, masses, and colors of the bodies
+        into contiguous arrays, if not already done since the last
+        `invalidate`.
+
+        The arrays are views into buffers owned by the composite, which are
+        only reallocated (doubling in size) when the composite has grown past
+        their capacity, so a long-lived composite does not allocate new
+        arrays every time step.
+        """
+        if self._px is not None:
+            return
+
+        n = len(self.bodies)
+        if n > self._soa.shape[1]:
+            capacity = max(n, 2 * self._soa.shape[1])
+            self._soa = np.empty((5, capacity), dtype=np.float64)
+            self._colors = np.empty((capacity, 3), dtype=np.float64)
+
+        soa = self._soa
+        pos = [body.pos for body in self.bodies]
+        vel = [body.vel for body in self.bodies]
+        soa[0, :n] = [p.x for p in pos]
+        soa[1, :n] = [p.y for p in pos]
+        soa[2, :n] = [v.x for v in vel]
+        soa[3, :n] = [v.y for v in vel]
+        soa[4, :n] = [body.mass for body in self.bodies]
+        if n > 0:
+            self._colors[:n] = [body.color for body in self.bodies]
+
+        self._px, self._py, self._vx, self._vy, self._m = soa[:, :n]
+        self._color = self._colors[:n]
+
+    def _accumulate(self) -> None:
+        """
+        Compute all the aggregates of the composite at once: the first-order
+        moments (mass, center of mass, center of mass velocity, centroid,
+        average color) in one sweep, then the second-order moments about
+        the center of mass (moment of inertia, angular momentum, internal
+        energy) and the bounding radius about the centroid in another.
+
+        The moments are computed by a Numba kernel if Numba is installed,
+        and with NumPy otherwise.
+        """
+        self._build_soa()
+        self._set_moments(*_moments(self._px, self._py, self._vx, self._vy, self._m),
+                          self._m @ self._color)
+
+    def _set_moments(self, mass, cx, cy, cvx, cvy, gx, gy,
+                     inertia, angular_momentum, internal_energy, r2_max,
+                     color_moment) -> None:
+        """
+        Cache the aggregates of the composite given its moments (see
+        `_moments_numpy`) and its mass-weighted color sum.
+        """
+        mass = float(mass)
+        self._inertia = float(inertia)
+        self._angular_momentum = float(angular_momentum)
+        self._internal_energy = float(internal_energy)
+        self._bounding_radius = math.sqrt(r2_max)
+        self._average_color = tuple(float(c) / mass for c in color_moment)
+        self._com = vec2(float(cx), float(cy))
+        self._com_vel = vec2(float(cvx), float(cvy))
+        self._centroid = vec2(float(gx), float(gy))
+        self._mass = mass
+
+    def update(self) -> None:
+        """
+        Update the composite after a time step. The bodies have moved, so the
+        cached aggregates are stale.
+        """
+        self.invalidate()
 
     def center_of_mass(self) -> vec2:
         """
         Calculate the center of mass of the composite. This is the mass-weighted
         average of the positions of the bodies in the composite.
         """
-        return sum((body.pos * body.mass for body in self.bodies),
-                   vec2(0, 0)) / self.total_mass()
+        if self._mass is None:
+            self._accumulate()
+        return vec2(self._com)
     
     def centroid(self):
         """
         Calculate the centroid of the composite, the average position of the
         bodies in the composite.
         """
-        return sum((body.pos for body in self.bodies),
-                   vec2(0, 0)) / len(self.bodies)
+        if self._mass is None:
+            self._accumulate()
+        return vec2(self._centroid)
     
     def total_mass(self) -> float:
         """
         Calculate the total mass of the composite.
         """
-        return sum(body.mass for body in self.bodies)
+        if self._mass is None:
+            self._accumulate()
+        return self._mass
     
     def hull_density(self) -> float:
         """
@@ -51,9 +289,9 @@ class CompositeBody:
         """
         Calculate the bounding radius of the composite.
         """
-        c = self.centroid()
-        r = max((body.pos - c).length_squared() for body in self.bodies)
-        return math.sqrt(r)
+        if self._mass is None:
+            self._accumulate()
+        return self._bounding_radius
     
     def average_mass(self) -> float:
         """
@@ -61,24 +299,51 @@ class CompositeBody:
         """
         return self.total_mass() / len(self.bodies)    
    
-    def bounding_box(self) -> AABB:
-        """
-        Calculate the bounding box of the composite.
+    def bounding_box(self) -> tuple[vec2, vec2]:
         """
-        return AABB(self.bodies)
+        Calculate the bounding box of the positions of the bodies in the
+        composite.
+
+        Returns:
+        --------
+        tuple[vec2, vec2]
+            The minimum and maximum points of the bounding box.
+        """
+        self._build_soa()
+        return (vec2(float(self._px.min()), float(self._py.min())),
+                vec2(float(self._px.max()), float(self._py.max())))
     
     def hull_area(self) -> float:
         """
         Calculate the area of the convex hull of the composite.
         """
-        return self.convex_hull().area
+        if self._hull_area is None:
+            self._hull_area = self._hull_area_fast()
+        return self._hull_area
+
+    def _hull_area_fast(self) -> float:
+        """
+        Calculate the area of the convex hull directly with Qhull from the
+        SoA positions, without building a `ConvexHull`. Degenerate composites
+        (fewer than three bodies, or all collinear) have zero area.
+        """
+        if len(self.bodies) < 3:
+            return 0.0
+
+        self._build_soa()
+        try:
+            return float(Qhull(np.column_stack((self._px, self._py))).volume)
+        except QhullError:
+            return 0.0
 
     def add_velocity(self, value: vec2) -> None:
         """
         Add velocity to the composite.
         """
+        dt = SimState().time_step
         for body in self.bodies:
-            body.vel += value
+            body.add_velocity(value, dt)
+        self.invalidate()
    
     def kinetic_energy(self) -> float:
         """
@@ -90,28 +355,30 @@ class CompositeBody:
     def rotational_energy(self) -> float:
         """
         Calculate the rotational energy of the composite.
+
+        This is half the sum of `m * r x (v - cv)` over the bodies, with `r`
+        relative to the center of mass. Since the mass-weighted sum of `r`
+        is zero, the `cv` term vanishes and this is half the angular
+        momentum.
         """
-        cv = self.center_of_mass_velocity()
-        p = self.center_of_mass()
-        E = 0
-        for body in self.bodies:
-            E += body.mass * (body.pos - p).cross(body.vel - cv)
-        return 0.5 * E
+        return 0.5 * self.angular_momentum()
     
     def center_of_mass_velocity(self) -> vec2:
         """
         Calculate the center of mass velocity of the composite.
         """
-        return sum((body.vel * body.mass for body in self.bodies),
-                   vec2(0,0)) / self.total_mass()
+        if self._mass is None:
+            self._accumulate()
+        return vec2(self._com_vel)
     
     def angular_momentum(self) -> float:
         """
         Calculate the angular momentum of the composite around its center of
         mass.
         """
-        pivot = self.center_of_mass()
-        return sum(body.mass * (body.pos - pivot).cross(body.vel) for body in self.bodies)
+        if self._mass is None:
+            self._accumulate()
+        return self._angular_momentum
     
     def angular_velocity(self) -> float:
         """
@@ -125,8 +392,9 @@ class CompositeBody:
         Calculate the moment of inertia of the composite around its center of
         mass.
         """
-        pivot = self.center_of_mass()
-        return sum(body.mass * (body.pos - pivot).length_squared() for body in self.bodies)
+        if self._mass is None:
+            self._accumulate()
+        return self._inertia
     
     def linear_momentum(self) -> vec2:
         """
@@ -138,11 +406,9 @@ class CompositeBody:
         """
         Calculate the internal energy of the composite
         """
-        cv = self.center_of_mass_velocity()
-        E = 0
-        for body in self.bodies:
-            E += body.mass * (body.vel - cv).length_squared()
-        return 0.5 * E
+        if self._mass is None:
+            self._accumulate()
+        return self._internal_energy
     
     def add_internal_energy(self, energy: float) -> None:
         """
@@ -160,18 +426,34 @@ class CompositeBody:
 
         """
         cv = self.center_of_mass_velocity()
+        cvx, cvy = cv.x, cv.y
+        dt = SimState().time_step
         for body in self.bodies:
-            body.vel += (body.vel - cv).normalize() * math.sqrt(2 * energy / body.mass)
-
+            v = body.vel
+            dvx = v.x - cvx
+            dvy = v.y - cvy
+            speed = math.sqrt(dvx * dvx + dvy * dvy)
+            if speed > 0:
+                s = math.sqrt(2 * energy / body.mass) / speed
+                body.add_velocity(vec2(dvx * s, dvy * s), dt)
+        self.invalidate()
 
     def add_anglular_velocity(self, omega: float) -> None:
         """
         Add angular velocity to the composite.
         """
         cm = self.center_of_mass()
+        cx, cy = cm.x, cm.y
+        dt = SimState().time_step
         for body in self.bodies:
-            dp = body.pos - cm
-            body.vel += vec2(-dp.y, dp.x).normalize() * omega
+            p = body.pos
+            dx = p.x - cx
+            dy = p.y - cy
+            r = math.sqrt(dx * dx + dy * dy)
+            if r > 0:
+                s = omega / r
+                body.add_velocity(vec2(-dy * s, dx * s), dt)
+        self.invalidate()
 
     def add_anglular_velocity2(self, omega: float) -> None:
         """
@@ -183,9 +465,18 @@ class CompositeBody:
         """
         Add rotational energy to the composite.
         """
+        cm = self.center_of_mass()
+        cx, cy = cm.x, cm.y
+        dt = SimState().time_step
         for body in self.bodies:
-            dp = body.pos - self.center_of_mass()
-            body.vel += vec2(-dp.y, dp.x).normalize() * math.sqrt(2 * energy / body.mass)
+            p = body.pos
+            dx = p.x - cx
+            dy = p.y - cy
+            r = math.sqrt(dx * dx + dy * dy)
+            if r > 0:
+                s = math.sqrt(2 * energy / body.mass) / r
+                body.add_velocity(vec2(-dy * s, dx * s), dt)
+        self.invalidate()
 
     def add_force(self, force: vec2) -> None:
         """
@@ -195,19 +486,39 @@ class CompositeBody:
         just `force`, so we don't just add `force` to each body.
         """
         total_mass = self.total_mass()
+        ax = force.x / total_mass
+        ay = force.y / total_mass
         for body in self.bodies:
-            body.add_force(force * body.mass / total_mass)
+            f = body.force
+            m = body.mass
+            f.x += ax * m
+            f.y += ay * m
 
     def add_torque(self, torque: float) -> None:
         """
         Add a torque to the composite. Note that torque is a property
         of the composite, not of any individual body, so we must distribute
         linear forces to each body to create the torque.
-        """
+
+        We distribute it as if the composite were rigid: the angular
+        acceleration is `alpha = torque / I`, and each body gets the force
+        `m * alpha * perp(r)` that gives it that angular acceleration, where
+        `r` is its position relative to the center of mass. These forces sum
+        to `torque` about the center of mass and to zero net force.
+        """
+        inertia = self.moment_of_inertia()
+        if inertia == 0:
+            return
+
+        alpha = torque / inertia
+        cm = self.center_of_mass()
+        cx, cy = cm.x, cm.y
         for body in self.bodies:
-            dp = body.pos - self.center_of_mass()
-            body.add_force(vec2(-dp.y, dp.x).normalize() * torque / dp.length())
-            
+            p = body.pos
+            s = body.mass * alpha
+            body.force.x -= (p.y - cy) * s
+            body.force.y += (p.x - cx) * s
+
     def convex_hull(self):
         """
         Calculate the convex hull of the composite.
@@ -218,18 +529,9 @@ class CompositeBody:
         """
         Calculate the average color of the composite.
         """
-
-        # color is a Tuple[int, int, int]
-        color = [0, 0, 0]
-        for body in self.bodies:
-            for i in range(3):
-                color[i] += body.color[i] * body.mass
-
-        total_mass = self.total_mass()
-        for i in range(3):
-            color[i] /= total_mass
-
-        return tuple(color)
+        if self._mass is None:
+            self._accumulate()
+        return self._average_color
     
     def __iter__(self):
         return iter(self.bodies)
@@ -242,9 +544,10 @@ class CompositeBody:
     
     def __setitem__(self, index, value):
         self.bodies[index] = value
+        self.invalidate()
 
     def __str__(self):
-        return f"CompositeBody(center_of_mass={self.center_of_mass()}, mass={self.total_mass():.3}, area={self.area():.3})"
+        return f"CompositeBody(center_of_mass={self.center_of_mass()}, mass={self.total_mass():.3}, area={self.hull_area():.3})"
     
     def __repr__(self):
         return f"CompositeBody({self.bodies})"
@@ -259,13 +562,15 @@ class CompositeBody:
         """
         Subtract two composite bodies.
         """
-        return CompositeBody([body for body in self.bodies if body not in other.bodies])
+        other_ids = {id(body) for body in other.bodies}
+        return CompositeBody([body for body in self.bodies if id(body) not in other_ids])
     
     def __eq__(self, other):
         """
-        Check if two composite bodies are equal.
+        Check if two composite bodies are equal, i.e., consist of the same
+        bodies (by identity).
         """
-        return set(self.bodies) == set(other.bodies)
+        return {id(body) for body in self.bodies} == {id(body) for body in other.bodies}
     
     def __contains__(self, body):
         """
@@ -274,46 +579,120 @@ class CompositeBody:
         return body in self.bodies
     
     def __hash__(self):
-        return hash(tuple(self.bodies))
+        return hash(frozenset(id(body) for body in self.bodies))
     
     def __bool__(self):
         return self.bodies != []
 
-    def statistics(self):
-        stats = {
-            "mass": self.total_mass(),
-            "center_of_mass": {
-                "position": self.center_of_mass(),
-                "velocity": self.center_of_mass_velocity(),
-            },
-            "mass_properties": {
-                "average_mass": self.average_mass(),
-                "linear_momentum": self.linear_momentum(),
-                "moment_of_inertia": self.moment_of_inertia(),
-                "bounding_radius": self.bounding_radius(),
-            },
-            "energy": {
-                "kinetic_energy": self.kinetic_energy(),
-                "internal_energy": self.internal_energy(),
-                "rotational_energy": self.rotational_energy(),
-                "total_energy": self.kinetic_energy() + self.internal_energy() + self.rotational_energy(),  # Sum of energies
-            },
-            "angular_motion": {
-                "angular_velocity_radians": self.angular_velocity(),
-                "angular_velocity_degrees": math.degrees(self.angular_velocity()),
-                "angular_momentum": self.angular_momentum(),
-                "rotation_period": 2 * math.pi / self.angular_velocity() if self.angular_velocity() != 0 else None,  # Period in seconds for one full rotation
-            },
-            "hull_properties": {
-                "hull_area": self.hull_area(),
-                "hull_density": self.hull_density(),
-            },
-            # Additional statistics
-            "velocity_magnitude": math.sqrt(sum(v**2 for v in self.center_of_mass_velocity())),  # Speed of the composite
-            "total_momentum": math.sqrt(sum(m**2 for m in self.linear_momentum())),  # Total magnitude of linear momentum
-            "momentum_to_energy_ratio": (math.sqrt(sum(m**2 for m in self.linear_momentum())) / 
-                                        self.kinetic_energy()) if self.kinetic_energy() != 0 else None,  # New stat for ratio of momentum to energy
-            "num_bodies": len(self.bodies),
-            "temperature": self.temperature() if hasattr(self, 'temperature') else None,  # Hypothetical, if you model temperature
-        }
+    def statistics(self, out: Optional[CompositeStats] = None) -> CompositeStats:
+        """
+        Compute summary statistics of the composite.
+
+        Parameters:
+        -----------
+        out : Optional[CompositeStats]
+            If given, the statistics are written into `out` instead of a new
+            instance, e.g., to reuse one instance across time steps.
+
+        Returns:
+        --------
+        CompositeStats
+            The statistics of the composite (`out`, if given).
+        """
+        stats = out if out is not None else CompositeStats()
+        mass = self.total_mass()
+        cv = self.center_of_mass_velocity()
+        lm = self.linear_momentum()
+        ke = self.kinetic_energy()
+        ie = self.internal_energy()
+        re = self.rotational_energy()
+        av = self.angular_velocity()
+        hull_area = self.hull_area()
+        momentum = lm.length()
+
+        stats.mass = mass
+        stats.center_of_mass = self.center_of_mass()
+        stats.center_of_mass_velocity = cv
+        stats.average_mass = mass / len(self.bodies)
+        stats.linear_momentum = lm
+        stats.moment_of_inertia = self.moment_of_inertia()
+        stats.bounding_radius = self.bounding_radius()
+        stats.kinetic_energy = ke
+        stats.internal_energy = ie
+        stats.rotational_energy = re
+        stats.total_energy = ke + ie + re
+        stats.angular_velocity_radians = av
+        stats.angular_velocity_degrees = math.degrees(av)
+        stats.angular_momentum = self.angular_momentum()
+        stats.rotation_period = 2 * math.pi / av if av != 0 else None
+        stats.hull_area = hull_area
+        stats.hull_density = mass / hull_area if hull_area != 0 else None
+        stats.velocity_magnitude = cv.length()
+        stats.total_momentum = momentum
+        stats.momentum_to_energy_ratio = momentum / ke if ke != 0 else None
+        stats.num_bodies = len(self.bodies)
+        stats.temperature = self.temperature() if hasattr(self, 'temperature') else None
         return stats
+
+def compute_all_stats(composites: list[CompositeBody]) -> list[CompositeStats]:
+    """
+    Compute the statistics of many composites at once.
+
+    Rather than reducing over each composite separately, the bodies of all
+    the composites (whose aggregates are not already cached) are
+    concatenated into one set of arrays, and the moments of every composite
+    are computed together with segmented reductions (`np.add.reduceat`). The
+    moments are then cached on each composite, as if by `_accumulate`.
+
+    Parameters:
+    -----------
+    composites : list[CompositeBody]
+        The composites to compute statistics for.
+
+    Returns:
+    --------
+    list[CompositeStats]
+        The statistics of each composite, in the same order.
+    """
+    pending = [comp for comp in composites if comp._mass is None and len(comp) > 0]
+    if pending:
+        for comp in pending:
+            comp._build_soa()
+
+        counts = np.array([len(comp) for comp in pending])
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        segment = np.repeat(np.arange(len(pending)), counts)
+        px = np.concatenate([comp._px for comp in pending])
+        py = np.concatenate([comp._py for comp in pending])
+        vx = np.concatenate([comp._vx for comp in pending])
+        vy = np.concatenate([comp._vy for comp in pending])
+        m = np.concatenate([comp._m for comp in pending])
+        color = np.concatenate([comp._color for comp in pending])
+
+        mass = np.add.reduceat(m, starts)
+        cx = np.add.reduceat(m * px, starts) / mass
+        cy = np.add.reduceat(m * py, starts) / mass
+        cvx = np.add.reduceat(m * vx, starts) / mass
+        cvy = np.add.reduceat(m * vy, starts) / mass
+        gx = np.add.reduceat(px, starts) / counts
+        gy = np.add.reduceat(py, starts) / counts
+        color_moment = np.add.reduceat(m[:, None] * color, starts)
+
+        dx = px - cx[segment]
+        dy = py - cy[segment]
+        dvx = vx - cvx[segment]
+        dvy = vy - cvy[segment]
+        inertia = np.add.reduceat(m * (dx * dx + dy * dy), starts)
+        angular_momentum = np.add.reduceat(m * (dx * vy - dy * vx), starts)
+        internal_energy = 0.5 * np.add.reduceat(m * (dvx * dvx + dvy * dvy), starts)
+
+        dx = px - gx[segment]
+        dy = py - gy[segment]
+        r2_max = np.maximum.reduceat(dx * dx + dy * dy, starts)
+
+        for k, comp in enumerate(pending):
+            comp._set_moments(mass[k], cx[k], cy[k], cvx[k], cvy[k], gx[k], gy[k],
+                              inertia[k], angular_momentum[k], internal_energy[k],
+                              r2_max[k], color_moment[k])
+
+    return [comp.statistics() for comp in composites]
@@ -1,5 +1,9 @@
-from typing import Callable
+from typing import Callable, Optional
+import numpy as np
 from model.body import Body
+from model.body_arrays import BodyArrays
+
+batch_condition = Callable[[BodyArrays, np.ndarray, np.ndarray], np.ndarray]
 
 class Condition:
     """
@@ -12,17 +16,49 @@ class Condition:
     This class enables intuitive composition of conditions, making it easier to
     build complex conditions from simpler ones, applicable to various contexts
     like merging bodies, creating springs, etc.
+
+    Composed conditions are kept as a flat expression tree (chains of & or |
+    are merged into a single node) and compiled into a single function, so
+    evaluating `a & b & c` calls the leaf functions directly, with
+    short-circuiting, instead of going through a nested lambda per operator.
+
+    A condition may also have a `batch` version, which evaluates it for many
+    pairs at once: it takes a `BodyArrays` snapshot and two arrays of pair
+    indices into it, and returns a boolean array. Composed conditions have a
+    `batch` version if all of their operands do, and `batch` is None
+    otherwise.
     """
 
-    def __init__(self, func: Callable[[Body, Body], bool]) -> None:
+    LEAF = "leaf"
+    AND = "and"
+    OR = "or"
+    NOT = "not"
+
+    def __init__(self,
+                 func: Optional[Callable[[Body, Body], bool]],
+                 kind: str = LEAF,
+                 children: Optional[list['Condition']] = None,
+                 batch: Optional[batch_condition] = None) -> None:
         """
         Initializes the Condition object with a given function.
 
         Args:
             func (Callable[[Body, Body], bool]): A function that takes two `Body`
             instances and returns a boolean indicating if the condition is met.
+            kind (str): The kind of node, one of `LEAF`, `AND`, `OR`, or `NOT`.
+            Composite nodes are created by the operators, not directly.
+            children (list[Condition]): The operands of a composite node.
+            batch (Callable[[BodyArrays, np.ndarray, np.ndarray], np.ndarray]):
+            The batch version of `func` (leaves only).
         """
-        self.func: Callable[[Body, Body], bool] = func
+        self.kind: str = kind
+        self.children: list[Condition] = children if children is not None else []
+        if kind == Condition.LEAF:
+            self.func: Callable[[Body, Body], bool] = func
+            self.batch: Optional[batch_condition] = batch
+        else:
+            self.func = self._compile()
+            self.batch = self._compile_batch()
 
     def __call__(self, body1: Body, body2: Body) -> bool:
         """
@@ -37,6 +73,61 @@ class Condition:
         """
         return self.func(body1, body2)
 
+    def _operands(self, kind: str) -> list['Condition']:
+        """
+        Returns the operands of this condition as seen by a `kind` node, so
+        that nested nodes of the same kind are flattened into their parent.
+        """
+        return self.children if self.kind == kind else [self]
+
+    def _source(self, leaves: dict) -> str:
+        """
+        Returns a Python expression in `b1` and `b2` for this condition, adding
+        the leaf functions it refers to into `leaves`.
+        """
+        if self.kind == Condition.LEAF:
+            name = f"f{len(leaves)}"
+            leaves[name] = self.func
+            return f"{name}(b1, b2)"
+        if self.kind == Condition.NOT:
+            return f"(not {self.children[0]._source(leaves)})"
+        op = f" {self.kind} "
+        return "(" + op.join(child._source(leaves) for child in self.children) + ")"
+
+    def _compile(self) -> Callable[[Body, Body], bool]:
+        """
+        Compiles the expression tree of this condition into a single function.
+        """
+        leaves = {}
+        src = f"def condition(b1, b2):\n    return {self._source(leaves)}\n"
+        exec(src, leaves)
+        return leaves["condition"]
+
+    def _compile_batch(self) -> Optional[batch_condition]:
+        """
+        Combines the batch versions of the operands of this condition with
+        element-wise logical operators, or returns None if an operand has no
+        batch version.
+        """
+        batches = [child.batch for child in self.children]
+        if any(batch is None for batch in batches):
+            return None
+        if self.kind == Condition.NOT:
+            return lambda arrays, i_idx, j_idx: ~batches[0](arrays, i_idx, j_idx)
+        op = np.logical_and if self.kind == Condition.AND else np.logical_or
+        def condition_batch(arrays: BodyArrays,
+                            i_idx: np.ndarray,
+                            j_idx: np.ndarray) -> np.ndarray:
+            result = batches[0](arrays, i_idx, j_idx)
+            for batch in batches[1:]:
+                result = op(result, batch(arrays, i_idx, j_idx))
+            return result
+        return condition_batch
+
+    @staticmethod
+    def _wrap(other) -> 'Condition':
+        return other if isinstance(other, Condition) else Condition(other)
+
     def __and__(self, other: 'Condition') -> 'Condition':
         """
         Returns a new Condition that is the logical AND of this condition and another.
@@ -47,7 +138,9 @@ class Condition:
         Returns:
             Condition: A new Condition representing the logical AND of both conditions.
         """
-        return Condition(lambda b1, b2: self(b1, b2) and other(b1, b2))
+        other = Condition._wrap(other)
+        return Condition(None, Condition.AND,
+                         self._operands(Condition.AND) + other._operands(Condition.AND))
 
     def __or__(self, other: 'Condition') -> 'Condition':
         """
@@ -59,7 +152,9 @@ class Condition:
         Returns:
             Condition: A new Condition representing the logical OR of both conditions.
         """
-        return Condition(lambda b1, b2: self(b1, b2) or other(b1, b2))
+        other = Condition._wrap(other)
+        return Condition(None, Condition.OR,
+                         self._operands(Condition.OR) + other._operands(Condition.OR))
 
     def __invert__(self) -> 'Condition':
         """
@@ -68,4 +163,6 @@ class Condition:
         Returns:
             Condition: A new Condition representing the logical NOT of this condition.
         """
-        return Condition(lambda b1, b2: not self(b1, b2))
+        if self.kind == Condition.NOT:
+            return self.children[0]
+        return Condition(None, Condition.NOT, [self])
@@ -1,18 +1,81 @@
 from pygame.math import Vector2 as vec2
-from utils.utils import cross
 from model.circle import Circle
+from scipy.spatial import ConvexHull as Qhull, QhullError
+import numpy as np
 import math
 
 class ConvexHull:
+    """
+    The convex hull of a set of points. The vertices are stored as an (H, 2)
+    array in counter-clockwise order, and are converted to `vec2` only when
+    accessed individually (indexing, iteration, `convex_hull`).
+    """
     def __init__(self, points: list[vec2]):
         """
         A class to represent a convex hull of a list of bodies.
+
+        Parameters:
+        -----------
+        points : list[vec2]
+            The points to compute the hull of. An (n, 2) array also works.
+        """
+        self._set_vertices(*ConvexHull._qhull(points))
+
+    @classmethod
+    def _from_vertices(cls, vertices: np.ndarray, area: float) -> 'ConvexHull':
+        """
+        Create a convex hull directly from its vertices (in counter-clockwise
+        order) and area, without recomputing the hull.
+        """
+        hull = cls.__new__(cls)
+        hull._set_vertices(vertices, area)
+        return hull
+
+    def _set_vertices(self, vertices: np.ndarray, area: float) -> None:
+        """
+        Replace the vertices and area of the hull, and clear the cached
+        arrays derived from the vertices.
+        """
+        self._pts = vertices
+        self._area = area
+        self._edge_dirs = None
+
+    @property
+    def convex_hull(self) -> list[vec2]:
+        """
+        The vertices of the hull, in counter-clockwise order.
+        """
+        return [vec2(*p) for p in self._pts]
+
+    def _edges(self) -> tuple[np.ndarray, np.ndarray]:
         """
-        self.convex_hull = ConvexHull.compute_convex_hull(points)
+        The start point and direction of each edge of the hull, built on
+        first use.
+        """
+        H = self._pts
+        if self._edge_dirs is None:
+            self._edge_dirs = np.roll(H, -1, axis=0) - H
+        return H, self._edge_dirs
+
+    def _cross_terms(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The vertices of the hull, the vertices shifted by one (the other
+        endpoint of each edge), and the cross product of each pair, which
+        are the terms of the shoelace formula.
+        """
+        H = self._pts
+        H1 = np.roll(H, -1, axis=0)
+        cross = H[:, 0] * H1[:, 1] - H1[:, 0] * H[:, 1]
+        return H, H1, cross
 
     def __contains__(self, point: vec2) -> bool:
         """
-        Determine if a point is inside the convex hull.
+        Determine if a point is inside the convex hull (or on its boundary).
+
+        Since the vertices are in counter-clockwise order, a point is inside
+        if and only if it is not to the right of any edge. A hull of fewer
+        than three points contains only its vertices, not the points on the
+        segment between them.
 
         Parameters:
         -----------
@@ -24,67 +87,201 @@ class ConvexHull:
         is_inside : bool
             True if the point is inside the convex hull
         """
+        if len(self._pts) < 3:
+            return bool(((self._pts[:, 0] == point[0]) & (self._pts[:, 1] == point[1])).any())
 
-        # Check if the point is on the hull
-        if point in self.convex_hull:
-            return True
+        e0, d = self._edges()
+        px = point[0] - e0[:, 0]
+        py = point[1] - e0[:, 1]
+        return bool((d[:, 0] * py - d[:, 1] * px >= 0).all())
 
-        # Check if the point is inside the hull
-        for i in range(len(self.convex_hull)):
-            p1 = self.convex_hull[i]
-            p2 = self.convex_hull[(i + 1) % len(self.convex_hull)]
-            if cross(p1, p2, point) > 0:
-                return False
+    def contains_batch(self, points: np.ndarray) -> np.ndarray:
+        """
+        Determine which of a batch of points are inside the convex hull (or
+        on its boundary). As with `in`, a hull of fewer than three points
+        contains only its vertices.
+
+        Parameters:
+        -----------
+        points : np.ndarray
+            (n, 2) array of points to check.
+
+        Returns:
+        --------
+        np.ndarray
+            (n,) boolean mask, True for the points inside the convex hull.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(self._pts) < 3:
+            return (points[:, None, :] == self._pts[None, :, :]).all(axis=2).any(axis=1)
 
-        return True
+        e0, d = self._edges()
+        px = points[:, 0, None] - e0[None, :, 0]
+        py = points[:, 1, None] - e0[None, :, 1]
+        return (d[None, :, 0] * py - d[None, :, 1] * px >= 0).all(axis=1)
+
+    @staticmethod
+    def _qhull(points: list[vec2]) -> tuple[np.ndarray, float]:
+        """
+        Calculate the convex hull of a list of points with Qhull.
+
+        Returns:
+        --------
+        tuple[np.ndarray, float]
+            The (H, 2) vertices of the hull in counter-clockwise order and
+            the area of the hull. Degenerate inputs (at most two distinct
+            points, or all collinear) have zero area, and their vertices
+            come from `monotone_chain`.
+        """
+        pts = ConvexHull._unique(ConvexHull._discard_interior(ConvexHull._as_array(points)))
+        if len(pts) <= 2:
+            return pts, 0.0
+
+        try:
+            hull = Qhull(pts)
+        except QhullError:
+            chain = ConvexHull.monotone_chain([vec2(*p) for p in pts])
+            return np.array([(p.x, p.y) for p in chain], dtype=np.float64), 0.0
+
+        return pts[hull.vertices], hull.volume
+
+    @staticmethod
+    def _as_array(points: list[vec2]) -> np.ndarray:
+        """
+        The points as an (n, 2) float64 array, read in one pass.
+        """
+        if isinstance(points, np.ndarray):
+            return points.astype(np.float64, copy=False).reshape(-1, 2)
+        return np.fromiter((c for p in points for c in p),
+                           dtype=np.float64).reshape(-1, 2)
+
+    @staticmethod
+    def _unique(pts: np.ndarray) -> np.ndarray:
+        """
+        The distinct points, sorted by x and then y: after a lexicographic
+        sort, a point is a duplicate if it equals the one before it.
+
+        Parameters:
+        -----------
+        pts : np.ndarray
+            (n, 2) array of points.
+
+        Returns:
+        --------
+        np.ndarray
+            The distinct points.
+        """
+        if len(pts) < 2:
+            return pts
+        pts = pts[np.lexsort((pts[:, 1], pts[:, 0]))]
+        keep = np.empty(len(pts), dtype=bool)
+        keep[0] = True
+        np.any(pts[1:] != pts[:-1], axis=1, out=keep[1:])
+        return pts[keep]
+
+    @staticmethod
+    def _discard_interior(pts: np.ndarray) -> np.ndarray:
+        """
+        Akl-Toussaint heuristic: discard the points that lie strictly inside
+        the quadrilateral spanned by the extreme points in x and y, since they
+        cannot be on the hull. For uniformly or normally distributed points
+        this removes most of the input.
+
+        Parameters:
+        -----------
+        pts : np.ndarray
+            (n, 2) array of points. Duplicates are fine: they are either
+            discarded with the rest of the interior or kept as they are.
+
+        Returns:
+        --------
+        np.ndarray
+            The points that may be on the hull.
+        """
+        if len(pts) < 8:
+            return pts
+
+        x = pts[:, 0]
+        y = pts[:, 1]
+        # Counter-clockwise: leftmost, bottom, rightmost, top.
+        quad = pts[[x.argmin(), y.argmin(), x.argmax(), y.argmax()]]
+        inside = np.ones(len(pts), dtype=bool)
+        for a, b in zip(quad, np.roll(quad, -1, axis=0)):
+            inside &= (b[0] - a[0]) * (y - a[1]) - (b[1] - a[1]) * (x - a[0]) > 0
+        return pts[~inside]
 
     @staticmethod
     def compute_convex_hull(points: list[vec2]) -> list[vec2]:
         """
-        Calculate the convex hull of a list of points.
+        Calculate the convex hull of a list of points, in counter-clockwise
+        order.
+        """
+        return [vec2(*p) for p in ConvexHull._qhull(points)[0]]
+
+    @staticmethod
+    def monotone_chain(points: list[vec2]) -> list[vec2]:
+        """
+        Calculate the convex hull of a list of points with Andrew's monotone
+        chain algorithm. This also handles degenerate inputs, which Qhull
+        rejects.
         """
         points = sorted(points, key=lambda p: (p.x, p.y))
         if len(points) <= 1:
             return points
 
-        # Lower hull
-        lower = []
-        for p in points:
-            while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
-                lower.pop()
-            lower.append(p)
-
-        # Upper hull
-        upper = []
-        for p in reversed(points):
-            while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
-                upper.pop()
-            upper.append(p)
+        lower = ConvexHull._half_hull(points)
+        upper = ConvexHull._half_hull(reversed(points))
 
         # Remove the last point of each half because it's repeated at the beginning of the other half
         return lower[:-1] + upper[:-1]
+
+    @staticmethod
+    def _half_hull(points) -> list[vec2]:
+        """
+        One pass of the monotone chain over sorted points: keep only the
+        points where the chain turns counter-clockwise. The cross product is
+        inlined since this is the inner loop.
+        """
+        hull = []
+        push = hull.append
+        pop = hull.pop
+        for p in points:
+            px, py = p.x, p.y
+            while len(hull) >= 2:
+                a = hull[-2]
+                b = hull[-1]
+                ax, ay = a.x, a.y
+                if (b.x - ax) * (py - ay) - (b.y - ay) * (px - ax) > 0:
+                    break
+                pop()
+            push(p)
+        return hull
         
     @property
     def area(self) -> float:
         """
         Calculate the area of the convex hull.
         """
-        area: float = 0
-        for i in range(len(self.convex_hull)):
-            p1 = self.convex_hull[i]
-            p2 = self.convex_hull[(i + 1) % len(self.convex_hull)]
-            area += p1.cross(p2) / 2
-
-        return abs(area)    
+        if self._area is None:
+            self._area = 0.5 * abs(float(self._cross_terms()[2].sum()))
+        return self._area
 
     @area.setter
     def area(self, value: float) -> None:
         """
-        Adjust the area of the convex hull by scaling it.
+        Adjust the area of the convex hull by scaling it about its centroid.
+
+        Raises:
+        -------
+        ValueError
+            If the hull is degenerate (fewer than three points, or all
+            collinear), since it has no area to scale.
         """
-        current_area = self.area
-        scale = math.sqrt(value / current_area)
-        self *= scale
+        if self.area == 0:
+            raise ValueError("cannot set the area of a degenerate convex hull")
+        scale = math.sqrt(value / self.area)
+        c = np.array(self.centroid)
+        self._set_vertices(c + (self._pts - c) * scale, value)
     
     def perimeter(self) -> float:
         """
@@ -95,32 +292,26 @@ class ConvexHull:
         float
             The perimeter of the convex hull.
         """
-        perimeter: float = 0
-        for i in range(len(self.convex_hull)):
-            p1 = self.convex_hull[i]
-            p2 = self.convex_hull[(i + 1) % len(self.convex_hull)]
-            perimeter += (p1 - p2).length()
-
-        return perimeter
+        H = self._pts
+        d = np.roll(H, -1, axis=0) - H
+        return float(np.hypot(d[:, 0], d[:, 1]).sum())
     
     @property
     def centroid(self) -> vec2:
         """
-        Calculate the centroid of the convex hull.
+        Calculate the centroid of the convex hull. For a degenerate hull
+        (zero area), this is the average of its vertices.
 
         Returns:
         --------
         vec2
             The centroid of the convex hull.
         """
-        centroid = vec2(0, 0)
-        for i in range(len(self.convex_hull)):
-            p1 = self.convex_hull[i]
-            p2 = self.convex_hull[(i + 1) % len(self.convex_hull)]
-            cross_product = p1.cross(p2)
-            centroid += (p1 + p2) * cross_product
-
-        return centroid / (6 * self.area)
+        H, H1, cross = self._cross_terms()
+        area = self.area
+        if area == 0:
+            return vec2(*H.mean(axis=0))
+        return vec2(*(((H + H1) * cross[:, None]).sum(axis=0) / (6 * area)))
     
     @centroid.setter
     def centroid(self, value: vec2) -> None:
@@ -132,9 +323,8 @@ class ConvexHull:
         value : vec2
             The new centroid of the convex hull.
         """
-        current_centroid = self.centroid
-        translation = value - current_centroid
-        self += translation
+        translation = value - self.centroid
+        self._set_vertices(self._pts + (translation.x, translation.y), self._area)
 
     def bounding_radius(self) -> float:
         """
@@ -145,7 +335,9 @@ class ConvexHull:
         float
             The bounding radius of the convex hull.
         """
-        return max((point - self.centroid).length() for point in self.convex_hull)
+        H = self._pts
+        c = self.centroid
+        return float(np.hypot(H[:, 0] - c.x, H[:, 1] - c.y).max())
     
     def bounding_circle(self) -> Circle:
         """
@@ -167,32 +359,28 @@ class ConvexHull:
         tuple[vec2, vec2]
             The minimum and maximum points of the bounding box.
         """
-        min_x = min(self.convex_hull, key=lambda p: p.x).x
-        max_x = max(self.convex_hull, key=lambda p: p.x).x
-        min_y = min(self.convex_hull, key=lambda p: p.y).y
-        max_y = max(self.convex_hull, key=lambda p: p.y).y
-        return vec2(min_x, min_y), vec2(max_x, max_y)
+        return vec2(*self._pts.min(axis=0)), vec2(*self._pts.max(axis=0))
     
     def __iter__(self):
-        return iter(self.convex_hull)
+        return (vec2(*p) for p in self._pts)
     
     def __len__(self):
-        return len(self.convex_hull)
+        return len(self._pts)
     
     def __getitem__(self, index: int) -> vec2:
-        return self.convex_hull[index]
+        return vec2(*self._pts[index])
     
     def __str__(self) -> str:
-        return f"ConvexHull(num_points={len(self.convex_hull)})"
+        return f"ConvexHull(num_points={len(self._pts)})"
     
     def __repr__(self) -> str:
         return f"ConvexHull({self.convex_hull})"
     
     def __eq__(self, other) -> bool:
-        return self.convex_hull == other.convex_hull
+        return np.array_equal(self._pts, other._pts)
     
     def __ne__(self, other) -> bool:
-        return self.convex_hull != other.convex_hull
+        return not self == other
     
     def __lt__(self, other) -> bool:
         return self.area < other.area
@@ -208,7 +396,8 @@ class ConvexHull:
     
     def __add__(self, other) -> 'ConvexHull':
         """
-        Combine two convex hulls.
+        Combine two convex hulls. The hull of the union only depends on the
+        vertices of both hulls, not on all the original points.
 
         Parameters:
         -----------
@@ -220,7 +409,7 @@ class ConvexHull:
         ConvexHull
             The combined convex hull.
         """
-        return ConvexHull(self.convex_hull + other.convex_hull)
+        return ConvexHull(np.concatenate((self._pts, other._pts)))
     
     def __sub__(self, other) -> 'ConvexHull':
         """
@@ -236,11 +425,14 @@ class ConvexHull:
         ConvexHull
             The convex hull resulting from the subtraction.
         """
-        return ConvexHull([point for point in self.convex_hull if point not in other.convex_hull])
+        shared = (self._pts[:, None, :] == other._pts[None, :, :]).all(axis=2).any(axis=1)
+        return ConvexHull(self._pts[~shared])
     
     def __mul__(self, scalar: float) -> 'ConvexHull':
         """
-        Scale the convex hull by a scalar.
+        Scale the convex hull by a scalar. A nonzero scale maps the hull
+        onto the hull of the scaled points, so the vertices are scaled
+        directly rather than recomputing the hull.
 
         Parameters:
         -----------
@@ -252,4 +444,6 @@ class ConvexHull:
         ConvexHull
             The scaled convex hull.
         """
-        return ConvexHull([point * scalar for point in self.convex_hull])
+        if scalar == 0:
+            return ConvexHull(self._pts * scalar)
+        return ConvexHull._from_vertices(self._pts * scalar, self.area * scalar * scalar)
@@ -1,14 +1,199 @@
 from model.body import Body
+import math
 from pygame.math import Vector2 as vec2
 from utils.circle_tools import CircleTools
 import utils.const as const
 from typing import Callable
 from events.event_bus import EventBus
 from model.sim_state import SimState
+from model.body_arrays import BodyArrays
+import model._force_kernels as kernels
+import numpy as np
+
+# Force components
+# ----------------
+# Each generated force function also has a `components` attribute that takes
+# the same two bodies and returns the force as a plain `(fx, fy)` tuple of
+# floats, without allocating a `vec2`. The force function itself just wraps
+# the components in a `vec2`.
+#
+# Batched force kernels
+# ---------------------
+# Each generated force function also has a `batch` attribute, a kernel with
+# the signature
+#
+#     batch(arrays: BodyArrays, i_idx: np.ndarray, j_idx: np.ndarray,
+#           fx: np.ndarray, fy: np.ndarray) -> None
+#
+# that computes the same force for every pair (i_idx[k], j_idx[k]) of bodies
+# in `arrays` at once, and accumulates it into the per-body force arrays
+# `fx`, `fy` (added to body i and, by Newton's third law, subtracted from
+# body j). Gravity also has an `all_pairs(arrays, fx, fy, eps2)` kernel
+# that sums the force over all pairs of bodies directly. When numba is
+# available, the kernels for gravity, repulsion, collision damping and contact
+# run compiled versions from `model._force_kernels`.
+
+_ZERO = (0.0, 0.0)
+
+# Default for the `trace_events` parameter of the force generators. Tracing
+# publishes interaction events, which costs an allocation per interaction.
+TRACE = False
+
+# Record of an "lj_like_force" event. The event data is a structured array
+# of these records, one per interaction.
+LJ_EVENT_DTYPE = np.dtype([("body1", object),
+                           ("body2", object),
+                           ("distance", np.float64),
+                           ("fx", np.float64),
+                           ("fy", np.float64)])
+
+# Specialized force components
+# ----------------------------
+# The components of the repulsion and contact forces are generated from
+# source with the parameters of the force written in as literals, so that
+# they are constants in the bytecode instead of closure cells, integer
+# powers are unrolled into multiplications, and branches that the
+# parameters rule out (e.g., damping when `damping == 0`) are left out. The
+# generated functions are cached by their parameters.
+
+_SPECIALIZED: dict[tuple, Callable] = {}
+
+def _literal(value: float) -> str:
+    """
+    The source of a float literal for `value`.
+    """
+    value = float(value)
+    return repr(value) if math.isfinite(value) else f"float({str(value)!r})"
+
+def _pow_source(base: str, exponent: float) -> str:
+    """
+    The source of `base ** exponent`, unrolled into multiplications for
+    small positive integer exponents.
+    """
+    if float(exponent).is_integer() and 1 <= exponent <= 4:
+        return " * ".join([base] * int(exponent))
+    return f"{base} ** {_literal(exponent)}"
+
+def _specialize(key: tuple, name: str, body: str, factor: Callable) -> Callable:
+    """
+    Compile the function `name(body1, body2)` with the given body, or return
+    the one compiled before for the same `key`.
+    """
+    func = _SPECIALIZED.get(key)
+    if func is None:
+        src = f"def {name}(body1, body2):\n{body}"
+        namespace = {"sqrt": math.sqrt, "factor": factor, "_ZERO": _ZERO}
+        exec(compile(src, f"<{name}>", "exec"), namespace)
+        func = _SPECIALIZED[key] = namespace[name]
+    return func
+
+def _repulsion_components(factor: Callable[[float, float, float], float],
+                          strength: float,
+                          slack: float,
+                          beta: float) -> Callable[[Body, Body], tuple[float, float]]:
+    """
+    The components of the repulsion force, specialized for the given
+    parameters. See `generate_repulsion_force`.
+    """
+    body = f"""\
+    p1 = body1.pos
+    p2 = body2.pos
+    dx = p1.x - p2.x
+    dy = p1.y - p2.y
+    dist_sq = dx * dx + dy * dy
+    r1 = body1.radius
+    r2 = body2.radius
+    min_dist = r1 + r2 + {_literal(slack)}
+    if dist_sq > min_dist * min_dist:
+        return _ZERO
+    dist = sqrt(dist_sq)
+    g = factor(r1, r2, dist)
+    f = {_literal(strength)} * ({_pow_source("g", beta)})
+    # f times the unit vector along the displacement
+    f /= dist
+    return f * dx, f * dy
+"""
+    return _specialize(("repulsion", factor, strength, slack, beta),
+                       "repulsion_force_components", body, factor)
+
+def _contact_components(factor: Callable[[float, float, float], float],
+                        strength: float,
+                        slack: float,
+                        beta: float,
+                        damping: float) -> Callable[[Body, Body], tuple[float, float]]:
+    """
+    The components of the contact force, specialized for the given
+    parameters. See `generate_contact_force`.
+    """
+    damping_src = "" if damping == 0 else f"""\
+    # damping of the relative velocity along the normal, when in contact
+    if dist <= radii:
+        v1 = body1.vel
+        v2 = body2.vel
+        f -= {_literal(damping)} * ((v1.x - v2.x) * nx + (v1.y - v2.y) * ny)
+"""
+    body = f"""\
+    p1 = body1.pos
+    p2 = body2.pos
+    dx = p1.x - p2.x
+    dy = p1.y - p2.y
+    dist_sq = dx * dx + dy * dy
+    r1 = body1.radius
+    r2 = body2.radius
+    radii = r1 + r2
+    min_dist = radii + {_literal(slack)}
+    if dist_sq > min_dist * min_dist:
+        return _ZERO
+    dist = sqrt(dist_sq)
+    inv_dist = 1.0 / dist
+    nx = dx * inv_dist
+    ny = dy * inv_dist
+    # repulsion, along the normal from body2 to body1
+    g = factor(r1, r2, dist)
+    f = {_literal(strength)} * ({_pow_source("g", beta)})
+{damping_src}    return f * nx, f * ny
+"""
+    return _specialize(("contact", factor, strength, slack, beta, damping),
+                       "contact_force_components", body, factor)
+
+def _factor_code(factor: Callable[[float, float, float], float]):
+    """
+    The code of the compiled version of a repulsion factor in
+    `model._force_kernels`, or None if it has no compiled version.
+    """
+    return {
+        CircleTools.intersection_area: kernels.FACTOR_INTERSECTION_AREA,
+        CircleTools.chord_length: kernels.FACTOR_CHORD_LENGTH,
+        CircleTools.penetration_depth: kernels.FACTOR_PENETRATION_DEPTH
+    }.get(factor)
+
+def _batch_factor(factor: Callable[[float, float, float], float]) -> Callable:
+    """
+    The vectorized version of a repulsion factor: one of the batch functions
+    of `CircleTools`, or `np.vectorize(factor)` for any other factor.
+    """
+    return {
+        CircleTools.intersection_area: CircleTools.intersection_area_batch,
+        CircleTools.chord_length: CircleTools.chord_length_batch,
+        CircleTools.penetration_depth: CircleTools.penetration_depth_batch
+    }.get(factor) or np.vectorize(factor, otypes=[np.float64])
+
+def _pair_displacements(arrays: BodyArrays,
+                        i_idx: np.ndarray,
+                        j_idx: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The displacements `pos[i] - pos[j]` of the pairs and their squared
+    lengths. The kernels compare the squared lengths against their cutoff
+    and only take the square root of the pairs within it.
+    """
+    dx = arrays.pos_x[i_idx] - arrays.pos_x[j_idx]
+    dy = arrays.pos_y[i_idx] - arrays.pos_y[j_idx]
+    return dx, dy, dx * dx + dy * dy
 
 def generate_collision_damping_force(
         event_bus: EventBus,
-        damping: float = const.REPULSION_DAMPING) -> Callable[[Body, Body], vec2]:
+        damping: float = const.REPULSION_DAMPING,
+        trace_events: bool = TRACE) -> Callable[[Body, Body], vec2]:
     """
     Generate a functino that calculates a collision damping force between two
     bodies.
@@ -17,6 +202,10 @@ def generate_collision_damping_force(
     -----------
     damping : float
         The damping coefficient.
+    trace_events : bool
+        If True, publish a "collision_damping" event, with the energy lost,
+        for each collision. Off by default, since computing the energy loss
+        needs the time step of the simulation on every call.
 
     Returns:
     --------
@@ -36,39 +225,75 @@ def generate_collision_damping_force(
         vec2
             The collision damping force between the two bodies.
     """
-    def collision_damping_force(body1: Body, body2: Body) -> vec2:
-        displacement = body2.pos - body1.pos
-        distance = displacement.length()
-        penetration = (body1.radius + body2.radius) - distance
-
-        if penetration < 0:
-            return vec2(0, 0)
-
-        collision_normal = displacement.normalize()
+    def collision_damping_force_components(body1: Body, body2: Body) -> tuple[float, float]:
+        p1 = body1.pos
+        p2 = body2.pos
+        dx = p2.x - p1.x
+        dy = p2.y - p1.y
+        dist_sq = dx * dx + dy * dy
+        radii = body1.radius + body2.radius
+
+        if dist_sq > radii * radii:
+            return _ZERO
+
+        distance = math.sqrt(dist_sq)
+
+        inv_distance = 1.0 / distance
+        nx = dx * inv_distance
+        ny = dy * inv_distance
         rel_vel = body1.vel - body2.vel
-        vel_along_normal = (rel_vel.x * collision_normal.x +
-                            rel_vel.y * collision_normal.y)
-        F_damp = collision_normal * (-damping * vel_along_normal)
-
-        # work = F_damp * d
-        # d is the distance over which the F_damp is applied
-        # solution steps:
-        # 1) d = v * t
-        # 2) v = a * t
-        # 3) a = F_damp / m
-        # -> d = (F_damp / m) * t^2
-        d = (F_damp.length() / body1.mass) * SimState().time_step ** 2
-        W = F_damp.length() * d
-
-        #event_bus.publish("collision_damping", {
-        #    "body1": body1,
-        #    "body2": body2,
-        #    "penetration": penetration,
-        #    "damping_force": F_damp,
-        #    "energy_loss": W
-        #})
-        return F_damp
-    
+        f = -damping * (rel_vel.x * nx + rel_vel.y * ny)
+
+        if trace_events:
+            # work = F_damp * d
+            # d is the distance over which the F_damp is applied
+            # solution steps:
+            # 1) d = v * t
+            # 2) v = a * t
+            # 3) a = F_damp / m
+            # -> d = (F_damp / m) * t^2
+            d = (abs(f) / body1.mass) * SimState().time_step ** 2
+            W = abs(f) * d
+
+            event_bus.publish("collision_damping", {
+                "body1": body1,
+                "body2": body2,
+                "penetration": radii - distance,
+                "damping_force": vec2(f * nx, f * ny),
+                "energy_loss": W
+            })
+        return f * nx, f * ny
+
+    def collision_damping_force(body1: Body, body2: Body) -> vec2:
+        return vec2(collision_damping_force_components(body1, body2))
+
+    def collision_damping_force_batch(arrays: BodyArrays,
+                                      i_idx: np.ndarray,
+                                      j_idx: np.ndarray,
+                                      fx: np.ndarray,
+                                      fy: np.ndarray) -> None:
+        if kernels.HAS_NUMBA:
+            kernels.nb_collision_damping(i_idx, j_idx, arrays.pos_x, arrays.pos_y,
+                                         arrays.vel_x, arrays.vel_y, arrays.radius,
+                                         fx, fy, float(damping))
+            return
+
+        dx, dy, dist_sq = _pair_displacements(arrays, i_idx, j_idx)
+        radii = arrays.radius[i_idx] + arrays.radius[j_idx]
+        sel = np.flatnonzero((dist_sq <= radii * radii) & (dist_sq > 0))
+        i, j = i_idx[sel], j_idx[sel]
+
+        # The normal points from body i to body j, i.e. along -d.
+        inv_dist = 1.0 / np.sqrt(dist_sq[sel])
+        nx = -dx[sel] * inv_dist
+        ny = -dy[sel] * inv_dist
+        vel_along_normal = ((arrays.vel_x[i] - arrays.vel_x[j]) * nx +
+                            (arrays.vel_y[i] - arrays.vel_y[j]) * ny)
+        f = -damping * vel_along_normal
+        BodyArrays.accumulate_pair_forces(i, j, f * nx, f * ny, fx, fy)
+
+    collision_damping_force.components = collision_damping_force_components
+    collision_damping_force.batch = collision_damping_force_batch
     return collision_damping_force
 
 def generate_repulsion_force(
@@ -115,35 +340,158 @@ def generate_repulsion_force(
         
     """
     
+    repulsion_force_components = _repulsion_components(factor, strength, slack, beta)
+
     def repulsion_force(body1: Body, body2: Body) -> vec2:
-        delta_pos = body1.pos - body2.pos
-        dist = delta_pos.length()
-        min_dist = body1.radius + body2.radius + slack
+        return vec2(repulsion_force_components(body1, body2))
+
+    batch_factor = _batch_factor(factor)
+    factor_code = _factor_code(factor)
+
+    def repulsion_force_batch(arrays: BodyArrays,
+                              i_idx: np.ndarray,
+                              j_idx: np.ndarray,
+                              fx: np.ndarray,
+                              fy: np.ndarray) -> None:
+        if kernels.HAS_NUMBA and factor_code is not None:
+            kernels.nb_repulsion(i_idx, j_idx, arrays.pos_x, arrays.pos_y,
+                                 arrays.radius, fx, fy, float(strength),
+                                 factor_code, float(slack), float(beta))
+            return
+
+        dx, dy, dist_sq = _pair_displacements(arrays, i_idx, j_idx)
+        r1 = arrays.radius[i_idx]
+        r2 = arrays.radius[j_idx]
+        min_dist = r1 + r2 + slack
+        sel = np.flatnonzero((dist_sq <= min_dist * min_dist) & (dist_sq > 0))
+        if len(sel) == 0:
+            return
+
+        d = np.sqrt(dist_sq[sel])
+        g = batch_factor(r1[sel], r2[sel], d)
+        f = strength * g ** beta / d
+        BodyArrays.accumulate_pair_forces(i_idx[sel], j_idx[sel],
+                                          f * dx[sel], f * dy[sel], fx, fy)
+
+    repulsion_force.components = repulsion_force_components
+    repulsion_force.batch = repulsion_force_batch
+    return repulsion_force
 
-        if dist > min_dist:
-            return vec2(0, 0)
 
-        g = factor(body1.radius, body2.radius, dist)
-        f = strength * g ** beta
+def generate_contact_force(
+        event_bus: EventBus,
+        strength: float = const.REPULSION_STRENGTH,
+        factor: Callable[[float, float, float], float] = CircleTools.intersection_area,
+        slack: float = 1e-3,
+        beta: float = 1.5,
+        damping: float = const.REPULSION_DAMPING) -> Callable[[Body, Body], vec2]:
+    """
+    Generate a function that calculates the sum of the repulsion force (see
+    `generate_repulsion_force`) and the collision damping force (see
+    `generate_collision_damping_force`) between two bodies.
 
-        # event_bus.publish("repulsion", {
-        #     "body1": body1,
-        #     "body2": body2,
-        #     "distance": dist,
-        #     "repulsion_force": f
-        # })
+    Both forces act along the line between the centers of the bodies, so
+    the fused function computes the displacement, distance and unit normal
+    once per pair for both, and applying it is a single pass over the pairs
+    instead of two.
 
-        return f * delta_pos.normalize()
-    
-    return repulsion_force
+    Parameters:
+    -----------
+    strength : float
+        The strength of the repulsion force.
+    factor : Callable[[float, float, float], float]
+        A function that calculates the factor for the repulsion force, see
+        `generate_repulsion_force`.
+    slack : float
+        The repulsion force applies up to this distance beyond contact.
+    beta : float
+        The power to which the factor is raised.
+    damping : float
+        The damping coefficient of the collision damping force.
 
+    Returns:
+    --------
+    Callable[[Body, Body], vec2]
+        A function that calculates the contact force between two bodies.
+
+        Parameters:
+        -----------
+        body1 : Body
+            The first body.
+        body2 : Body
+            The second body.
+
+        Returns:
+        --------
+        vec2
+            The contact force between the two bodies.
+    """
+    contact_force_components = _contact_components(factor, strength, slack, beta, damping)
+
+    def contact_force(body1: Body, body2: Body) -> vec2:
+        return vec2(contact_force_components(body1, body2))
+
+    batch_factor = _batch_factor(factor)
+    factor_code = _factor_code(factor)
+
+    def contact_force_batch(arrays: BodyArrays,
+                            i_idx: np.ndarray,
+                            j_idx: np.ndarray,
+                            fx: np.ndarray,
+                            fy: np.ndarray) -> None:
+        if kernels.HAS_NUMBA and factor_code is not None:
+            kernels.nb_contact(i_idx, j_idx, arrays.pos_x, arrays.pos_y,
+                               arrays.vel_x, arrays.vel_y, arrays.radius, fx, fy,
+                               float(strength), factor_code, float(slack),
+                               float(beta), float(damping))
+            return
+
+        dx, dy, dist_sq = _pair_displacements(arrays, i_idx, j_idx)
+        r1 = arrays.radius[i_idx]
+        r2 = arrays.radius[j_idx]
+        min_dist = r1 + r2 + slack
+        sel = np.flatnonzero((dist_sq <= min_dist * min_dist) & (dist_sq > 0))
+        if len(sel) == 0:
+            return
+
+        i, j = i_idx[sel], j_idx[sel]
+        r1 = r1[sel]
+        r2 = r2[sel]
+        d = np.sqrt(dist_sq[sel])
+        nx = dx[sel] / d
+        ny = dy[sel] / d
+        f = strength * batch_factor(r1, r2, d) ** beta
+        vel_along_normal = ((arrays.vel_x[i] - arrays.vel_x[j]) * nx +
+                            (arrays.vel_y[i] - arrays.vel_y[j]) * ny)
+        f -= np.where(d <= r1 + r2, damping * vel_along_normal, 0.0)
+        BodyArrays.accumulate_pair_forces(i, j, f * nx, f * ny, fx, fy)
+
+    contact_force.components = contact_force_components
+    contact_force.batch = contact_force_batch
+    return contact_force
+
+def _int_pow(u, n: int):
+    """
+    `u ** n` for a positive integer `n` by repeated squaring, which avoids a
+    call to `pow`. Works for floats and arrays alike.
+    """
+    result = None
+    while n:
+        if n & 1:
+            result = u if result is None else result * u
+        n >>= 1
+        if n:
+            u = u * u
+    return result
 
 def generate_leonard_jones_like_force(
         event_bus: EventBus,
         cutoff_distance: float = 10.0,
         equilibrium_distance: float = 1.0,
         epsilon: float = 4.0,
-        alpha: float = 6.0) -> Callable[[Body, Body], vec2]:
+        alpha: float = 6.0,
+        trace_events: bool = TRACE,
+        event_capacity: int = 4096) -> Callable[[Body, Body], vec2]:
     """
     Generate a function that calculates a Leonard-Jones-like force between two bodies.
 
@@ -154,7 +502,16 @@ def generate_leonard_jones_like_force(
     equilibrium_distance : float
         The distance at which the force is at equilibrium.
     alpha : float
-        The alpha parameter in the Leonard-Jones force.
+        The alpha parameter in the Leonard-Jones force. For a positive
+        integer alpha (e.g. the default 6), the powers are computed by
+        repeated multiplication instead of `pow`.
+    trace_events : bool
+        If True, publish "lj_like_force" events. The interactions are
+        collected into a preallocated buffer of `LJ_EVENT_DTYPE` records,
+        which is published as one event (a structured array) at the end of
+        each pass over the pairs (see `flush_events`), or when it is full.
+    event_capacity : int
+        The number of records in the event buffer.
 
     Returns:
     --------
@@ -172,41 +529,106 @@ def generate_leonard_jones_like_force(
         --------
         vec2
             The Leonard-Jones-like force between the two bodies
-    """    
-    def lj_like_force(body1: Body, body2: Body) -> vec2:
-        delta_pos = body1.pos - body2.pos
-        dist = delta_pos.length()
+    """
+    if alpha == int(alpha) and alpha > 0:
+        n = int(alpha)
+        def u_pows(u):
+            u_a = _int_pow(u, n)
+            return u_a * u_a, u_a
+    else:
+        def u_pows(u):
+            return u ** (2*alpha), u ** alpha
+
+    events = (event_bus.batch_channel("lj_like_force", event_capacity, LJ_EVENT_DTYPE)
+              if trace_events else None)
+
+    def lj_like_force_components(body1: Body, body2: Body) -> tuple[float, float]:
+        p1 = body1.pos
+        p2 = body2.pos
+        dx = p1.x - p2.x
+        dy = p1.y - p2.y
+        dist_sq = dx * dx + dy * dy
         min_dist = body1.radius + body2.radius + cutoff_distance
 
-        if dist > min_dist:
-            return vec2(0, 0)
-        
-        r_e = body1.radius + body2.radius + equilibrium_distance
-        f_mag = (alpha * epsilon / dist * ( (r_e / dist) ** (2*alpha) -
-                                            (r_e / dist) ** alpha))
-        f = f_mag * delta_pos.normalize()
-        
-        event_bus.publish("lj_like_force", {
-            "body1": body1,
-            "body2": body2,
-            "distance": dist,
-            "force": f
-        })
-        return f
-    
+        if dist_sq > min_dist * min_dist:
+            return _ZERO
+
+        dist = math.sqrt(dist_sq)
+
+        inv_dist = 1.0 / dist
+        u = (body1.radius + body2.radius + equilibrium_distance) * inv_dist
+        u_2a, u_a = u_pows(u)
+        f_mag = alpha * epsilon * inv_dist * (u_2a - u_a)
+        fx = f_mag * dx * inv_dist
+        fy = f_mag * dy * inv_dist
+
+        if trace_events:
+            events.append(body1, body2, dist, fx, fy)
+        return fx, fy
+
+    def lj_like_force(body1: Body, body2: Body) -> vec2:
+        return vec2(lj_like_force_components(body1, body2))
+
+    def lj_like_force_batch(arrays: BodyArrays,
+                            i_idx: np.ndarray,
+                            j_idx: np.ndarray,
+                            fx: np.ndarray,
+                            fy: np.ndarray) -> None:
+        dx, dy, dist_sq = _pair_displacements(arrays, i_idx, j_idx)
+        radii = arrays.radius[i_idx] + arrays.radius[j_idx]
+        min_dist = radii + cutoff_distance
+        sel = np.flatnonzero((dist_sq <= min_dist * min_dist) & (dist_sq > 0))
+        if len(sel) == 0:
+            return
+
+        d = np.sqrt(dist_sq[sel])
+        u = (radii[sel] + equilibrium_distance) / d
+        u_2a, u_a = u_pows(u)
+        f = alpha * epsilon / d * (u_2a - u_a) / d
+        pfx = f * dx[sel]
+        pfy = f * dy[sel]
+        i, j = i_idx[sel], j_idx[sel]
+        BodyArrays.accumulate_pair_forces(i, j, pfx, pfy, fx, fy)
+
+        if trace_events:
+            # the whole batch is a single event
+            events.flush()
+            records = np.empty(len(sel), dtype=LJ_EVENT_DTYPE)
+            records["body1"] = [arrays.bodies[k] for k in i.tolist()]
+            records["body2"] = [arrays.bodies[k] for k in j.tolist()]
+            records["distance"] = d
+            records["fx"] = pfx
+            records["fy"] = pfy
+            event_bus.publish("lj_like_force", records)
+
+    def flush_events() -> None:
+        if trace_events:
+            events.flush()
+
+    lj_like_force.components = lj_like_force_components
+    lj_like_force.batch = lj_like_force_batch
+    lj_like_force.flush_events = flush_events
     return lj_like_force
 
 
 def generate_gravitational_force(
         event_bus: EventBus,
-        G: float = const.SIM_GRAVITY) -> Callable[[Body, Body], vec2]:
+        G: float = const.SIM_GRAVITY,
+        eps2: float = 0.0) -> Callable[[Body, Body], vec2]:
     """
     Calculate the gravitational force between two bodies.
 
+    The force is computed as `G * m1 * m2 * inv_r**3 * d`, with
+    `inv_r = 1 / sqrt(r**2 + eps2)`: a single square root and no division
+    by the distance or normalization of the displacement.
+
     Parameters:
     -----------
     G : float
         The gravitational constant.
+    eps2 : float, optional
+        Squared softening length added to the squared distance to avoid
+        the singularity at close range (default is 0.0, no softening).
 
     Returns:
     --------
@@ -225,14 +647,62 @@ def generate_gravitational_force(
         vec2
             The gravitational force between the two bodies
     """
+    sqrt = math.sqrt
+
+    def gravitational_force_components(body1: Body, body2: Body) -> tuple[float, float]:
+        p1 = body1.pos
+        p2 = body2.pos
+        dx = p2.x - p1.x
+        dy = p2.y - p1.y
+        inv_r = 1.0 / sqrt(dx * dx + dy * dy + eps2)
+        k = G * body1.mass * body2.mass * inv_r * inv_r * inv_r
+        return k * dx, k * dy
+
     def gravitational_force(body1: Body, body2: Body) -> vec2:
-        delta_pos = body2.pos - body1.pos
-        dist_sq = delta_pos.length_squared()
-        #dist = math.sqrt(dist_sq)
-        force_mag = G * body1.mass * body2.mass / dist_sq
-        force = force_mag * delta_pos.normalize()
-        return force
-    
+        return vec2(gravitational_force_components(body1, body2))
+
+    def gravitational_force_batch(arrays: BodyArrays,
+                                  i_idx: np.ndarray,
+                                  j_idx: np.ndarray,
+                                  fx: np.ndarray,
+                                  fy: np.ndarray) -> None:
+        if kernels.HAS_NUMBA:
+            kernels.nb_gravity(i_idx, j_idx, arrays.pos_x, arrays.pos_y,
+                               arrays.mass, fx, fy, float(G), float(eps2))
+            return
+
+        # Displacement from body i to body j: gravity pulls i towards j.
+        dx = arrays.pos_x[j_idx] - arrays.pos_x[i_idx]
+        dy = arrays.pos_y[j_idx] - arrays.pos_y[i_idx]
+        r2 = dx * dx + dy * dy + eps2
+        inv_r = 1.0 / np.sqrt(r2)
+        f = G * arrays.mass[i_idx] * arrays.mass[j_idx] * inv_r * inv_r * inv_r
+        BodyArrays.accumulate_pair_forces(i_idx, j_idx, f * dx, f * dy, fx, fy)
+
+    def gravitational_force_all_pairs(arrays: BodyArrays,
+                                      fx: np.ndarray,
+                                      fy: np.ndarray,
+                                      eps2: float = eps2) -> None:
+        # Direct summation over all pairs of bodies, for when the number of
+        # bodies is small enough that Barnes-Hut does not pay off.
+        if kernels.HAS_NUMBA:
+            kernels.nb_gravity_all_pairs(arrays.pos_x, arrays.pos_y, arrays.mass,
+                                         fx, fy, float(G), float(eps2))
+            return
+
+        dx = arrays.pos_x[None, :] - arrays.pos_x[:, None]
+        dy = arrays.pos_y[None, :] - arrays.pos_y[:, None]
+        d2 = dx * dx + dy * dy
+        r2 = d2 + eps2
+        # skip each body itself and any other body at the same position
+        r2[d2 == 0.0] = np.inf
+        s = arrays.mass[None, :] / (r2 * np.sqrt(r2))
+        fx += G * arrays.mass * (s * dx).sum(axis=1)
+        fy += G * arrays.mass * (s * dy).sum(axis=1)
+
+    gravitational_force.components = gravitational_force_components
+    gravitational_force.batch = gravitational_force_batch
+    gravitational_force.all_pairs = gravitational_force_all_pairs
     return gravitational_force
 
 
@@ -1,9 +1,22 @@
+import math
+import numpy as np
 import utils.const as const
 from model.body import Body
+from model.body_arrays import BodyArrays
 from typing import Callable
 from utils.circle_tools import CircleTools
 from model.condition import Condition
 
+def _radii_and_distances(arrays: BodyArrays,
+                         i_idx: np.ndarray,
+                         j_idx: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The radii of both bodies of the pairs and the distances between them.
+    """
+    d = np.hypot(arrays.pos_x[i_idx] - arrays.pos_x[j_idx],
+                 arrays.pos_y[i_idx] - arrays.pos_y[j_idx])
+    return arrays.radius[i_idx], arrays.radius[j_idx], d
+
 class MergeCondtion:
     """
     Factory class for creating conditions to determine whether two bodies should
@@ -24,6 +37,10 @@ class MergeCondtion:
         The condition returns `True` if the intersection area between the two
         bodies is greater than `area_ratio` times the minimum area of the two bodies.
 
+        The batch version computes the areas with
+        `CircleTools.intersection_area_batch`, so that the trigonometry is only
+        done for the pairs that actually overlap.
+
         Parameters:
         -----------
         area_ratio : float
@@ -34,12 +51,21 @@ class MergeCondtion:
         Condition
             A condition function for the intersection area.
         """
+        def intersection_area_batch(arrays: BodyArrays,
+                                    i_idx: np.ndarray,
+                                    j_idx: np.ndarray) -> np.ndarray:
+            r1, r2, d = _radii_and_distances(arrays, i_idx, j_idx)
+            r_min = np.minimum(r1, r2)
+            return (CircleTools.intersection_area_batch(r1, r2, d) >
+                    area_ratio * math.pi * r_min * r_min)
+
         return Condition(
             lambda body1, body2: (CircleTools.intersection_area(
                                     r1=body1.radius,
                                     r2=body2.radius,
                                     d=(body1.pos - body2.pos).length()) >
-                                  area_ratio * min(body1.area, body2.area)))
+                                  area_ratio * min(body1.area, body2.area)),
+            batch=intersection_area_batch)
 
     @staticmethod
     def chord_length(length_ratio: float) -> Callable[[Body, Body], bool]:
@@ -61,9 +87,20 @@ class MergeCondtion:
             A function that determines if two bodies should be merged based on
             the chord length between them.
         """
+        def chord_length_batch(arrays: BodyArrays,
+                               i_idx: np.ndarray,
+                               j_idx: np.ndarray) -> np.ndarray:
+            r1, r2, d = _radii_and_distances(arrays, i_idx, j_idx)
+            return (CircleTools.chord_length_batch(r1, r2, d) >
+                    length_ratio * np.minimum(r1, r2))
+
         return Condition(
-            lambda body1, body2: (CircleTools.chord_length(body1, body2) >
-                                  length_ratio * min(body1.radius, body2.radius)))
+            lambda body1, body2: (CircleTools.chord_length(
+                                    r1=body1.radius,
+                                    r2=body2.radius,
+                                    d=(body1.pos - body2.pos).length()) >
+                                  length_ratio * min(body1.radius, body2.radius)),
+            batch=chord_length_batch)
     
     @staticmethod
     def penetration_depth(length_ratio: float) -> Callable[[Body, Body], bool]:
@@ -85,9 +122,20 @@ class MergeCondtion:
             A function that determines if two bodies should be merged based on
             the penetration depth between them.
         """
+        def penetration_depth_batch(arrays: BodyArrays,
+                                    i_idx: np.ndarray,
+                                    j_idx: np.ndarray) -> np.ndarray:
+            r1, r2, d = _radii_and_distances(arrays, i_idx, j_idx)
+            return (CircleTools.penetration_depth_batch(r1, r2, d) >
+                    length_ratio * np.minimum(r1, r2))
+
         return Condition(
-            lambda body1, body2: (CircleTools.penetration_depth(body1, body2) >
-                                  length_ratio * min(body1.radius, body2.radius)))
+            lambda body1, body2: (CircleTools.penetration_depth(
+                                    r1=body1.radius,
+                                    r2=body2.radius,
+                                    d=(body1.pos - body2.pos).length()) >
+                                  length_ratio * min(body1.radius, body2.radius)),
+            batch=penetration_depth_batch)
     
     #@staticmethod
     #def color_similarity(color_threshold: float) -> Callable[[Body, Body], bool]:
@@ -126,9 +174,17 @@ class MergeCondtion:
             A function that determines if two bodies should be merged based on
             the relative velocity between them.
         """
+        def relative_speed_batch(arrays: BodyArrays,
+                                 i_idx: np.ndarray,
+                                 j_idx: np.ndarray) -> np.ndarray:
+            return (np.hypot(arrays.vel_x[i_idx] - arrays.vel_x[j_idx],
+                             arrays.vel_y[i_idx] - arrays.vel_y[j_idx]) <
+                    speed_threshold)
+
         return Condition(
             lambda body1, body2: ((body1.vel - body2.vel).length() <
-                                  speed_threshold))
+                                  speed_threshold),
+            batch=relative_speed_batch)
     
     @staticmethod
     def point_distance(d: float) -> Callable[[Body, Body], bool]:
@@ -154,8 +210,14 @@ class MergeCondtion:
             A function that determines if two bodies should be merged based on
             the distance between their centers.
         """
+        def point_distance_batch(arrays: BodyArrays,
+                                 i_idx: np.ndarray,
+                                 j_idx: np.ndarray) -> np.ndarray:
+            return _radii_and_distances(arrays, i_idx, j_idx)[2] < d
+
         return Condition(
-            lambda body1, body2: (body1.pos - body2.pos).length() < d)
+            lambda body1, body2: (body1.pos - body2.pos).length() < d,
+            batch=point_distance_batch)
     
     @staticmethod
     def mass_ratio(ratio: float) -> Callable[[Body, Body], bool]:
@@ -187,6 +249,14 @@ class MergeCondtion:
             A function that determines if two bodies should be merged based on
             the ratio of their masses.
         """
+        def mass_ratio_batch(arrays: BodyArrays,
+                             i_idx: np.ndarray,
+                             j_idx: np.ndarray) -> np.ndarray:
+            m1 = arrays.mass[i_idx]
+            m2 = arrays.mass[j_idx]
+            return np.minimum(m1, m2) / np.maximum(m1, m2) < ratio
+
         return Condition(
             lambda body1, body2: (min(body1.mass, body2.mass) /
-                                  max(body1.mass, body2.mass) < ratio))
\ No newline at end of file
+                                  max(body1.mass, body2.mass) < ratio),
+            batch=mass_ratio_batch)
\ No newline at end of file
@@ -1,6 +1,8 @@
+import numpy as np
 from model.body import Body
 from model.body_list import BodyList
-from typing import Callable, Optional
+from model.body_arrays import BodyArrays
+from typing import Callable, Optional, Union
 from model.condition import Condition
 from events.event_bus import EventBus
 
@@ -30,10 +32,33 @@ def generate_spontaneous_body_merging(
         bodies : BodyList
             The list of bodies to merge to in-place if they satisfy the merge
             condition.
+        arrays : BodyArrays, optional
+            A snapshot of the bodies. If given and the merge condition has a
+            batch version, the condition is evaluated for all the neighbors
+            at once, and only the pairs that satisfy it are visited. The
+            neighbors may then also be given as two arrays of indices into
+            the snapshot.
     """
     
-    def merge(neighbors: list[tuple[Body, Body]],
-              bodies: BodyList) -> None:
+    def merge(neighbors: Union[list[tuple[Body, Body]], tuple[np.ndarray, np.ndarray]],
+              bodies: BodyList,
+              arrays: Optional[BodyArrays] = None) -> None:
+        if arrays is not None and merge_condition.batch is not None:
+            i_idx, j_idx = arrays.as_indices(neighbors)
+            if not len(i_idx):
+                return
+            ids = bodies.ids
+            snapshot = arrays.bodies
+            merging = np.flatnonzero(merge_condition.batch(arrays, i_idx, j_idx))
+            for i, j in zip(i_idx[merging].tolist(), j_idx[merging].tolist()):
+                body1 = snapshot[i]
+                body2 = snapshot[j]
+                if id(body1) in ids and id(body2) in ids:
+                    event_bus.publish("merge_bodies", {"body1": body1, "body2": body2 })
+            return
+
+        if isinstance(neighbors, tuple):
+            neighbors = arrays.pairs(*neighbors)
         for body1, body2 in neighbors:
             if body1 not in bodies or body2 not in bodies:
                 continue
@@ -1,13 +1,40 @@
 from model.body import Body
 from model.body_list import BodyList
-import networkx as nx
+from model.body_arrays import BodyArrays
+import numpy as np
+from math import sqrt
+from model.union_find import uf_make, uf_union, uf_groups
+import model._force_kernels as kernels
 import utils.const as const
 from audio.audio_manager import AudioManager
-from typing import Callable
+from typing import Callable, Optional
+from dataclasses import dataclass, astuple
 from model.composite_body import CompositeBody
 from events.event_bus import EventBus
 
-spring_tuple = tuple[Body, Body, float, float, float, float]
+spring_tuple = tuple[Body, Body, float, float, float, float, float]
+
+@dataclass(frozen=True)
+class SpringParams:
+    """
+    The parameters shared by a group of springs.
+
+    Attributes:
+    -----------
+    stiffness : float
+        The spring constant.
+    damping : float
+        The damping coefficient.
+    break_distance_factor : float
+        The spring breaks when stretched beyond this factor times its
+        equilibrium length.
+    break_force : float
+        The spring breaks when its force exceeds this magnitude.
+    """
+    stiffness: float
+    damping: float
+    break_distance_factor: float
+    break_force: float
 
 class Spring:
 
@@ -52,27 +79,172 @@ class Spring:
     @staticmethod
     def break_distance_factor(spring: spring_tuple) -> float:
         return spring[Spring.BREAK_DISTANCE_FACTOR_IDX]
+
+    @staticmethod
+    def params(spring: spring_tuple) -> SpringParams:
+        return SpringParams(*spring[Spring.STIFFNESS_IDX:Spring.EQUILIBRIUM_IDX],
+                            *spring[Spring.BREAK_DISTANCE_FACTOR_IDX:])
         
 class Springs:
     """
     A class to represent springs between bodies. This may be used
     to simulate soft bodies or other systems where bodies are connected by
     some kind of attachment.
+
+    The springs are stored as a structure of arrays, with room for more
+    springs than are in use so that `link` appends in amortized constant
+    time. The bodies are stored by reference, since their indices in the
+    `BodyList` change as bodies are removed; they are mapped to indices into
+    a snapshot of the bodies on each `update`.
+
+    Springs are usually made in bulk from a few templates (e.g., a spring
+    mesh, or the virtual spring field), so they share their stiffness,
+    damping, break distance factor and break force. These parameters are
+    stored once per group of springs that share them, in small tables
+    indexed by a per-spring `group` column, and the per-spring columns only
+    hold what differs from spring to spring: the bodies, the equilibrium
+    length and the squared break distance.
+
+    Iterating over the springs yields the spring tuples, which are built
+    from the columns and the group tables on the fly.
     """
+
+    INITIAL_CAPACITY = 64
+
+    # Below this many springs, `update` loops over the springs in Python
+    # instead of taking a snapshot of all the bodies for the batch kernels.
+    SCALAR_MAX_SPRINGS = 32
+
     def __init__(self,
                  bodies: BodyList,
-                 springs: list[tuple[Body, Body, float, float, float, float]],
+                 springs: list[tuple[Body, Body, float, float, float, float, float]],
                  event_bus: EventBus):
         """
         Initialize the Springs object with a list of bodies and a list of
         springs.
 
         A spring is a tuple given by:
-            [body1, body2, k, damping, equilibrium, break_force]
+            [body1, body2, k, damping, equilibrium, break_distance_factor, break_force]
         """
-        self.springs = springs
         self.bodies = bodies
         self.event_bus = event_bus
+        self.count = 0
+        # number of springs between each unordered pair of bodies, keyed by
+        # the ids of the bodies, so that `connected` is a dict lookup
+        self._links: dict[tuple[int, int], int] = {}
+        # the parameters of each group, and the group of each parameters
+        self._group_params: list[SpringParams] = []
+        self._groups: dict[SpringParams, int] = {}
+        self._group_tables: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._allocate(max(Springs.INITIAL_CAPACITY, len(springs)))
+        for spring in springs:
+            self._append(*spring)
+
+    def _allocate(self, capacity: int) -> None:
+        """
+        Allocate the columns with room for `capacity` springs, keeping the
+        springs in use.
+        """
+        n = self.count
+        columns = {
+            "body1": np.empty(capacity, dtype=object),
+            "body2": np.empty(capacity, dtype=object),
+            "group": np.empty(capacity, dtype=np.intp),
+            "equilibrium": np.empty(capacity, dtype=np.float64),
+            # squared break distance, so that the break test compares
+            # squared lengths and needs no square root
+            "break_distance_sq": np.empty(capacity, dtype=np.float64)
+        }
+        for name, column in columns.items():
+            if n:
+                column[:n] = getattr(self, name)[:n]
+            setattr(self, name, column)
+
+    def _columns(self) -> tuple[np.ndarray, ...]:
+        """
+        The per-spring columns.
+        """
+        return (self.body1, self.body2, self.group, self.equilibrium,
+                self.break_distance_sq)
+
+    def _group_of(self, params: SpringParams) -> int:
+        """
+        The group of the springs with the given parameters, making a new
+        group if there is none.
+        """
+        group = self._groups.get(params)
+        if group is None:
+            group = self._groups[params] = len(self._group_params)
+            self._group_params.append(params)
+            self._group_tables = None
+        return group
+
+    def group_tables(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The stiffness, damping and squared break force of each group, as
+        arrays indexed by the `group` column. They are rebuilt on first use
+        after a group is added.
+        """
+        if self._group_tables is None:
+            if self._group_params:
+                stiffness, damping, _, break_force = (
+                    np.array(col, dtype=np.float64)
+                    for col in zip(*map(astuple, self._group_params)))
+            else:
+                stiffness = damping = break_force = np.empty(0, dtype=np.float64)
+            self._group_tables = (stiffness, damping, break_force * break_force)
+        return self._group_tables
+
+    def _append(self, body1, body2, stiffness, damping, equilibrium,
+                break_distance_factor, break_force) -> None:
+        if self.count == len(self.body1):
+            self._allocate(2 * len(self.body1))
+        k = self.count
+        self.body1[k] = body1
+        self.body2[k] = body2
+        self.group[k] = self._group_of(SpringParams(float(stiffness), float(damping),
+                                                    float(break_distance_factor),
+                                                    float(break_force)))
+        self.equilibrium[k] = equilibrium
+        self.break_distance_sq[k] = (break_distance_factor * equilibrium) ** 2
+        self.count += 1
+        key = Springs._link_key(body1, body2)
+        self._links[key] = self._links.get(key, 0) + 1
+
+    def _compact(self, keep: np.ndarray) -> None:
+        """
+        Keep only the springs where `keep` is True, preserving their order,
+        in a single pass over each column.
+        """
+        n = self.count
+        kept = np.flatnonzero(keep)
+        m = len(kept)
+        if m == n:
+            return
+        links = self._links
+        dropped = np.ones(n, dtype=bool)
+        dropped[kept] = False
+        for body1, body2 in zip(self.body1[:n][dropped], self.body2[:n][dropped]):
+            key = Springs._link_key(body1, body2)
+            if links[key] == 1:
+                del links[key]
+            else:
+                links[key] -= 1
+        # gather the kept rows once per column, with the indices computed
+        # once for all the columns
+        for column in self._columns():
+            column[:m] = column[kept]
+        # drop the references to the bodies of the removed springs
+        self.body1[m:n] = None
+        self.body2[m:n] = None
+        self.count = m
+
+    @property
+    def springs(self) -> list[tuple[Body, Body, float, float, float, float, float]]:
+        """
+        The spring tuples, as a new list.
+        """
+        return list(self)
 
     def link(self,
              body1: Body,
@@ -89,7 +261,7 @@ class Springs:
         """
         if equilibrium is None:
             equilibrium = (body2.pos - body1.pos).length()
-        self.springs.append((body1, body2, stiffness, damping, equilibrium, break_distance_factor, break_force))
+        self._append(body1, body2, stiffness, damping, equilibrium, break_distance_factor, break_force)
         # self.event_bus.publish("spring_connected", { "body1": body1,
         #                                             "body2": body2,
         #                                             "stiffness": stiffness,
@@ -100,100 +272,264 @@ class Springs:
         
 
     def unlink(self, body1: Body, body2: Body):
-        for body1, body2, spring in self.springs:
-            if spring[0] is body1 and spring[1] is body2:
-                self.springs.remove(spring)
+        """
+        Remove the springs between `body1` and `body2`, in either direction.
+        """
+        key = Springs._link_key(body1, body2)
+        links = self._links.get(key, 0)
+        if not links:
+            return
+        n = self.count
+        b1s = self.body1[:n]
+        b2s = self.body2[:n]
+        if links == 1:
+            # a single spring joins the bodies: stop at it, and shift the
+            # rows after it down by one
+            k = next((k for k, (b1, b2) in enumerate(zip(b1s, b2s))
+                      if Springs._joins(b1, b2, body1, body2)), None)
+            if k is None:
+                return
+            del self._links[key]
+            for column in self._columns():
+                column[k:n - 1] = column[k + 1:n]
+            self.body1[n - 1] = None
+            self.body2[n - 1] = None
+            self.count = n - 1
+            return
+        keep = np.fromiter((not Springs._joins(b1, b2, body1, body2) for b1, b2 in zip(b1s, b2s)),
+                           dtype=bool, count=n)
+        self._compact(keep)
+
+    def params(self, k: int) -> SpringParams:
+        """
+        The parameters of spring `k`.
+        """
+        if not 0 <= k < self.count:
+            raise IndexError("spring index out of range")
+        return self._group_params[self.group[k]]
 
     def __iter__(self):
-        return iter(self.springs)
+        n = self.count
+        params = [astuple(p) for p in self._group_params]
+        for body1, body2, group, equilibrium in zip(self.body1[:n].tolist(),
+                                                    self.body2[:n].tolist(),
+                                                    self.group[:n].tolist(),
+                                                    self.equilibrium[:n].tolist()):
+            stiffness, damping, break_distance_factor, break_force = params[group]
+            yield (body1, body2, stiffness, damping, equilibrium,
+                   break_distance_factor, break_force)
+
+    def __len__(self) -> int:
+        return self.count
 
     def find_composite_bodies(self,
-                              pred: Callable[[tuple[Body, Body, float, float, float, float, float]], bool] = lambda x: True) -> list[CompositeBody]:
+                              pred: Optional[Callable[[tuple[Body, Body, float, float, float, float, float]], bool]] = None) -> list[CompositeBody]:
         """
         Find spring-connected bodies that satisfy a spring predicate.
 
         A predicate is a function that takes a Spring tuple:
 
-            [body1, body2, k, damping, equilibrium, break_force]
+            [body1, body2, k, damping, equilibrium, break_distance_factor, break_force]
 
         and return True if the spring satisfies the criteria of considering
-        the two bodies a (part of) the composite body.
-        """
-        # treat springs as undirected edges in a graph
-        G = nx.Graph()
-        # [body1, body2, k, damping, equilibrium, break_force]
-        for spring in self.springs:
-            if pred(spring):
-                G.add_edge(spring[Spring.BODY1_IDX],
-                           spring[Spring.BODY2_IDX],
-                           spring=spring)
-
-        # find connected components
-        comps = list(nx.connected_components(G))
+        the two bodies a (part of) the composite body. If no predicate is
+        given, all the springs are used, read straight from the body columns
+        without building the spring tuples.
+        """
+        # treat springs as undirected edges between the bodies they connect,
+        # and find the connected components with union-find
+        index = {}
+        nodes = []
+        def node(body: Body) -> int:
+            k = index.get(id(body))
+            if k is None:
+                k = index[id(body)] = len(nodes)
+                nodes.append(body)
+            return k
+
+        n = self.count
+        if pred is None:
+            ends = zip(self.body1[:n].tolist(), self.body2[:n].tolist())
+        else:
+            ends = ((spring[Spring.BODY1_IDX], spring[Spring.BODY2_IDX])
+                    for spring in self if pred(spring))
+        edges = [(node(body1), node(body2)) for body1, body2 in ends]
+        parent, rank = uf_make(len(nodes))
+        for a, b in edges:
+            uf_union(parent, rank, a, b)
+
         composites = []
-        for comp in comps:
+        for comp in uf_groups(parent):
             if len(comp) > 1:
-                composites.append(CompositeBody(list(comp)))
+                composites.append(CompositeBody([nodes[k] for k in comp]))
                 
         return composites
     
+    @staticmethod
+    def _link_key(body1: Body, body2: Body) -> tuple[int, int]:
+        id1 = id(body1)
+        id2 = id(body2)
+        return (id1, id2) if id1 < id2 else (id2, id1)
+
+    @staticmethod
+    def _joins(b1: Body, b2: Body, body1: Body, body2: Body) -> bool:
+        """
+        Whether a spring from `b1` to `b2` joins `body1` and `body2`, in
+        either direction.
+        """
+        return (b1 is body1 and b2 is body2) or (b1 is body2 and b2 is body1)
+
     def connected(self, body1: Body, body2: Body) -> bool:
-        for b1, b2, _, _, _, _, _ in self.springs:
-            if ((body1 is b1 and body2 is b2 or
-                (body1 is b2 and body2 is b1))):
-                return True
-        return False
-
-    def update(self):
-        remove_list = []
-        
-        for s in self.springs:
-            b1, b2, stiff, damp, equi, break_distance_factor, break_force = s
-            if b1 not in self.bodies or b2 not in self.bodies:
-                remove_list.append(s)
-                continue            
-            d = b2.pos - b1.pos
-            l = d.length()
-            break_dist = break_distance_factor * equi
-            if l > break_dist:
-                # self.event_bus.publish(
-                #     'spring_break_distance',
-                #     {'source_pos': lambda: (b1.pos + b2.pos) / 2,
-                #      'body1': b1,
-                #      'body2': b2,
-                #      'distance': l,
-                #      'equilibrium': equi,
-                #      'break_distance': break_dist,
-                #      'delay': 0.0})
-                remove_list.append(s)
-                continue
+        """
+        Check if a spring connects `body1` and `body2`, in either direction.
+        """
+        return Springs._link_key(body1, body2) in self._links
 
-            if l < 1e-3:
-                continue
+    def update(self,
+               arrays: Optional[BodyArrays] = None,
+               forces: Optional[tuple[np.ndarray, np.ndarray]] = None):
+        """
+        Apply the spring forces to the bodies, and remove the springs that
+        are broken (too long or too much force) or whose bodies are gone.
 
-            f = stiff * (l - equi) * d.normalize()
-            f -= damp * (b1.vel - b2.vel)
-
-            f_mag = f.length()
-            if f_mag > break_force:
-                # self.event_bus.publish(
-                #     'spring_break_force',
-                #     {'source_pos': lambda: (b1.pos + b2.pos) / 2,
-                #      'body1': b1,
-                #      'body2': b2,
-                #      'force_mag': f_mag,
-                #      'break_force': break_force,
-                #      'delay': 0.0})
-                remove_list.append(s)
-                continue
+        The forces of all the springs are computed at once from a snapshot of
+        the bodies and the spring columns, by a compiled kernel when numba is
+        available and with NumPy otherwise.
+
+        Parameters:
+        -----------
+        arrays : BodyArrays, optional
+            The snapshot of the bodies to use. If None, a snapshot is taken.
+        forces : tuple[np.ndarray, np.ndarray], optional
+            Per-body force arrays `(fx, fy)` for the snapshot. If given, the
+            spring forces are accumulated into them instead of being added
+            to the bodies, so that the forces of several models computed
+            from the same snapshot can be written back to the bodies once,
+            with `arrays.add_forces`.
+        """
+        n = self.count
+        if n == 0:
+            return
+        if n <= Springs.SCALAR_MAX_SPRINGS and arrays is None and forces is None:
+            self._update_scalar()
+            return
+
+        group = self.group[:n]
+        equi = self.equilibrium[:n]
+        break_distance_sq = self.break_distance_sq[:n]
+        group_stiffness, group_damping, group_break_force_sq = self.group_tables()
+
+        if arrays is None:
+            arrays = BodyArrays.from_bodies(self.bodies)
+        force_x, force_y = arrays.zero_forces() if forces is None else forces
+        index = arrays.index
+        i = np.fromiter((index.get(id(b), -1) for b in self.body1[:n]), dtype=np.intp, count=n)
+        j = np.fromiter((index.get(id(b), -1) for b in self.body2[:n]), dtype=np.intp, count=n)
+
+        if kernels.HAS_NUMBA:
+            broken = np.empty(n, dtype=bool)
+            kernels.nb_springs(i, j, group, equi, break_distance_sq,
+                               group_stiffness, group_damping,
+                               group_break_force_sq,
+                               arrays.pos_x, arrays.pos_y,
+                               arrays.vel_x, arrays.vel_y, force_x, force_y,
+                               float(Spring.MAX_SPRING_FORCE), broken)
+            if forces is None:
+                arrays.add_forces(force_x, force_y)
+            if broken.any():
+                self._compact(~broken)
+            return
+
+        # springs whose bodies are no longer in the simulation
+        broken = (i < 0) | (j < 0)
+
+        dx = arrays.pos_x[j] - arrays.pos_x[i]
+        dy = arrays.pos_y[j] - arrays.pos_y[i]
+        l_sq = dx * dx + dy * dy
+        broken |= l_sq > break_distance_sq
+        active = ~broken & (l_sq >= 1e-6)
+
+        # the forces are only computed for the springs that are neither
+        # broken nor collapsed
+        act = np.flatnonzero(active)
+        i, j, dx, dy = i[act], j[act], dx[act], dy[act]
+        l = np.sqrt(l_sq[act])
+        inv_l = 1.0 / l
+
+        # stiff * (l - equi) times the unit vector along d, minus damping
+        group = group[act]
+        scale = group_stiffness[group] * (l - equi[act]) * inv_l
+        damp = group_damping[group]
+        fx = scale * dx - damp * (arrays.vel_x[i] - arrays.vel_x[j])
+        fy = scale * dy - damp * (arrays.vel_y[i] - arrays.vel_y[j])
+        f_mag_sq = fx * fx + fy * fy
+
+        too_strong = f_mag_sq > group_break_force_sq[group]
+        if too_strong.any():
+            broken[act[too_strong]] = True
+            keep = ~too_strong
+            i, j, fx, fy, f_mag_sq = i[keep], j[keep], fx[keep], fy[keep], f_mag_sq[keep]
 
-            if f_mag > Spring.MAX_SPRING_FORCE:
-                f = f.normalize() * Spring.MAX_SPRING_FORCE
+        max_force = Spring.MAX_SPRING_FORCE
+        clamp = f_mag_sq > max_force * max_force
+        if clamp.any():
+            s = max_force / np.sqrt(f_mag_sq[clamp])
+            fx[clamp] *= s
+            fy[clamp] *= s
 
-            b1.add_force(f)
-            b2.add_force(-f)
+        BodyArrays.accumulate_pair_forces(i, j, fx, fy, force_x, force_y)
+        if forces is None:
+            arrays.add_forces(force_x, force_y)
 
-        for s in remove_list:
-            self.springs.remove(s)
+        # drop the broken springs by compacting the columns in a single pass
+        if broken.any():
+            self._compact(~broken)
+
+    def _update_scalar(self):
+        """
+        `update` for a few springs: the same computation one spring at a
+        time, in plain floats.
+        """
+        ids = self.bodies.ids
+        max_force = Spring.MAX_SPRING_FORCE
+        max_force_sq = max_force * max_force
+        n = self.count
+        keep = np.ones(n, dtype=bool)
+        break_distance_sq = self.break_distance_sq[:n].tolist()
+        break_force_sq = self.group_tables()[2][self.group[:n]].tolist()
+        for k, (b1, b2, stiff, damp, equi, _, _) in enumerate(self):
+            if id(b1) not in ids or id(b2) not in ids:
+                keep[k] = False
+                continue
+
+            p1 = b1.pos
+            p2 = b2.pos
+            dx = p2.x - p1.x
+            dy = p2.y - p1.y
+            l_sq = dx * dx + dy * dy
+            if l_sq > break_distance_sq[k]:
+                keep[k] = False
+                continue
+            if l_sq < 1e-6:
+                continue
+
+            l = sqrt(l_sq)
+            v1 = b1.vel
+            v2 = b2.vel
+            inv_l = 1.0 / l
+            scale = stiff * (l - equi) * inv_l
+            fx = scale * dx - damp * (v1.x - v2.x)
+            fy = scale * dy - damp * (v1.y - v2.y)
+            f_mag_sq = fx * fx + fy * fy
+            if f_mag_sq > break_force_sq[k]:
+                keep[k] = False
+                continue
+            if f_mag_sq > max_force_sq:
+                s = max_force / sqrt(f_mag_sq)
+                fx *= s
+                fy *= s
 
+            b1.add_force_xy(fx, fy)
+            b2.add_force_xy(-fx, -fy)
 
+        self._compact(keep)
@@ -0,0 +1,99 @@
+"""
+A disjoint-set (union-find) structure over the integers 0..n-1, stored as
+two flat arrays: `parent`, where each element points towards the root of its
+set, and `rank`, an upper bound on the height of the tree under each root.
+
+With path compression in `uf_find` and union by rank in `uf_union`, each
+operation takes effectively constant time, and nothing is allocated after
+`uf_make`.
+"""
+import numpy as np
+
+def uf_make(n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Make `n` singleton sets.
+
+    Parameters:
+    -----------
+    n : int
+        The number of elements.
+
+    Returns:
+    --------
+    tuple[np.ndarray, np.ndarray]
+        The `parent` and `rank` arrays.
+    """
+    return np.arange(n, dtype=np.intp), np.zeros(n, dtype=np.int8)
+
+def uf_find(parent: np.ndarray, x: int) -> int:
+    """
+    Find the root of the set containing `x`, compressing the path from `x`
+    to the root.
+
+    Parameters:
+    -----------
+    parent : np.ndarray
+        The parent array.
+    x : int
+        The element.
+
+    Returns:
+    --------
+    int
+        The root of the set containing `x`.
+    """
+    root = x
+    while parent[root] != root:
+        root = parent[root]
+    while parent[x] != root:
+        parent[x], x = root, parent[x]
+    return int(root)
+
+def uf_union(parent: np.ndarray, rank: np.ndarray, a: int, b: int) -> int:
+    """
+    Merge the sets containing `a` and `b`, attaching the shorter tree under
+    the root of the taller one.
+
+    Parameters:
+    -----------
+    parent : np.ndarray
+        The parent array.
+    rank : np.ndarray
+        The rank array.
+    a, b : int
+        The elements.
+
+    Returns:
+    --------
+    int
+        The root of the merged set.
+    """
+    ra = uf_find(parent, a)
+    rb = uf_find(parent, b)
+    if ra == rb:
+        return ra
+    if rank[ra] < rank[rb]:
+        ra, rb = rb, ra
+    parent[rb] = ra
+    if rank[ra] == rank[rb]:
+        rank[ra] += 1
+    return ra
+
+def uf_groups(parent: np.ndarray) -> list[list[int]]:
+    """
+    Collect the elements of each set, in order of their first element.
+
+    Parameters:
+    -----------
+    parent : np.ndarray
+        The parent array.
+
+    Returns:
+    --------
+    list[list[int]]
+        The elements of each set.
+    """
+    groups = {}
+    for x in range(len(parent)):
+        groups.setdefault(uf_find(parent, x), []).append(x)
+    return list(groups.values())
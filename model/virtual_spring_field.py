@@ -1,5 +1,7 @@
-from typing import Callable
+from typing import Callable, Optional, Union
+import numpy as np
 from model.body import Body
+from model.body_arrays import BodyArrays
 from model.springs import Springs
 from events.event_bus import EventBus
 
@@ -48,6 +50,11 @@ def generate_virtual_spring_field(
             A list of tuples of bodies that are nearest neighbors.
         springs : Springs
             The springs object that manages the springs between bodies.
+        arrays : BodyArrays, optional
+            A snapshot of the bodies. If given, the distance and speed
+            thresholds are tested for all the neighbors at once, and only
+            the pairs that pass them are visited. The neighbors may then
+            also be given as two arrays of indices into the snapshot.
 
         Returns:
         --------
@@ -56,13 +63,17 @@ def generate_virtual_spring_field(
     """
 
     def connector(
-            neighbors: list[tuple[Body, Body]],                            
-            springs: Springs) -> int:
+            neighbors: Union[list[tuple[Body, Body]], tuple[np.ndarray, np.ndarray]],
+            springs: Springs,
+            arrays: Optional[BodyArrays] = None) -> int:
+
+        if arrays is not None:
+            return connector_batch(neighbors, springs, arrays)
         
         connections_made: int = 0  
 
         for body1, body2 in neighbors:
-            if springs.connected(body1, body2):
+            if body1 is body2 or springs.connected(body1, body2):
                 continue
             
             delta_pos = body2.pos - body1.pos
@@ -96,4 +107,46 @@ def generate_virtual_spring_field(
                     
         return connections_made
 
+    def connector_batch(
+            neighbors: Union[list[tuple[Body, Body]], tuple[np.ndarray, np.ndarray]],
+            springs: Springs,
+            arrays: BodyArrays) -> int:
+        i_idx, j_idx = arrays.as_indices(neighbors)
+        if not len(i_idx):
+            return 0
+
+        dx = arrays.pos_x[j_idx] - arrays.pos_x[i_idx]
+        dy = arrays.pos_y[j_idx] - arrays.pos_y[i_idx]
+        length = np.sqrt(dx * dx + dy * dy)
+        dist = length - arrays.radius[i_idx] - arrays.radius[j_idx]
+        dvx = arrays.vel_x[j_idx] - arrays.vel_x[i_idx]
+        dvy = arrays.vel_y[j_idx] - arrays.vel_y[i_idx]
+        rel_speed = np.sqrt(dvx * dvx + dvy * dvy)
+        candidates = np.flatnonzero((dist <= distance_threshold) &
+                                    (rel_speed <= relative_speed_threshold) &
+                                    (i_idx != j_idx))
+
+        bodies = arrays.bodies
+        connections_made: int = 0
+        for i, j, equilibrium in zip(i_idx[candidates].tolist(),
+                                     j_idx[candidates].tolist(),
+                                     length[candidates].tolist()):
+            body1 = bodies[i]
+            body2 = bodies[j]
+            # checked per pair, since linking updates the connections
+            if springs.connected(body1, body2):
+                continue
+
+            connections_made += 1
+            springs.link(
+                body1=body1,
+                body2=body2,
+                stiffness=stiffness,
+                damping=damping,
+                equilibrium=equilibrium,
+                break_distance_factor=break_distance_factor,
+                break_force=break_force)
+
+        return connections_made
+
     return connector
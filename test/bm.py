@@ -7,6 +7,13 @@ G = 6.67430e-11
 # Number of frames per second
 TARGET_FPS = 60
 
+# Velocity and position update in one CUDA kernel, instead of one kernel and
+# one temporary per operator
+@cp.fuse()
+def integrate(positions, velocities, forces, masses, dt):
+    velocities = velocities + forces / masses * dt
+    return positions + velocities * dt, velocities
+
 class GPUNBodySimulation:
     def __init__(self, num_bodies, cutoff_distance, dt=1.0):
         self.num_bodies = num_bodies
@@ -47,8 +54,8 @@ class GPUNBodySimulation:
         forces = self.compute_forces()
 
         # Update velocities and positions on the GPU
-        self.velocities += forces / self.masses[:, cp.newaxis] * self.dt
-        self.positions += self.velocities * self.dt
+        self.positions, self.velocities = integrate(
+            self.positions, self.velocities, forces, self.masses[:, cp.newaxis], self.dt)
 
     def simulate(self, num_steps):
         start_time = time.time()
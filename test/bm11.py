@@ -8,17 +8,22 @@ G = cp.float32(6.67430e-11)
 # Optimized CUDA kernel using shared memory and single precision
 optimized_kernel = cp.RawKernel(r'''
 extern "C" __global__
-void compute_and_update_optimized(float* positions, float* velocities, float* masses, int num_bodies, float cutoff_distance, float G, float dt) {
-    extern __shared__ float shared_positions[];
+void compute_and_update_optimized(const float4* __restrict__ bodies, float4* __restrict__ bodies_out,
+                                  const float* __restrict__ velocities, float* __restrict__ velocities_out,
+                                  int num_bodies, float cutoff_distance, float G, float dt, float kick_dt) {
+    // Dynamic shared memory: the (x, y, z, mass) of each body of the tile
+    extern __shared__ float4 shared_bodies[];
     
     int i = blockIdx.x * blockDim.x + threadIdx.x;
-    if (i >= num_bodies) return;
+
+    // Threads past the last body do not return early: they still load
+    // their share of every tile and reach every __syncthreads(), and only
+    // skip the final write
+    bool active = i < num_bodies;
     
-    // Load own position and mass
-    float pos_i_x = positions[i * 3 + 0];
-    float pos_i_y = positions[i * 3 + 1];
-    float pos_i_z = positions[i * 3 + 2];
-    float mass_i = masses[i];
+    // Load own position and mass in one 16-byte load
+    float4 body_i = bodies[active ? i : 0];
+    float mass_i = body_i.w;
     
     float force_x = 0.0f;
     float force_y = 0.0f;
@@ -26,16 +31,9 @@ void compute_and_update_optimized(float* positions, float* velocities, float* ma
     
     // Loop over tiles
     for (int tile = 0; tile < (num_bodies + blockDim.x - 1) / blockDim.x; tile++) {
+        // Past the last body, the tile is padded with a massless ghost body
         int j = tile * blockDim.x + threadIdx.x;
-        if (j < num_bodies) {
-            shared_positions[threadIdx.x * 3 + 0] = positions[j * 3 + 0];
-            shared_positions[threadIdx.x * 3 + 1] = positions[j * 3 + 1];
-            shared_positions[threadIdx.x * 3 + 2] = positions[j * 3 + 2];
-        } else {
-            shared_positions[threadIdx.x * 3 + 0] = 0.0f;
-            shared_positions[threadIdx.x * 3 + 1] = 0.0f;
-            shared_positions[threadIdx.x * 3 + 2] = 0.0f;
-        }
+        shared_bodies[threadIdx.x] = (j < num_bodies) ? bodies[j] : make_float4(0.0f, 0.0f, 0.0f, 0.0f);
         __syncthreads();
         
         // Compute forces
@@ -43,16 +41,16 @@ void compute_and_update_optimized(float* positions, float* velocities, float* ma
             int j_global = tile * blockDim.x + j_local;
             if (i == j_global) continue;
             
-            float dx = shared_positions[j_local * 3 + 0] - pos_i_x;
-            float dy = shared_positions[j_local * 3 + 1] - pos_i_y;
-            float dz = shared_positions[j_local * 3 + 2] - pos_i_z;
+            float4 body_j = shared_bodies[j_local];
+            float dx = body_j.x - body_i.x;
+            float dy = body_j.y - body_i.y;
+            float dz = body_j.z - body_i.z;
             
             float dist_sq = dx * dx + dy * dy + dz * dz + 1e-10f;
             float dist = sqrtf(dist_sq);
             float inv_dist_cube = 1.0f / (dist_sq * dist);
             
-            float mass_j = masses[j_global];
-            float force_scalar = G * mass_i * mass_j * inv_dist_cube;
+            float force_scalar = G * mass_i * body_j.w * inv_dist_cube;
             force_x += force_scalar * dx;
             force_y += force_scalar * dy;
             force_z += force_scalar * dz;
@@ -66,15 +64,25 @@ void compute_and_update_optimized(float* positions, float* velocities, float* ma
         }
         __syncthreads();
     }
+
+    if (!active) return;
     
-    // Update velocity and position
-    velocities[i * 3 + 0] += (force_x / mass_i) * dt;
-    velocities[i * 3 + 1] += (force_y / mass_i) * dt;
-    velocities[i * 3 + 2] += (force_z / mass_i) * dt;
+    // Leapfrog: kick the half-step velocity by a full step (by half a step
+    // on the first step, which moves the velocities from t = 0 to
+    // t = dt / 2), then drift the position with it. The updates go into the
+    // output buffers so that no block overwrites positions that another
+    // block is still reading.
+    float vel_x = velocities[i * 3 + 0] + (force_x / mass_i) * kick_dt;
+    float vel_y = velocities[i * 3 + 1] + (force_y / mass_i) * kick_dt;
+    float vel_z = velocities[i * 3 + 2] + (force_z / mass_i) * kick_dt;
+    velocities_out[i * 3 + 0] = vel_x;
+    velocities_out[i * 3 + 1] = vel_y;
+    velocities_out[i * 3 + 2] = vel_z;
     
-    positions[i * 3 + 0] += velocities[i * 3 + 0] * dt;
-    positions[i * 3 + 1] += velocities[i * 3 + 1] * dt;
-    positions[i * 3 + 2] += velocities[i * 3 + 2] * dt;
+    body_i.x += vel_x * dt;
+    body_i.y += vel_y * dt;
+    body_i.z += vel_z * dt;
+    bodies_out[i] = body_i;
 }
 ''', 'compute_and_update_optimized')
 
@@ -84,83 +92,197 @@ class OptimizedGPUNBodySimulation:
         self.cutoff_distance = cutoff_distance
         self.dt = dt
 
-        # Initialize with single precision on GPU
-        self.positions = cp.random.rand(num_bodies, 3).astype(cp.float32) * 1000.0
-        self.velocities = cp.zeros((num_bodies, 3), dtype=cp.float32)
-        self.masses = cp.random.rand(num_bodies).astype(cp.float32) * 1e24
+        # Initialize with single precision on GPU. The positions and masses
+        # are packed as (x, y, z, mass) rows, read by the kernel as float4.
+        # There are two sets of state buffers: each step reads one set and
+        # writes the other, so the copy of a step's results to the host can
+        # run while the next step is being computed.
+        bodies = cp.empty((num_bodies, 4), dtype=cp.float32)
+        bodies[:, :3] = cp.random.rand(num_bodies, 3).astype(cp.float32) * 1000.0
+        bodies[:, 3] = cp.random.rand(num_bodies).astype(cp.float32) * 1e24
+        self.bodies = [bodies, bodies.copy()]
+        # The velocities are leapfrog half-step velocities: after a step
+        # they are half a step behind the positions
+        self.velocities = [cp.zeros((num_bodies, 3), dtype=cp.float32) for _ in range(2)]
+        self.current = 0
+        self.num_steps = 0
 
-        # Allocate pinned memory for host data
-        self.host_positions = cp.cuda.alloc_pinned_memory(self.positions.nbytes)
-        self.host_velocities = cp.cuda.alloc_pinned_memory(self.velocities.nbytes)
-        self.host_masses = cp.cuda.alloc_pinned_memory(self.masses.nbytes)
+        # Allocate pinned memory for host data, one set per state buffer.
+        # The masses never change, so they are copied to the host once here
+        # and ride along in the packed rows afterwards.
+        self.host_bodies = [cp.cuda.alloc_pinned_memory(bodies.nbytes) for _ in range(2)]
+        self.host_velocities = [cp.cuda.alloc_pinned_memory(self.velocities[0].nbytes) for _ in range(2)]
+        for host_bodies in self.host_bodies:
+            np.frombuffer(host_bodies, dtype=np.float32).reshape((num_bodies, 4))[:] = cp.asnumpy(bodies)
 
-        # Create a CUDA stream for asynchronous operations
+        # NumPy views of the pinned buffers, made once: (positions,
+        # velocities, masses) for each set
+        self.host_views = []
+        for host_bodies, host_velocities in zip(self.host_bodies, self.host_velocities):
+            bodies_cpu = np.frombuffer(host_bodies, dtype=np.float32).reshape((num_bodies, 4))
+            velocities_cpu = np.frombuffer(host_velocities, dtype=np.float32).reshape((num_bodies, 3))
+            self.host_views.append((bodies_cpu[:, :3], velocities_cpu, bodies_cpu[:, 3]))
+
+        # Create CUDA streams for the kernels and for the copies, and the
+        # events that order them
         self.stream = cp.cuda.Stream(non_blocking=True)
+        self.copy_stream = cp.cuda.Stream(non_blocking=True)
+        self.computed = [cp.cuda.Event() for _ in range(2)]
+        self.copied = [cp.cuda.Event() for _ in range(2)]
 
-    def step(self):
-        # Flatten arrays for the kernel
-        positions_flat = self.positions.ravel()
-        velocities_flat = self.velocities.ravel()
+        # CUDA graphs of a step from each buffer set, captured on first use
+        self.graphs = None
+
+        # The scalar kernel arguments, converted once to the kernel's
+        # parameter types
+        self._num_bodies = np.int32(num_bodies)
+        self._cutoff_distance = np.float32(cutoff_distance)
+        self._dt = np.float32(dt)
+        self._half_dt = np.float32(0.5 * dt)
 
+    @property
+    def positions(self):
+        return self.bodies[self.current][:, :3]
+
+    @property
+    def masses(self):
+        return self.bodies[self.current][:, 3]
+
+    def _launch_kernel(self, src, dst, kick_dt, stream):
         block_size = 256
         grid_size = (self.num_bodies + block_size - 1) // block_size
-        shared_mem_size = block_size * 3 * 4  # 3 floats per body
+        shared_mem_size = block_size * 16  # one float4 (x, y, z, mass) per body
 
         # Launch the optimized kernel on the specified stream
         optimized_kernel((grid_size,), (block_size,), 
-                        (positions_flat, velocities_flat, self.masses, self.num_bodies, 
-                         self.cutoff_distance, G, self.dt), 
-                        shared_mem=shared_mem_size, stream=self.stream.ptr)
-
-        # Asynchronously copy data back to the host
-        # Use memoryviews to avoid unnecessary data duplication
-        self.stream.wait()  # Ensure the kernel has completed
+                        (self.bodies[src], self.bodies[dst],
+                         self.velocities[src].ravel(), self.velocities[dst].ravel(),
+                         self._num_bodies, self._cutoff_distance, G, self._dt, kick_dt), 
+                        shared_mem=shared_mem_size, stream=stream.ptr)
 
-        # Transfer positions
+    def _launch_copy(self, index, stream):
+        # Transfer positions (and the masses packed with them)
         cp.cuda.runtime.memcpyAsync(
-            self.host_positions.ptr, 
-            self.positions.data.ptr, 
-            self.positions.nbytes, 
+            self.host_bodies[index].ptr, 
+            self.bodies[index].data.ptr, 
+            self.bodies[index].nbytes, 
             cp.cuda.runtime.cudaMemcpyKind.cudaMemcpyDeviceToHost, 
-            self.stream.ptr
+            stream.ptr
         )
 
         # Transfer velocities
         cp.cuda.runtime.memcpyAsync(
-            self.host_velocities.ptr, 
-            self.velocities.data.ptr, 
-            self.velocities.nbytes, 
+            self.host_velocities[index].ptr, 
+            self.velocities[index].data.ptr, 
+            self.velocities[index].nbytes, 
             cp.cuda.runtime.cudaMemcpyKind.cudaMemcpyDeviceToHost, 
-            self.stream.ptr
+            stream.ptr
         )
 
-        # Transfer masses (if masses are changing; if not, you can skip this)
-        cp.cuda.runtime.memcpyAsync(
-            self.host_masses.ptr, 
-            self.masses.data.ptr, 
-            self.masses.nbytes, 
-            cp.cuda.runtime.cudaMemcpyKind.cudaMemcpyDeviceToHost, 
-            self.stream.ptr
-        )
+    def _launch_step(self):
+        src = self.current
+        dst = 1 - src
+
+        # The first kick is half a step, to stagger the velocities
+        kick_dt = self._half_dt if self.num_steps == 0 else self._dt
+        self.num_steps += 1
+
+        # The step overwrites the buffers that the copy of the step before
+        # the last one reads from
+        self.stream.wait_event(self.copied[dst])
+        self._launch_kernel(src, dst, kick_dt, self.stream)
+        self.computed[dst].record(self.stream)
+
+        self.current = dst
+        return dst
+
+    def _copy_to_host(self, index):
+        # Asynchronously copy data back to the host once the step is done,
+        # on the copy stream so that it overlaps the next step
+        self.copy_stream.wait_event(self.computed[index])
+        self._launch_copy(index, self.copy_stream)
+        self.copied[index].record(self.copy_stream)
+
+    def step(self):
+        """
+        Launch one step and the copy of its results to the host, without
+        waiting for either. Returns the index of the buffers it writes, for
+        `get_cpu_data`.
+        """
+        dst = self._launch_step()
+        self._copy_to_host(dst)
+        return dst
+
+    def _capture_graph(self, src):
+        """
+        Capture a CUDA graph of a full step from the buffers `src`, that
+        also copies the state in `src` (the results of the step before) to
+        the host, on a branch that runs alongside the kernel.
+        """
+        dst = 1 - src
+        fork = cp.cuda.Event(disable_timing=True)
+        join = cp.cuda.Event(disable_timing=True)
+
+        self.stream.begin_capture()
+        fork.record(self.stream)
+        self.copy_stream.wait_event(fork)
+        self._launch_kernel(src, dst, self._dt, self.stream)
+        self._launch_copy(src, self.copy_stream)
+        join.record(self.copy_stream)
+        self.stream.wait_event(join)
+        return self.stream.end_capture()
+
+    def step_graph(self):
+        """
+        Like `step`, but replaying a captured CUDA graph (one per buffer
+        set) with a single launch. The graph copies the results of the
+        previous step, not of this one: after the last step, call
+        `_copy_to_host` on the index this returns. Not for the first step,
+        whose kick is half a step.
+        """
+        if self.graphs is None:
+            self.graphs = [self._capture_graph(0), self._capture_graph(1)]
+
+        src = self.current
+        dst = 1 - src
+        self.num_steps += 1
+        self.graphs[src].launch(stream=self.stream)
+        self.computed[dst].record(self.stream)
+        self.copied[src].record(self.stream)
 
-        # Synchronize the stream to ensure all transfers are complete
-        self.stream.synchronize()
+        self.current = dst
+        return dst
 
-    def get_cpu_data(self):
-        # Convert pinned memory to NumPy arrays for CPU access
-        positions_cpu = np.frombuffer(self.host_positions, dtype=np.float32).reshape((self.num_bodies, 3))
-        velocities_cpu = np.frombuffer(self.host_velocities, dtype=np.float32).reshape((self.num_bodies, 3))
-        masses_cpu = np.frombuffer(self.host_masses, dtype=np.float32)
-        return positions_cpu, velocities_cpu, masses_cpu
+    def get_cpu_data(self, index=None):
+        """
+        The host copy of the state written by the step that returned
+        `index` (by default, the latest step), once its copy is done, as
+        NumPy views of the pinned buffers. The views are reused, and are
+        overwritten by the copy of the step after next.
+        """
+        if index is None:
+            index = self.current
+        self.copied[index].synchronize()
+        return self.host_views[index]
 
-    def simulate(self, num_steps, visualize_callback=None):
+    def simulate(self, num_steps, visualize_callback=None, use_graphs=False):
         start_time = time.time()
 
+        # Launch each step before retrieving the results of the one before
+        # it, so that the GPU computes while the host processes the data.
+        # With graphs, each step after the first is one graph launch, which
+        # also copies the results of the step before it to the host.
+        first = self._launch_step if use_graphs else self.step
+        done = first() if num_steps else None
         for step_num in range(num_steps):
-            self.step()
+            ready = done
+            if step_num + 1 < num_steps:
+                done = self.step_graph() if use_graphs else self.step()
+            elif use_graphs:
+                self._copy_to_host(ready)
 
             # Retrieve CPU data after each step
-            positions_cpu, velocities_cpu, masses_cpu = self.get_cpu_data()
+            positions_cpu, velocities_cpu, masses_cpu = self.get_cpu_data(ready)
 
             # Optionally, process or visualize the data here
             if visualize_callback:
@@ -1,5 +1,6 @@
 import numpy as np
 import time
+from math import sqrt
 
 # Gravitational constant
 G = 6.67430e-11
@@ -19,38 +20,48 @@ class CPUNBodySimulation:
         self.masses = np.random.rand(num_bodies) * 1e24  # Random masses between 0 and 1e24 kg
 
     def compute_forces(self):
-        total_forces = np.zeros((self.num_bodies, 3))  # Initialize forces for each body to zero
-
-        for i in range(self.num_bodies):
-            force_i = np.zeros(3)  # Force acting on body `i`
-            
-            for j in range(self.num_bodies):
+        # Plain Python floats throughout: on single numbers, math.sqrt and
+        # float arithmetic are much cheaper than NumPy calls (np.sum,
+        # np.sqrt, small arrays), whose dispatch overhead dominates a loop
+        # like this one
+        num_bodies = self.num_bodies
+        xs, ys, zs = self.positions.T.tolist()
+        masses = self.masses.tolist()
+        cutoff_distance = self.cutoff_distance
+        total_forces = np.zeros((num_bodies, 3))  # Initialize forces for each body to zero
+
+        for i in range(num_bodies):
+            xi, yi, zi = xs[i], ys[i], zs[i]
+            g_mass_i = G * masses[i]
+            fx = fy = fz = 0.0  # Force acting on body `i`
+
+            for j in range(num_bodies):
                 if i == j:
                     continue  # Skip self-interaction
 
                 # Calculate the difference in positions
-                delta_pos = self.positions[j] - self.positions[i]
+                dx = xs[j] - xi
+                dy = ys[j] - yi
+                dz = zs[j] - zi
 
                 # Calculate the squared distance
-                dist_sq = np.sum(delta_pos ** 2) + 1e-10  # Add epsilon to avoid division by zero
-                dist = np.sqrt(dist_sq)
-
-                # Calculate inverse of distance cube
-                inv_dist_cube = 1.0 / (dist_sq * dist)
+                dist_sq = dx * dx + dy * dy + dz * dz + 1e-10  # Add epsilon to avoid division by zero
+                dist = sqrt(dist_sq)
 
                 # Gravitational force calculation: F = G * (m_i * m_j / r^2) * (r_ij / |r_ij|)
-                force = G * self.masses[i] * self.masses[j] * inv_dist_cube * delta_pos
+                s = g_mass_i * masses[j] / (dist_sq * dist)
+
+                # Check for local interaction (e.g., repulsion)
+                if dist < cutoff_distance:
+                    s -= 0.1
 
                 # Add the force from body `j` to the total force on body `i`
-                force_i += force
+                fx += s * dx
+                fy += s * dy
+                fz += s * dz
 
-                # Check for local interaction (e.g., repulsion)
-                if dist < self.cutoff_distance:
-                    repulsive_force = -0.1 * delta_pos
-                    force_i += repulsive_force
-            
             # Store the total force on body `i`
-            total_forces[i] = force_i
+            total_forces[i] = fx, fy, fz
 
         return total_forces
 
@@ -1,6 +1,12 @@
 import numpy as np
+from scipy.spatial import cKDTree
 import time
 
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
 # Gravitational constant
 G = 6.67430e-11
 
@@ -18,27 +24,143 @@ class CPUNBodySimulation:
         self.velocities = np.zeros((num_bodies, 3))  # Initially at rest
         self.masses = np.random.rand(num_bodies) * 1e24  # Random masses between 0 and 1e24 kg
 
+    # Rows of bodies per tile in compute_forces
+    TILE_ROWS = 256
+
     def compute_forces(self):
-        # Calculate pairwise differences for all positions
-        delta_pos = self.positions[:, np.newaxis, :] - self.positions[np.newaxis, :, :]  # Shape (N, N, 3)
+        # Work through the rows in tiles of TILE_ROWS bodies, so the pairwise
+        # intermediates are (B, N) instead of (N, N) and stay in cache
+        n = self.num_bodies
+        positions = self.positions
+        masses = self.masses
+        total_forces = np.empty((n, 3))
+
+        for i0 in range(0, n, self.TILE_ROWS):
+            i1 = min(i0 + self.TILE_ROWS, n)
+
+            # Pairwise differences for the tile, shape (B, N, 3)
+            delta_pos = positions[i0:i1, np.newaxis, :] - positions[np.newaxis, :, :]
+
+            # Pairwise squared distances (with small epsilon to avoid division by zero)
+            dist_sq = np.einsum('ijk,ijk->ij', delta_pos, delta_pos) + 1e-10  # Shape (B, N)
+
+            # Gravitational force: F = G * (m_i * m_j / r^2) * (r_ij / |r_ij|),
+            # with the weights G * m_i * m_j / r^3 of each pair computed in
+            # place in one (B, N) array: a straight divide, with no mask.
+            # Self-pairs have a zero delta_pos, so they add no force.
+            weights = np.sqrt(dist_sq)
+            weights *= dist_sq
+            np.divide(masses[np.newaxis, :], weights, out=weights)
+            weights *= G * masses[i0:i1, np.newaxis]
+
+            # Sum the forces for each body of the tile
+            total_forces[i0:i1] = np.einsum('ij,ijk->ik', weights, delta_pos)
+
+        # Local interaction: -0.1 * (p_i - p_j) on body i for the pairs below
+        # the cutoff, from the few close pairs instead of a dense mask. This
+        # pulls the two bodies of a pair towards each other, with equal and
+        # opposite forces (Newton's third law).
+        i_idx, j_idx, delta_pos = self.close_pairs()
+        idx = np.concatenate((i_idx, j_idx))
+        for k in range(3):
+            weights = np.concatenate((delta_pos[:, k], -delta_pos[:, k]))
+            total_forces[:, k] -= 0.1 * np.bincount(idx, weights=weights, minlength=n)
+
+        return total_forces
+
+    def close_pairs(self):
+        # The pairs closer than the cutoff, each once (i < j), from a k-d
+        # tree query instead of a sweep over all the pairs. The query keeps
+        # distances up to the cutoff inclusive, so the pairs are then
+        # checked against the cutoff with the same epsilon as the gravity
+        # pass. Pairs at the same position have a zero delta_pos and add no
+        # force either way.
+        positions = self.positions
+        pairs = cKDTree(positions).query_pairs(self.cutoff_distance, output_type='ndarray')
+        i_idx = pairs[:, 0]
+        j_idx = pairs[:, 1]
+        delta_pos = positions[i_idx] - positions[j_idx]
+        dist_sq = np.einsum('ij,ij->i', delta_pos, delta_pos) + 1e-10
+        close = dist_sq < self.cutoff_distance ** 2
+        return i_idx[close], j_idx[close], delta_pos[close]
+
+    def update(self):
+        # Compute forces on all bodies
+        forces = self.compute_forces()
+
+        # Update velocities and positions
+        self.velocities += forces / self.masses[:, np.newaxis] * self.dt
+        self.positions += self.velocities * self.dt
+
+    def simulate(self, num_steps):
+        start_time = time.time()
 
-        # Calculate pairwise distances (with small epsilon to avoid division by zero)
-        dist_sq = np.sum(delta_pos ** 2, axis=2) + 1e-10  # Shape (N, N)
-        dist = np.sqrt(dist_sq)
+        for step in range(num_steps):
+            self.update()
 
-        # Avoid self-interaction by setting inverse distances for self-pairs to zero
-        inv_dist_cube = np.where(dist > 1e-10, 1.0 / (dist_sq * dist), 0.0)  # Shape (N, N)
+        end_time = time.time()
+        return end_time - start_time
 
-        # Gravitational force calculation: F = G * (m_i * m_j / r^2) * (r_ij / |r_ij|)
-        forces = G * (self.masses[:, np.newaxis] * self.masses[np.newaxis, :]).reshape(self.num_bodies, self.num_bodies, 1) * inv_dist_cube[:, :, np.newaxis] * delta_pos
 
-        # Sum the forces for each body (axis=1 sums over other bodies)
-        total_forces = np.sum(forces, axis=1)
+if cp is not None:
+    # One CUDA kernel for the whole element-wise chain, including the mass
+    # outer product, instead of one kernel and one (B, N) temporary per step
+    @cp.fuse()
+    def _pair_weights(dx, dy, dz, g_mass_i, mass_j, cutoff_sq):
+        # Force on body i from body j over the pair's delta_pos: gravity
+        # G * m_i * m_j / r^3, minus 0.1 within the cutoff distance. The
+        # self-pairs are zeroed explicitly, since in single precision their
+        # 1 / r^3 overflows and 0 * inf is not 0
+        d_sq = dx * dx + dy * dy + dz * dz
+        dist_sq = d_sq + 1e-10
+        weights = g_mass_i * (mass_j * dist_sq ** -1.5) - 0.1 * (dist_sq < cutoff_sq)
+        return cp.where(d_sq > 0, weights, 0)
+
+    # Velocity and position update in one CUDA kernel, instead of one
+    # kernel and one temporary per operator
+    @cp.fuse()
+    def _integrate(positions, velocities, forces, masses, dt):
+        velocities = velocities + forces / masses * dt
+        return positions + velocities * dt, velocities
+
+
+class CuPyNBodySimulation:
+    """
+    `CPUNBodySimulation` on the GPU with CuPy, in single precision.
+    """
+
+    # Rows of bodies per tile in compute_forces
+    TILE_ROWS = 1024
 
-        # Local interaction: apply additional forces if the distance is below the cutoff
-        close_bodies = dist < self.cutoff_distance
-        repulsive_forces = np.where(close_bodies[:, :, np.newaxis], -0.1 * delta_pos, 0.0)
-        total_forces += np.sum(repulsive_forces, axis=1)
+    def __init__(self, num_bodies, cutoff_distance, dt=1.0):
+        self.num_bodies = num_bodies
+        self.cutoff_distance = cutoff_distance
+        self.dt = dt
+
+        # Initialize random positions, velocities, and masses on the GPU
+        self.positions = cp.random.rand(num_bodies, 3, dtype=cp.float32) * 1000.0
+        self.velocities = cp.zeros((num_bodies, 3), dtype=cp.float32)
+        self.masses = cp.random.rand(num_bodies, dtype=cp.float32) * 1e24
+
+    def compute_forces(self):
+        # The same tiles as `CPUNBodySimulation.compute_forces`, with one
+        # (B, N) array per axis instead of a (B, N, 3) one
+        n = self.num_bodies
+        x, y, z = (cp.ascontiguousarray(self.positions[:, k]) for k in range(3))
+        g_masses = cp.float32(G) * self.masses
+        cutoff_sq = cp.float32(self.cutoff_distance ** 2)
+        total_forces = cp.empty((n, 3), dtype=cp.float32)
+
+        for i0 in range(0, n, self.TILE_ROWS):
+            i1 = min(i0 + self.TILE_ROWS, n)
+            dx = x[i0:i1, cp.newaxis] - x[cp.newaxis, :]
+            dy = y[i0:i1, cp.newaxis] - y[cp.newaxis, :]
+            dz = z[i0:i1, cp.newaxis] - z[cp.newaxis, :]
+            weights = _pair_weights(dx, dy, dz, g_masses[i0:i1, cp.newaxis],
+                                    self.masses[cp.newaxis, :], cutoff_sq)
+            total_forces[i0:i1, 0] = cp.sum(weights * dx, axis=1)
+            total_forces[i0:i1, 1] = cp.sum(weights * dy, axis=1)
+            total_forces[i0:i1, 2] = cp.sum(weights * dz, axis=1)
 
         return total_forces
 
@@ -47,8 +169,8 @@ class CPUNBodySimulation:
         forces = self.compute_forces()
 
         # Update velocities and positions
-        self.velocities += forces / self.masses[:, np.newaxis] * self.dt
-        self.positions += self.velocities * self.dt
+        self.positions, self.velocities = _integrate(
+            self.positions, self.velocities, forces, self.masses[:, cp.newaxis], cp.float32(self.dt))
 
     def simulate(self, num_steps):
         start_time = time.time()
@@ -56,13 +178,15 @@ class CPUNBodySimulation:
         for step in range(num_steps):
             self.update()
 
+        # Wait for the queued kernels before stopping the clock
+        cp.cuda.Stream.null.synchronize()
         end_time = time.time()
         return end_time - start_time
 
 
 # Benchmark the simulation to see how many bodies can be simulated at 60 FPS
-def benchmark_simulation(num_bodies, cutoff_distance, duration=10):
-    sim = CPUNBodySimulation(num_bodies, cutoff_distance)
+def benchmark_simulation(num_bodies, cutoff_distance, duration=10, simulation=CPUNBodySimulation):
+    sim = simulation(num_bodies, cutoff_distance)
 
     # Assume we need to run for 60 FPS for `duration` seconds
     num_steps = int(TARGET_FPS * duration)
@@ -80,8 +204,12 @@ def benchmark_simulation(num_bodies, cutoff_distance, duration=10):
 bodies_list = [1000, 5000, 10000, 20000]
 cutoff_distance = 50.0  # Example cutoff distance for local interactions
 
-for num_bodies in bodies_list:
-    fps = benchmark_simulation(num_bodies, cutoff_distance)
-    if fps < TARGET_FPS:
-        print(f"Cannot simulate {num_bodies} bodies at 60 FPS. Stopping.")
-        break
+simulations = [CPUNBodySimulation] + ([CuPyNBodySimulation] if cp is not None else [])
+
+for simulation in simulations:
+    print(f"{simulation.__name__}:")
+    for num_bodies in bodies_list:
+        fps = benchmark_simulation(num_bodies, cutoff_distance, simulation=simulation)
+        if fps < TARGET_FPS:
+            print(f"Cannot simulate {num_bodies} bodies at 60 FPS. Stopping.")
+            break
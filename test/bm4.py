@@ -1,6 +1,6 @@
 import numpy as np
 import time
-from numba import jit, prange
+from numba import njit, prange, get_num_threads
 
 # Gravitational constant
 G = 6.67430e-11
@@ -8,62 +8,303 @@ G = 6.67430e-11
 # Number of frames per second
 TARGET_FPS = 60
 
+# The positions and forces are stored as (3, N) arrays, one contiguous row
+# per axis (structure of arrays), so that the inner loops read consecutive
+# bodies from consecutive memory.
+
+# The kernels are cached on disk (cache=True), so only the first run of the
+# script compiles them; later runs load the machine code.
+
+@njit(parallel=True, fastmath=True, boundscheck=False, cache=True)
+def _compute_forces(positions, masses, num_bodies, cutoff_distance, local_forces):
+    # Each pair is visited once (j > i) and its force is added to body `i`
+    # and subtracted from body `j` (Newton's third law). The threads write to
+    # their own force buffers, summed at the end, so no two threads add to
+    # the same row. Thread `t` takes rows t, t + T, t + 2T, ... so that the
+    # shrinking rows of the triangle are spread evenly over the threads.
+    num_threads = local_forces.shape[0]
+    cutoff_sq = cutoff_distance * cutoff_distance
+
+    for t in prange(num_threads):
+        forces = local_forces[t]
+        for i in range(t, num_bodies, num_threads):
+            xi = positions[0, i]
+            yi = positions[1, i]
+            zi = positions[2, i]
+            mi = G * masses[i]
+            fxi = 0.0
+            fyi = 0.0
+            fzi = 0.0
+
+            for j in range(i + 1, num_bodies):
+                # Calculate the difference in positions
+                dx = positions[0, j] - xi
+                dy = positions[1, j] - yi
+                dz = positions[2, j] - zi
+
+                # Calculate the squared distance
+                dist_sq = dx * dx + dy * dy + dz * dz + 1e-10  # Add epsilon to avoid division by zero
+
+                # Gravitational force calculation: F = G * (m_i * m_j / r^2) * (r_ij / |r_ij|)
+                s = mi * masses[j] / (dist_sq * np.sqrt(dist_sq))
+
+                # Check for local interaction (e.g., repulsion)
+                if dist_sq < cutoff_sq:
+                    s -= 0.1
+
+                fx = s * dx
+                fy = s * dy
+                fz = s * dz
+                fxi += fx
+                fyi += fy
+                fzi += fz
+                forces[0, j] -= fx
+                forces[1, j] -= fy
+                forces[2, j] -= fz
+
+            forces[0, i] += fxi
+            forces[1, i] += fyi
+            forces[2, i] += fzi
+
+    return local_forces.sum(axis=0)
+
 # Standalone function for computing forces
-@jit(nopython=True, parallel=True)
 def compute_forces(positions, masses, num_bodies, cutoff_distance):
-    total_forces = np.zeros((num_bodies, 3))  # Initialize forces for each body to zero
+    # The per-thread buffers are allocated here rather than in the kernel,
+    # since a kernel that calls get_num_threads cannot be cached
+    local_forces = np.zeros((get_num_threads(), 3, num_bodies))
+    return _compute_forces(positions, masses, num_bodies, cutoff_distance, local_forces)
 
-    for i in prange(num_bodies):
-        force_i = np.zeros(3)  # Force acting on body `i`
-        
-        for j in range(num_bodies):
-            if i == j:
-                continue  # Skip self-interaction
+# Barnes-Hut octree
+# -----------------
+# The tree is stored as flat arrays, one entry per node. The bodies of each
+# node are the contiguous range perm[start:end] of a permutation of the
+# bodies, and the children of a node are the contiguous range of nodes
+# child_first .. child_first + child_count - 1 (no children for a leaf).
+
+# Most bodies in a leaf, and the deepest level (so that bodies at the same
+# position do not split forever)
+LEAF_SIZE = 8
+MAX_DEPTH = 32
 
-            # Calculate the difference in positions
-            delta_pos = positions[j] - positions[i]
+@njit(cache=True)
+def _grow(a, capacity):
+    b = np.empty((capacity,) + a.shape[1:], dtype=a.dtype)
+    b[:a.shape[0]] = a
+    return b
 
-            # Calculate the squared distance
-            dist_sq = np.sum(delta_pos ** 2) + 1e-10  # Add epsilon to avoid division by zero
-            dist = np.sqrt(dist_sq)
+@njit(cache=True)
+def build_octree(positions, masses, leaf_size=LEAF_SIZE):
+    n = positions.shape[1]
+    perm = np.arange(n)
+    capacity = max(64, 2 * n // leaf_size)
+    center = np.empty((capacity, 3))
+    half = np.empty(capacity)
+    com = np.zeros((capacity, 3))
+    mass = np.zeros(capacity)
+    start = np.empty(capacity, dtype=np.int64)
+    end = np.empty(capacity, dtype=np.int64)
+    depth = np.empty(capacity, dtype=np.int64)
+    child_first = np.zeros(capacity, dtype=np.int64)
+    child_count = np.zeros(capacity, dtype=np.int64)
 
-            # Calculate inverse of distance cube
-            inv_dist_cube = 1.0 / (dist_sq * dist)
+    # Root: the bounding cube of the bodies
+    lo = np.empty(3)
+    hi = np.empty(3)
+    for k in range(3):
+        lo[k] = positions[k].min()
+        hi[k] = positions[k].max()
+    half[0] = 0.5 * (hi - lo).max() * 1.0001 + 1e-9
+    center[0] = 0.5 * (lo + hi)
+    start[0] = 0
+    end[0] = n
+    depth[0] = 0
+    num_nodes = 1
 
-            # Gravitational force calculation: F = G * (m_i * m_j / r^2) * (r_ij / |r_ij|)
-            force = G * masses[i] * masses[j] * inv_dist_cube * delta_pos
+    octant = np.empty(n, dtype=np.int64)
+    scratch = np.empty(n, dtype=np.int64)
 
-            # Add the force from body `j` to the total force on body `i`
-            force_i += force
+    # Nodes are appended as they are made, so visiting them in order visits
+    # each node after its parent
+    node = 0
+    while node < num_nodes:
+        s = start[node]
+        e = end[node]
 
-            # Check for local interaction (e.g., repulsion)
-            if dist < cutoff_distance:
-                repulsive_force = -0.1 * delta_pos
-                force_i += repulsive_force
-        
-        # Store the total force on body `i`
-        total_forces[i] = force_i
+        # Mass and center of mass
+        m = 0.0
+        cx = cy = cz = 0.0
+        for t in range(s, e):
+            b = perm[t]
+            mb = masses[b]
+            m += mb
+            cx += mb * positions[0, b]
+            cy += mb * positions[1, b]
+            cz += mb * positions[2, b]
+        mass[node] = m
+        if m > 0.0:
+            com[node, 0] = cx / m
+            com[node, 1] = cy / m
+            com[node, 2] = cz / m
+        else:
+            com[node] = center[node]
 
-    return total_forces
+        if e - s > leaf_size and depth[node] < MAX_DEPTH:
+            # Counting sort of the bodies by octant
+            counts = np.zeros(8, dtype=np.int64)
+            for t in range(s, e):
+                b = perm[t]
+                o = ((positions[0, b] > center[node, 0]) |
+                     ((positions[1, b] > center[node, 1]) << 1) |
+                     ((positions[2, b] > center[node, 2]) << 2))
+                octant[t] = o
+                counts[o] += 1
+            offsets = np.empty(8, dtype=np.int64)
+            offset = s
+            for o in range(8):
+                offsets[o] = offset
+                offset += counts[o]
+            fill = offsets.copy()
+            for t in range(s, e):
+                scratch[fill[octant[t]]] = perm[t]
+                fill[octant[t]] += 1
+            perm[s:e] = scratch[s:e]
+
+            # One child per non-empty octant
+            if num_nodes + 8 > capacity:
+                capacity *= 2
+                center = _grow(center, capacity)
+                half = _grow(half, capacity)
+                com = _grow(com, capacity)
+                mass = _grow(mass, capacity)
+                start = _grow(start, capacity)
+                end = _grow(end, capacity)
+                depth = _grow(depth, capacity)
+                child_first = _grow(child_first, capacity)
+                child_count = _grow(child_count, capacity)
+            child_first[node] = num_nodes
+            child_count[node] = 0
+            h = 0.5 * half[node]
+            for o in range(8):
+                if counts[o] == 0:
+                    continue
+                c = num_nodes
+                center[c, 0] = center[node, 0] + (h if o & 1 else -h)
+                center[c, 1] = center[node, 1] + (h if o & 2 else -h)
+                center[c, 2] = center[node, 2] + (h if o & 4 else -h)
+                half[c] = h
+                start[c] = offsets[o]
+                end[c] = offsets[o] + counts[o]
+                depth[c] = depth[node] + 1
+                child_count[c] = 0
+                num_nodes += 1
+                child_count[node] += 1
+        else:
+            child_count[node] = 0
+        node += 1
+
+    return (perm, center[:num_nodes], half[:num_nodes], com[:num_nodes], mass[:num_nodes],
+            start[:num_nodes], end[:num_nodes], child_first[:num_nodes], child_count[:num_nodes])
+
+@njit(parallel=True, fastmath=True, boundscheck=False, cache=True)
+def compute_forces_bh(positions, masses, num_bodies, cutoff_distance, theta=0.5):
+    # Same forces as `compute_forces`, with the gravity of far nodes
+    # approximated by their center of mass. A node is far from a body when
+    # the body is outside its box, its width is below `theta` times the
+    # distance to its center of mass, and no point of its box is within the
+    # cutoff (so the local repulsion, which is exact, never needs the node's
+    # bodies). Otherwise its children are visited; the bodies of a leaf are
+    # visited one by one.
+    perm, center, half, com, mass, start, end, child_first, child_count = build_octree(positions, masses)
+    cutoff_sq = cutoff_distance * cutoff_distance
+    theta_sq = theta * theta
+    forces = np.zeros((3, num_bodies))
+
+    for i in prange(num_bodies):
+        xi = positions[0, i]
+        yi = positions[1, i]
+        zi = positions[2, i]
+        mi = G * masses[i]
+        fxi = 0.0
+        fyi = 0.0
+        fzi = 0.0
+
+        stack = np.empty(8 * MAX_DEPTH + 1, dtype=np.int64)
+        stack[0] = 0
+        top = 1
+        while top > 0:
+            top -= 1
+            node = stack[top]
+
+            if child_count[node] == 0:
+                for t in range(start[node], end[node]):
+                    j = perm[t]
+                    if j == i:
+                        continue
+                    dx = positions[0, j] - xi
+                    dy = positions[1, j] - yi
+                    dz = positions[2, j] - zi
+                    dist_sq = dx * dx + dy * dy + dz * dz + 1e-10
+                    s = mi * masses[j] / (dist_sq * np.sqrt(dist_sq))
+                    if dist_sq < cutoff_sq:
+                        s -= 0.1
+                    fxi += s * dx
+                    fyi += s * dy
+                    fzi += s * dz
+                continue
+
+            # Squared distance from the body to the box of the node
+            h = half[node]
+            bx = max(abs(xi - center[node, 0]) - h, 0.0)
+            by = max(abs(yi - center[node, 1]) - h, 0.0)
+            bz = max(abs(zi - center[node, 2]) - h, 0.0)
+            box_sq = bx * bx + by * by + bz * bz
+
+            dx = com[node, 0] - xi
+            dy = com[node, 1] - yi
+            dz = com[node, 2] - zi
+            dist_sq = dx * dx + dy * dy + dz * dz + 1e-10
+            width = 2.0 * h
+            if box_sq > 0.0 and box_sq >= cutoff_sq and width * width < theta_sq * dist_sq:
+                s = mi * mass[node] / (dist_sq * np.sqrt(dist_sq))
+                fxi += s * dx
+                fyi += s * dy
+                fzi += s * dz
+            else:
+                first = child_first[node]
+                for c in range(first, first + child_count[node]):
+                    stack[top] = c
+                    top += 1
+
+        forces[0, i] = fxi
+        forces[1, i] = fyi
+        forces[2, i] = fzi
+
+    return forces
 
 
 class CPUNBodySimulation:
-    def __init__(self, num_bodies, cutoff_distance, dt=1.0):
+    def __init__(self, num_bodies, cutoff_distance, dt=1.0, theta=None):
         self.num_bodies = num_bodies
         self.cutoff_distance = cutoff_distance
         self.dt = dt
+        # Barnes-Hut opening angle; None computes all the pairs
+        self.theta = theta
 
-        # Initialize random positions, velocities, and masses
-        self.positions = np.random.rand(num_bodies, 3) * 1000.0  # Random positions in a 1000x1000x1000 box
-        self.velocities = np.zeros((num_bodies, 3))  # Initially at rest
+        # Initialize random positions, velocities, and masses, as (3, N) arrays
+        self.positions = np.random.rand(3, num_bodies) * 1000.0  # Random positions in a 1000x1000x1000 box
+        self.velocities = np.zeros((3, num_bodies))  # Initially at rest
         self.masses = np.random.rand(num_bodies) * 1e24  # Random masses between 0 and 1e24 kg
 
     def update(self):
         # Compute forces on all bodies using the standalone function
-        forces = compute_forces(self.positions, self.masses, self.num_bodies, self.cutoff_distance)
+        if self.theta is None:
+            forces = compute_forces(self.positions, self.masses, self.num_bodies, self.cutoff_distance)
+        else:
+            forces = compute_forces_bh(self.positions, self.masses, self.num_bodies, self.cutoff_distance, self.theta)
 
         # Update velocities and positions
-        self.velocities += forces / self.masses[:, np.newaxis] * self.dt
+        self.velocities += forces / self.masses * self.dt
         self.positions += self.velocities * self.dt
 
     def simulate(self, num_steps):
@@ -77,8 +318,12 @@ class CPUNBodySimulation:
 
 
 # Benchmark the simulation to see how many bodies can be simulated at 60 FPS
-def benchmark_simulation(num_bodies, cutoff_distance, duration=10):
-    sim = CPUNBodySimulation(num_bodies, cutoff_distance)
+def benchmark_simulation(num_bodies, cutoff_distance, duration=10, theta=None):
+    sim = CPUNBodySimulation(num_bodies, cutoff_distance, theta=theta)
+
+    # Compile (or load from the cache) the kernels on a tiny simulation with
+    # the same argument types, so that the timing does not include it
+    CPUNBodySimulation(16, cutoff_distance, theta=theta).simulate(1)
 
     # Assume we need to run for 60 FPS for `duration` seconds
     num_steps = int(TARGET_FPS * duration)
@@ -96,8 +341,11 @@ def benchmark_simulation(num_bodies, cutoff_distance, duration=10):
 bodies_list = [2000, 5000, 10000, 20000]
 cutoff_distance = 50.0  # Example cutoff distance for local interactions
 
-for num_bodies in bodies_list:
-    fps = benchmark_simulation(num_bodies, cutoff_distance)
-    if fps < TARGET_FPS:
-        print(f"Cannot simulate {num_bodies} bodies at 60 FPS. Stopping.")
-        break
+# Both force modes: all the pairs (theta None) and Barnes-Hut
+for theta in [None, 0.5]:
+    print("All pairs:" if theta is None else f"Barnes-Hut, theta = {theta}:")
+    for num_bodies in bodies_list:
+        fps = benchmark_simulation(num_bodies, cutoff_distance, theta=theta)
+        if fps < TARGET_FPS:
+            print(f"Cannot simulate {num_bodies} bodies at 60 FPS. Stopping.")
+            break
@@ -1,47 +1,62 @@
 import cupy as cp
 import time
 
-# Gravitational constant
-G = 6.67430e-11
+# Gravitational constant in single precision
+G = cp.float32(6.67430e-11)
 
-# Custom CUDA kernel for force calculation
+# Custom CUDA kernel for force calculation and position/velocity update
 force_kernel = cp.RawKernel(r'''
 extern "C" __global__
-void compute_forces(double* positions, double* velocities, double* masses, double* forces, int num_bodies, double cutoff_distance, double G) {
+void compute_forces(const float* positions, float* positions_out, float* velocities, const float* masses, int num_bodies, float cutoff_sq, float G, float dt) {
     int i = blockIdx.x * blockDim.x + threadIdx.x;
     if (i >= num_bodies) return;
-    
-    double force[3] = {0.0, 0.0, 0.0};
+
+    float pos_i_x = positions[i * 3 + 0];
+    float pos_i_y = positions[i * 3 + 1];
+    float pos_i_z = positions[i * 3 + 2];
+    float G_mass_i = G * masses[i];
+
+    float force_x = 0.0f;
+    float force_y = 0.0f;
+    float force_z = 0.0f;
     for (int j = 0; j < num_bodies; j++) {
         if (i == j) continue;
 
-        double delta_pos[3];
-        for (int k = 0; k < 3; k++) {
-            delta_pos[k] = positions[j * 3 + k] - positions[i * 3 + k];
-        }
+        float dx = positions[j * 3 + 0] - pos_i_x;
+        float dy = positions[j * 3 + 1] - pos_i_y;
+        float dz = positions[j * 3 + 2] - pos_i_z;
 
-        double dist_sq = delta_pos[0] * delta_pos[0] + delta_pos[1] * delta_pos[1] + delta_pos[2] * delta_pos[2] + 1e-10;
-        double dist = sqrt(dist_sq);
-        double inv_dist_cube = 1.0 / (dist_sq * dist);
+        float dist_sq = dx * dx + dy * dy + dz * dz + 1e-10f;
+        float inv_dist = rsqrtf(dist_sq);
+        float inv_dist_cube = inv_dist * inv_dist * inv_dist;
 
         // Gravitational force
-        double force_scalar = G * masses[i] * masses[j] * inv_dist_cube;
-        for (int k = 0; k < 3; k++) {
-            force[k] += force_scalar * delta_pos[k];
-        }
+        float force_scalar = G_mass_i * masses[j] * inv_dist_cube;
 
         // Apply repulsive force if within cutoff distance
-        if (dist < cutoff_distance) {
-            for (int k = 0; k < 3; k++) {
-                force[k] += -0.1 * delta_pos[k];
-            }
+        if (dist_sq < cutoff_sq) {
+            force_scalar += -0.1f;
         }
-    }
 
-    // Write the force back to the global memory
-    for (int k = 0; k < 3; k++) {
-        forces[i * 3 + k] = force[k];
+        force_x += force_scalar * dx;
+        force_y += force_scalar * dy;
+        force_z += force_scalar * dz;
     }
+
+    // Update velocity and position. Only this thread touches body i's
+    // velocity, so it is updated in place; the position goes to a separate
+    // buffer, since other threads are still reading the positions
+    float a_dt = dt / masses[i];
+    float vel_x = velocities[i * 3 + 0] + force_x * a_dt;
+    float vel_y = velocities[i * 3 + 1] + force_y * a_dt;
+    float vel_z = velocities[i * 3 + 2] + force_z * a_dt;
+    velocities[i * 3 + 0] = vel_x;
+    velocities[i * 3 + 1] = vel_y;
+    velocities[i * 3 + 2] = vel_z;
+
+    positions_out[i * 3 + 0] = pos_i_x + vel_x * dt;
+    positions_out[i * 3 + 1] = pos_i_y + vel_y * dt;
+    positions_out[i * 3 + 2] = pos_i_z + vel_z * dt;
 }
 ''', 'compute_forces')
 
@@ -53,31 +68,37 @@ class GPUNBodySimulation:
         self.dt = dt
 
         # Initialize random positions, velocities, and masses on the GPU
-        self.positions = cp.random.rand(num_bodies, 3).astype(cp.float64) * 1000.0
-        self.velocities = cp.zeros((num_bodies, 3), dtype=cp.float64)
-        self.masses = cp.random.rand(num_bodies).astype(cp.float64) * 1e24
-        self.forces = cp.zeros((num_bodies, 3), dtype=cp.float64)
+        self.positions = cp.random.rand(num_bodies, 3).astype(cp.float32) * 1000.0
+        self.velocities = cp.zeros((num_bodies, 3), dtype=cp.float32)
+        self.masses = cp.random.rand(num_bodies).astype(cp.float32) * 1e24
+
+        # The kernel writes the new positions here, then the two are swapped
+        self.next_positions = cp.empty_like(self.positions)
+
+        # The scalar kernel arguments, converted once to the kernel's
+        # parameter types
+        self._num_bodies = cp.int32(num_bodies)
+        self._cutoff_sq = cp.float32(cutoff_distance * cutoff_distance)
+        self._dt = cp.float32(dt)
 
     def compute_forces(self):
-        # Flatten arrays for the kernel
+        # Compute the forces and apply them to the velocities and positions
+        # in one kernel. Flatten arrays for the kernel
         positions_flat = self.positions.ravel()
+        next_positions_flat = self.next_positions.ravel()
         velocities_flat = self.velocities.ravel()
-        forces_flat = self.forces.ravel()
 
         block_size = 256
         grid_size = (self.num_bodies + block_size - 1) // block_size
 
         # Launch the custom CUDA kernel, passing G as an argument
-        force_kernel((grid_size,), (block_size,), (positions_flat, velocities_flat, self.masses, forces_flat, self.num_bodies, self.cutoff_distance, G))
+        force_kernel((grid_size,), (block_size,), (positions_flat, next_positions_flat, velocities_flat, self.masses, self._num_bodies, self._cutoff_sq, G, self._dt))
+        self.positions, self.next_positions = self.next_positions, self.positions
 
     def update(self):
-        # Compute forces on all bodies
+        # Compute forces on all bodies, and update velocities and positions
         self.compute_forces()
 
-        # Update velocities and positions
-        self.velocities += self.forces / self.masses[:, cp.newaxis] * self.dt
-        self.positions += self.velocities * self.dt
-
     def simulate(self, num_steps):
         start_time = time.time()
 
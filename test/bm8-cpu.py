@@ -1,144 +1,224 @@
 import numpy as np
+from numba import njit, prange
 #import cupy as cp
 
-class QuadTreeNode:
-    def __init__(self, x_min, y_min, x_max, y_max):
-        self.x_min = x_min
-        self.y_min = y_min
-        self.x_max = x_max
-        self.y_max = y_max
-        self.center_of_mass = None
-        self.mass = 0
-        self.body = None
-        self.children = [None, None, None, None]  # NW, NE, SW, SE
-
-    def is_leaf(self):
-        return self.body is not None and all(child is None for child in self.children)
-
-
-class QuadTree:
-    def __init__(self, x_min, y_min, x_max, y_max):
-        self.root = QuadTreeNode(x_min, y_min, x_max, y_max)
-
-    def subdivide(self, node):
-        # Create four children for this node
-        x_mid = (node.x_min + node.x_max) / 2
-        y_mid = (node.y_min + node.y_max) / 2
-
-        node.children[0] = QuadTreeNode(node.x_min, y_mid, x_mid, node.y_max)  # NW
-        node.children[1] = QuadTreeNode(x_mid, y_mid, node.x_max, node.y_max)  # NE
-        node.children[2] = QuadTreeNode(node.x_min, node.y_min, x_mid, y_mid)  # SW
-        node.children[3] = QuadTreeNode(x_mid, node.y_min, node.x_max, y_mid)  # SE
-
-    def get_quadrant(self, node, x, y):
-        # Determine which quadrant a body belongs to
-        x_mid = (node.x_min + node.x_max) / 2
-        y_mid = (node.y_min + node.y_max) / 2
-
-        if x <= x_mid and y >= y_mid:
-            return 0  # NW
-        elif x > x_mid and y >= y_mid:
-            return 1  # NE
-        elif x <= x_mid and y < y_mid:
-            return 2  # SW
-        else:
-            return 3  # SE
-        
-    def insert(self, node, body, mass, x, y, depth=0, tolerance=1e-5):
-        if node.is_leaf():
-            if node.body is None:
-                # This node is empty, place the body here
-                node.body = body
-                node.mass = mass
-                node.center_of_mass = (x, y)
+# Barnes-Hut quadtree
+# -------------------
+# The tree is a pool of nodes stored as flat arrays indexed by node ID, with
+# the root at 0:
+#
+#   child      (capacity, 4) int32, the NW, NE, SW, SE children (-1 for none)
+#   bbox       (capacity, 4) float64, x_min, y_min, x_max, y_max
+#   com        (capacity, 2) float64, the center of mass
+#   mass       (capacity,) float64, the total mass
+#   body_idx   (capacity,) int32, the first body of a leaf, EMPTY for an
+#              empty node or INTERNAL for a node with children
+#
+# A leaf holds one body, except at MAX_DEPTH, where the bodies that end up
+# in the same leaf (at the same position) are chained through `next_body`.
+# Nodes are taken from the pool with the `next_free` counter, a length-1
+# array so that the kernels can advance it.
+
+EMPTY = -1
+INTERNAL = -2
+
+# Deepest level of the tree
+MAX_DEPTH = 32
+
+@njit(cache=True)
+def _quadrant(bbox, node, x, y):
+    # Determine which quadrant a point belongs to
+    x_mid = 0.5 * (bbox[node, 0] + bbox[node, 2])
+    y_mid = 0.5 * (bbox[node, 1] + bbox[node, 3])
+    if y >= y_mid:
+        return 0 if x <= x_mid else 1  # NW, NE
+    return 2 if x <= x_mid else 3  # SW, SE
+
+@njit(cache=True)
+def _new_child(child, bbox, com, mass, body_idx, next_free, node, quadrant):
+    # Take a node from the pool for the given quadrant of `node`, or return
+    # -1 if the pool is used up
+    c = next_free[0]
+    if c >= child.shape[0]:
+        return -1
+    next_free[0] = c + 1
+
+    x_min, y_min, x_max, y_max = bbox[node, 0], bbox[node, 1], bbox[node, 2], bbox[node, 3]
+    x_mid = 0.5 * (x_min + x_max)
+    y_mid = 0.5 * (y_min + y_max)
+    if quadrant == 0 or quadrant == 2:
+        bbox[c, 0] = x_min
+        bbox[c, 2] = x_mid
+    else:
+        bbox[c, 0] = x_mid
+        bbox[c, 2] = x_max
+    if quadrant < 2:
+        bbox[c, 1] = y_mid
+        bbox[c, 3] = y_max
+    else:
+        bbox[c, 1] = y_min
+        bbox[c, 3] = y_mid
+
+    child[c, :] = -1
+    com[c, 0] = 0.0
+    com[c, 1] = 0.0
+    mass[c] = 0.0
+    body_idx[c] = EMPTY
+    child[node, quadrant] = c
+    return c
+
+@njit(cache=True)
+def bh_insert(child, bbox, com, mass, body_idx, next_body, next_free, i, px, py, pm, max_depth):
+    # Insert body `i` at (px, py) with mass `pm`, walking down from the root
+    # and adding the body to the mass and center of mass of every node on
+    # the way. Returns False if the pool ran out of nodes.
+    node = 0
+    depth = 0
+    while True:
+        b = body_idx[node]
+        if b == EMPTY:
+            body_idx[node] = i
+            com[node, 0] = px
+            com[node, 1] = py
+            mass[node] = pm
+            return True
+
+        if b >= 0:
+            if depth >= max_depth:
+                # Too deep to split: chain the body to the leaf
+                next_body[i] = b
+                body_idx[node] = i
             else:
-                # Check if the new body is in the same position as the existing body
-                if np.isclose(node.center_of_mass[0], x, atol=tolerance) and np.isclose(node.center_of_mass[1], y, atol=tolerance):
-                    # Same position, handle degenerate case by adding jitter or stopping subdivision
-                    x += tolerance
-                    y += tolerance
-
-                # If there's already a body, and depth limit is reached, stop subdividing
-                if depth >= self.max_depth:
-                    # Stop subdividing and handle bodies in this node
-                    if node.bodies is None:
-                        node.bodies = [(node.body, node.mass, node.center_of_mass)]
-                    node.bodies.append((body, mass, (x, y)))
-                else:
-                    # Subdivide and reinsert bodies
-                    self.subdivide(node)
-                    # Re-insert the existing body into one of the children
-                    quadrant = self.get_quadrant(node, node.center_of_mass[0], node.center_of_mass[1])
-                    if node.children[quadrant] is None:
-                        node.children[quadrant] = self.create_new_child(node, quadrant)
-                    self.insert(node.children[quadrant], node.body, node.mass, node.center_of_mass[0], node.center_of_mass[1], depth + 1)
-
-                    # Insert the new body
-                    quadrant = self.get_quadrant(node, x, y)
-                    if node.children[quadrant] is None:
-                        node.children[quadrant] = self.create_new_child(node, quadrant)
-                    self.insert(node.children[quadrant], body, mass, x, y, depth + 1)
-        else:
-            # Insert into one of the children quadrants
-            quadrant = self.get_quadrant(node, x, y)
-            if node.children[quadrant] is None:
-                node.children[quadrant] = self.create_new_child(node, quadrant)
-            self.insert(node.children[quadrant], body, mass, x, y, depth + 1)
-
-        # Update the mass and center of mass of the current node
-        total_mass = node.mass + mass
-        node.center_of_mass = (
-            (node.center_of_mass[0] * node.mass + x * mass) / total_mass,
-            (node.center_of_mass[1] * node.mass + y * mass) / total_mass
-        )
-        node.mass = total_mass
-
-    def create_new_child(self, node, quadrant):
-        # Create a new QuadTreeNode in the correct quadrant
-        x_mid = (node.x_min + node.x_max) / 2
-        y_mid = (node.y_min + node.y_max) / 2
-
-        if quadrant == 0:  # NW
-            return QuadTreeNode(node.x_min, y_mid, x_mid, node.y_max)
-        elif quadrant == 1:  # NE
-            return QuadTreeNode(x_mid, y_mid, node.x_max, node.y_max)
-        elif quadrant == 2:  # SW
-            return QuadTreeNode(node.x_min, node.y_min, x_mid, y_mid)
-        else:  # SE
-            return QuadTreeNode(x_mid, node.y_min, node.x_max, y_mid)
-
-        
-    def calculate_force(self, body_x, body_y, body_mass, theta, G):
-        return self._calculate_force_recursive(self.root, body_x, body_y, body_mass, theta, G)
-
-    def _calculate_force_recursive(self, node, body_x, body_y, body_mass, theta, G):
-        if node.is_leaf() and node.body is None:
-            # No force contribution from an empty node
-            return np.array([0.0, 0.0])
-
-        dx = node.center_of_mass[0] - body_x
-        dy = node.center_of_mass[1] - body_y
-        dist_sq = dx * dx + dy * dy
-        dist = np.sqrt(dist_sq + 1e-10)  # Avoid division by zero
+                # Split the leaf, moving its body down to a child. A leaf
+                # above MAX_DEPTH holds one body, at its center of mass.
+                bx = com[node, 0]
+                by = com[node, 1]
+                c = _new_child(child, bbox, com, mass, body_idx, next_free, node,
+                               _quadrant(bbox, node, bx, by))
+                if c < 0:
+                    return False
+                body_idx[c] = b
+                com[c, 0] = bx
+                com[c, 1] = by
+                mass[c] = mass[node]
+                body_idx[node] = INTERNAL
+
+        # Update the mass and center of mass of the node
+        m = mass[node]
+        total_mass = m + pm
+        if total_mass > 0.0:
+            com[node, 0] = (com[node, 0] * m + px * pm) / total_mass
+            com[node, 1] = (com[node, 1] * m + py * pm) / total_mass
+        mass[node] = total_mass
+
+        if body_idx[node] >= 0:
+            return True
+
+        # Insert into one of the children quadrants
+        quadrant = _quadrant(bbox, node, px, py)
+        c = child[node, quadrant]
+        if c < 0:
+            c = _new_child(child, bbox, com, mass, body_idx, next_free, node, quadrant)
+            if c < 0:
+                return False
+        node = c
+        depth += 1
+
+@njit(cache=True)
+def build_quadtree(positions, masses, x_min, y_min, size,
+                   child, bbox, com, mass, body_idx, next_body, next_free):
+    # Insert all the bodies into an empty tree with a square root of side
+    # `size`. Returns False if the pool ran out of nodes.
+    next_free[0] = 1
+    child[0, :] = -1
+    bbox[0, 0] = x_min
+    bbox[0, 1] = y_min
+    bbox[0, 2] = x_min + size
+    bbox[0, 3] = y_min + size
+    com[0, 0] = 0.0
+    com[0, 1] = 0.0
+    mass[0] = 0.0
+    body_idx[0] = EMPTY
+    next_body[:] = -1
+
+    for i in range(positions.shape[0]):
+        if not bh_insert(child, bbox, com, mass, body_idx, next_body, next_free,
+                         i, positions[i, 0], positions[i, 1], masses[i], MAX_DEPTH):
+            return False
+    return True
+
+@njit(fastmath=True, boundscheck=False, cache=True)
+def bh_force(i, px, py, pm, theta, G, positions, masses,
+             child, bbox, com, mass, body_idx, next_body):
+    # Force on body `i` from the tree. A node is approximated by its center
+    # of mass when the body is outside its box and its size is below `theta`
+    # times the distance to it, the bodies of a leaf are visited one by one,
+    # and anything else is opened. A node containing the body is always
+    # opened: its center of mass can be almost on top of the body (deep
+    # nodes around coincident bodies), and rounding would turn its mass into
+    # a large self-force.
+    theta_sq = theta * theta
+    fx = 0.0
+    fy = 0.0
+
+    stack = np.empty(4 * MAX_DEPTH + 1, dtype=np.int32)
+    stack[0] = 0
+    top = 1
+    while top > 0:
+        top -= 1
+        node = stack[top]
+        b = body_idx[node]
+
+        if b >= 0:
+            j = b
+            while j >= 0:
+                if j != i:
+                    dx = positions[j, 0] - px
+                    dy = positions[j, 1] - py
+                    dist_sq = dx * dx + dy * dy + 1e-10  # Avoid division by zero
+                    s = G * masses[j] * pm / (dist_sq * np.sqrt(dist_sq))
+                    fx += s * dx
+                    fy += s * dy
+                j = next_body[j]
+            continue
+
+        if b == EMPTY:
+            continue
+
+        dx = com[node, 0] - px
+        dy = com[node, 1] - py
+        dist_sq = dx * dx + dy * dy + 1e-10
 
         # Size of the quadrant
-        s = max(node.x_max - node.x_min, node.y_max - node.y_min)
-
-        # If the node is far enough, approximate as a single mass
-        if s / dist < theta:
-            force_magnitude = G * node.mass * body_mass / (dist_sq + 1e-10)
-            force = np.array([force_magnitude * dx / dist, force_magnitude * dy / dist])
-            return force
-
-        # Otherwise, recurse into children
-        total_force = np.array([0.0, 0.0])
-        for child in node.children:
-            if child is not None:
-                total_force += self._calculate_force_recursive(child, body_x, body_y, body_mass, theta, G)
-
-        return total_force
+        size = max(bbox[node, 2] - bbox[node, 0], bbox[node, 3] - bbox[node, 1])
+
+        # Squared distance from the body to the box of the node
+        bx = max(bbox[node, 0] - px, px - bbox[node, 2], 0.0)
+        by = max(bbox[node, 1] - py, py - bbox[node, 3], 0.0)
+        box_sq = bx * bx + by * by
+
+        # If the node is far enough, approximate it as a single mass
+        if box_sq > 0.0 and size * size < theta_sq * dist_sq:
+            s = G * mass[node] * pm / (dist_sq * np.sqrt(dist_sq))
+            fx += s * dx
+            fy += s * dy
+        else:
+            for q in range(4):
+                c = child[node, q]
+                if c >= 0:
+                    stack[top] = c
+                    top += 1
 
+    return fx, fy
 
+@njit(parallel=True, cache=True)
+def bh_forces(positions, masses, theta, G, child, bbox, com, mass, body_idx, next_body, forces):
+    # The tree is only read here, so the bodies are walked in parallel
+    for i in prange(positions.shape[0]):
+        fx, fy = bh_force(i, positions[i, 0], positions[i, 1], masses[i], theta, G, positions, masses,
+                          child, bbox, com, mass, body_idx, next_body)
+        forces[i, 0] = fx
+        forces[i, 1] = fy
 
 
 class GPUNBodySimulation:
@@ -146,6 +226,7 @@ class GPUNBodySimulation:
         self.num_bodies = num_bodies
         self.cutoff_distance = cutoff_distance
         self.dt = dt
+        # Barnes-Hut opening angle; None computes all the pairs
         self.theta = theta
 
         # Initialize random positions, velocities, and masses on the GPU
@@ -154,18 +235,70 @@ class GPUNBodySimulation:
         self.masses = np.random.rand(num_bodies) * 1e24
         self.forces = np.zeros((num_bodies, 2))
 
-        # Initialize QuadTree
-        self.quad_tree = QuadTree(0, 0, 1000, 1000)
+        if theta is None:
+            # (N, N) buffers for the pairwise differences and weights of the
+            # direct sum, allocated once instead of on every step. dx and dy
+            # are the two halves of one (2, N, N) array, so that r^2 is a
+            # single einsum over it.
+            self.delta = np.empty((2, num_bodies, num_bodies))
+            self.dx, self.dy = self.delta
+            self.inv_r3 = np.empty((num_bodies, num_bodies))
+        else:
+            # Pool of quadtree nodes, reused by every step
+            self.allocate_tree(8 * num_bodies)
+
+    def compute_forces_numpy(self, G):
+        # All the pairs at once: F_i = G * m_i * sum_j m_j * r_ij / |r_ij|^3,
+        # with r_ij = x_j - x_i. subtract.outer gives x_i - x_j, so the sum
+        # is negated. Self-pairs have a zero difference and add no force.
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
+        dx, dy, inv_r3 = self.dx, self.dy, self.inv_r3
+        np.subtract.outer(x, x, out=dx)
+        np.subtract.outer(y, y, out=dy)
+
+        # m_j / (r^2 + eps)^1.5, in place
+        np.einsum('kij,kij->ij', self.delta, self.delta, out=inv_r3)
+        inv_r3 += 1e-10
+        np.power(inv_r3, -1.5, out=inv_r3)
+        inv_r3 *= self.masses[np.newaxis, :]
+
+        g_masses = -G * self.masses
+        self.forces[:, 0] = g_masses * np.einsum('ij,ij->i', inv_r3, dx)
+        self.forces[:, 1] = g_masses * np.einsum('ij,ij->i', inv_r3, dy)
+
+    def allocate_tree(self, capacity):
+        # The node arrays of the quadtree. Nodes are initialized as they are
+        # taken from the pool, so rebuilding the tree only resets the root
+        # and the `next_free` counter, and no step allocates anything
+        # unless the pool runs out.
+        self.child = np.empty((capacity, 4), dtype=np.int32)
+        self.bbox = np.empty((capacity, 4))
+        self.com = np.empty((capacity, 2))
+        self.mass = np.empty(capacity)
+        self.body_idx = np.empty(capacity, dtype=np.int32)
+        self.next_body = np.empty(self.num_bodies, dtype=np.int32)
+        self.next_free = np.zeros(1, dtype=np.int64)
 
     def compute_forces(self, G):
-        # Insert bodies into the QuadTree
-        self.quad_tree = QuadTree(0, 0, 1000, 1000)
-        for i in range(self.num_bodies):
-            self.quad_tree.insert(self.quad_tree.root, i, self.masses[i], self.positions[i, 0], self.positions[i, 1])
+        if self.theta is None:
+            self.compute_forces_numpy(G)
+            return
+
+        # Insert bodies into the quadtree, with a root square around all of
+        # them. If the pool runs out of nodes, it is doubled and the tree
+        # rebuilt; the bigger pool is kept for the next steps.
+        x_min, y_min = self.positions.min(axis=0)
+        x_max, y_max = self.positions.max(axis=0)
+        size = max(x_max - x_min, y_max - y_min) * 1.0001 + 1e-9
+        while not build_quadtree(self.positions, self.masses, x_min, y_min, size,
+                                 self.child, self.bbox, self.com, self.mass,
+                                 self.body_idx, self.next_body, self.next_free):
+            self.allocate_tree(2 * len(self.child))
 
         # Compute forces using Barnes-Hut
-        for i in range(self.num_bodies):
-            self.forces[i] = self.quad_tree.calculate_force(self.positions[i, 0], self.positions[i, 1], self.masses[i], self.theta, G)
+        bh_forces(self.positions, self.masses, self.theta, G,
+                  self.child, self.bbox, self.com, self.mass, self.body_idx, self.next_body, self.forces)
 
     def update(self, G):
         # Compute forces on all bodies
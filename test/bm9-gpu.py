@@ -2,71 +2,106 @@ import cupy as cp
 import numpy as np
 import time
 
-# Gravitational constant
-G = 6.67430e-11
+# Gravitational constant in single precision
+G = cp.float32(6.67430e-11)
 
-# Combined CUDA kernel for force computation and position/velocity update
+# Threads per block, and bodies per tile of the kernel
+BLOCK_SIZE = 128
+
+# Combined CUDA kernel for force computation and position/velocity update.
+# Each block walks over the bodies in tiles of BLOCK_SIZE: the threads load
+# one body each into shared memory, and every thread then reads the whole
+# tile from there, so each position is read from global memory once per
+# block instead of once per thread.
 combined_kernel = cp.RawKernel(r'''
+#define BLOCK_SIZE %d
+
 extern "C" __global__
-void compute_and_update(double* positions, double* velocities, double* masses, int num_bodies, double cutoff_distance, double G, double dt) {
+void compute_and_update(const float* positions, float* positions_out, float* velocities, const float* masses,
+                        int num_bodies, float cutoff_sq, float G, float dt) {
+    __shared__ float sh_pos[BLOCK_SIZE][3];
+    __shared__ float sh_mass[BLOCK_SIZE];
+
     int i = blockIdx.x * blockDim.x + threadIdx.x;
-    if (i >= num_bodies) return;
-    
-    double force_i[3] = {0.0, 0.0, 0.0};
-    double pos_i[3];
-    double mass_i = masses[i];
+
+    // Threads past the last body still load their share of every tile
+    bool active = i < num_bodies;
+    int k = active ? i : 0;
+    float force_i[3] = {0.0f, 0.0f, 0.0f};
+    float pos_i[3];
+    float mass_i = masses[k];
+    float G_mass_i = G * mass_i;
 
     // Load position of body i
-    pos_i[0] = positions[i * 3 + 0];
-    pos_i[1] = positions[i * 3 + 1];
-    pos_i[2] = positions[i * 3 + 2];
-
-    for (int j = 0; j < num_bodies; j++) {
-        if (i == j) continue;
-
-        double delta_pos[3];
-        double pos_j[3];
-
-        // Load position of body j
-        pos_j[0] = positions[j * 3 + 0];
-        pos_j[1] = positions[j * 3 + 1];
-        pos_j[2] = positions[j * 3 + 2];
-
-        // Calculate the difference in positions
-        delta_pos[0] = pos_j[0] - pos_i[0];
-        delta_pos[1] = pos_j[1] - pos_i[1];
-        delta_pos[2] = pos_j[2] - pos_i[2];
-
-        // Calculate the squared distance
-        double dist_sq = delta_pos[0] * delta_pos[0] + delta_pos[1] * delta_pos[1] + delta_pos[2] * delta_pos[2] + 1e-10;
-        double dist = sqrt(dist_sq);
-        double inv_dist_cube = 1.0 / (dist_sq * dist);
-
-        // Gravitational force
-        double mass_j = masses[j];
-        double force_scalar = G * mass_i * mass_j * inv_dist_cube;
-        force_i[0] += force_scalar * delta_pos[0];
-        force_i[1] += force_scalar * delta_pos[1];
-        force_i[2] += force_scalar * delta_pos[2];
-
-        // Apply repulsive force if within cutoff distance
-        if (dist < cutoff_distance) {
-            force_i[0] += -0.1 * delta_pos[0];
-            force_i[1] += -0.1 * delta_pos[1];
-            force_i[2] += -0.1 * delta_pos[2];
+    pos_i[0] = positions[k * 3 + 0];
+    pos_i[1] = positions[k * 3 + 1];
+    pos_i[2] = positions[k * 3 + 2];
+
+    for (int tile = 0; tile < gridDim.x; tile++) {
+        // Past the last body, the tile is padded with massless ghost bodies
+        // far away, which add neither gravity nor repulsion, so the inner
+        // loop needs no bounds check
+        int j = tile * BLOCK_SIZE + threadIdx.x;
+        if (j < num_bodies) {
+            sh_pos[threadIdx.x][0] = positions[j * 3 + 0];
+            sh_pos[threadIdx.x][1] = positions[j * 3 + 1];
+            sh_pos[threadIdx.x][2] = positions[j * 3 + 2];
+            sh_mass[threadIdx.x] = masses[j];
+        } else {
+            sh_pos[threadIdx.x][0] = 1e18f;
+            sh_pos[threadIdx.x][1] = 1e18f;
+            sh_pos[threadIdx.x][2] = 1e18f;
+            sh_mass[threadIdx.x] = 0.0f;
         }
+        __syncthreads();
+
+        #pragma unroll 8
+        for (int b = 0; b < BLOCK_SIZE; b++) {
+            float delta_pos[3];
+
+            // Calculate the difference in positions
+            delta_pos[0] = sh_pos[b][0] - pos_i[0];
+            delta_pos[1] = sh_pos[b][1] - pos_i[1];
+            delta_pos[2] = sh_pos[b][2] - pos_i[2];
+
+            // Calculate the squared distance, and 1 / r^3 from a single
+            // reciprocal square root
+            float r_sq = delta_pos[0] * delta_pos[0] + delta_pos[1] * delta_pos[1] + delta_pos[2] * delta_pos[2];
+            float dist_sq = r_sq + 1e-10f;
+            float inv_dist = rsqrtf(dist_sq);
+            float inv_dist_cube = inv_dist * inv_dist * inv_dist;
+
+            // Gravitational force. In single precision, G * m_i * m_j / r^3
+            // overflows for body i itself (and any body at the same
+            // position), and inf * 0 is not 0, so pairs with a zero
+            // delta_pos are selected out: they add no force.
+            float force_scalar = (r_sq > 0.0f) ? G_mass_i * sh_mass[b] * inv_dist_cube : 0.0f;
+
+            // Apply repulsive force if within cutoff distance
+            if (dist_sq < cutoff_sq) {
+                force_scalar -= 0.1f;
+            }
+
+            force_i[0] += force_scalar * delta_pos[0];
+            force_i[1] += force_scalar * delta_pos[1];
+            force_i[2] += force_scalar * delta_pos[2];
+        }
+        __syncthreads();
     }
 
-    // Update velocity and position of body i
+    if (!active) return;
+
+    // Update velocity and position of body i. The positions go into the
+    // output buffer, since other blocks are still reading the old ones.
     velocities[i * 3 + 0] += (force_i[0] / mass_i) * dt;
     velocities[i * 3 + 1] += (force_i[1] / mass_i) * dt;
     velocities[i * 3 + 2] += (force_i[2] / mass_i) * dt;
 
-    positions[i * 3 + 0] += velocities[i * 3 + 0] * dt;
-    positions[i * 3 + 1] += velocities[i * 3 + 1] * dt;
-    positions[i * 3 + 2] += velocities[i * 3 + 2] * dt;
+    positions_out[i * 3 + 0] = pos_i[0] + velocities[i * 3 + 0] * dt;
+    positions_out[i * 3 + 1] = pos_i[1] + velocities[i * 3 + 1] * dt;
+    positions_out[i * 3 + 2] = pos_i[2] + velocities[i * 3 + 2] * dt;
 }
-''', 'compute_and_update')
+''' % BLOCK_SIZE, 'compute_and_update')
 
 
 class GPUNBodySimulation:
@@ -78,21 +113,34 @@ class GPUNBodySimulation:
         self.count = 0
 
         # Initialize random positions, velocities, and masses on the GPU
-        self.positions = cp.random.rand(num_bodies, 3).astype(cp.float64) * 1000.0
-        self.velocities = cp.zeros((num_bodies, 3), dtype=cp.float64)
-        self.masses = cp.random.rand(num_bodies).astype(cp.float64) * 1e24
+        self.positions = cp.random.rand(num_bodies, 3).astype(cp.float32) * 1000.0
+        self.velocities = cp.zeros((num_bodies, 3), dtype=cp.float32)
+        self.masses = cp.random.rand(num_bodies).astype(cp.float32) * 1e24
+
+        # The kernel writes the new positions here, and the two buffers are
+        # swapped after each step
+        self.next_positions = cp.empty_like(self.positions)
+
+        # The scalar kernel arguments, converted once to the kernel's
+        # parameter types
+        self._num_bodies = cp.int32(num_bodies)
+        self._cutoff_sq = cp.float32(cutoff_distance ** 2)
+        self._dt = cp.float32(dt)
 
     def step(self):
         # Flatten arrays for the kernel
         positions_flat = self.positions.ravel()
+        next_positions_flat = self.next_positions.ravel()
         velocities_flat = self.velocities.ravel()
 
-        block_size = 128
-        grid_size = (self.num_bodies + block_size - 1) // block_size
+        # The kernel's tiles are one block wide
+        grid_size = (self.num_bodies + BLOCK_SIZE - 1) // BLOCK_SIZE
 
         # Launch the combined kernel
-        combined_kernel((grid_size,), (block_size,), 
-                        (positions_flat, velocities_flat, self.masses, self.num_bodies, self.cutoff_distance, G, self.dt))
+        combined_kernel((grid_size,), (BLOCK_SIZE,),
+                        (positions_flat, next_positions_flat, velocities_flat, self.masses,
+                         self._num_bodies, self._cutoff_sq, G, self._dt))
+        self.positions, self.next_positions = self.next_positions, self.positions
         
     def print_fastest_body(self, velocities):
         max_speed = 0.0
@@ -9,8 +9,7 @@ def numpy_test(size):
 
     # Start timing
     start_time = time.time()
-    c = a * b  # Element-wise multiplication
-    cp.cuda.Stream.null.synchronize()  # Ensure computation is finished
+    c = a * b  # Element-wise multiplication (synchronous on the CPU)
     end_time = time.time()
 
     print(f"NumPy (CPU) computation time: {end_time - start_time:.5f} seconds")
@@ -20,6 +19,11 @@ def cupy_test(size):
     a = cp.random.rand(size, size, dtype=cp.float32)
     b = cp.random.rand(size, size, dtype=cp.float32)
 
+    # Warm up, so that the kernel compilation and the random number
+    # generation are not timed
+    c = a * b
+    cp.cuda.Stream.null.synchronize()
+
     # Start timing
     start_time = time.time()
     c = a * b  # Element-wise multiplication
@@ -0,0 +1,72 @@
+"""
+Compiled scalar versions of the circle overlap measures of
+`utils.circle_tools.CircleTools`, and of the point distances of
+`utils.utils`, taking plain floats so that they can be called on values read
+from the structure-of-arrays snapshots as well as from other compiled code.
+
+The functions are compiled eagerly with explicit signatures, so the
+compilation (or the load from the on-disk cache) happens when this module is
+imported instead of on the first call in the middle of a time step.
+"""
+import math
+
+try:
+    from numba import njit, float64
+except ImportError:
+    njit = None
+
+HAS_NUMBA = njit is not None
+
+if HAS_NUMBA:
+
+    @njit(float64(float64, float64, float64), cache=True, fastmath=True)
+    def intersection_area(r1, r2, d):
+        """
+        See `CircleTools.intersection_area`. The arguments of `acos` and
+        `sqrt` are clipped against rounding near tangency.
+        """
+        if d >= r1 + r2:
+            return 0.0
+        if d <= abs(r1 - r2):
+            r = min(r1, r2)
+            return math.pi * r * r
+        c1 = min(1.0, max(-1.0, (d * d + r1 * r1 - r2 * r2) / (2 * d * r1)))
+        c2 = min(1.0, max(-1.0, (d * d + r2 * r2 - r1 * r1) / (2 * d * r2)))
+        p3 = 0.5 * math.sqrt(max(0.0, (-d + r1 + r2) * (d + r1 - r2) *
+                                      (d - r1 + r2) * (d + r1 + r2)))
+        return r1 * r1 * math.acos(c1) + r2 * r2 * math.acos(c2) - p3
+
+    @njit(float64(float64, float64, float64), cache=True, fastmath=True)
+    def chord_length(r1, r2, d):
+        """
+        See `CircleTools.chord_length`.
+        """
+        if r1 + r2 < d or d <= abs(r2 - r1):
+            return 0.0
+        part = (d * d + r1 * r1 - r2 * r2) / (2 * d)
+        return 2 * math.sqrt(max(0.0, r1 * r1 - part * part))
+
+    @njit(float64(float64, float64, float64), cache=True, fastmath=True)
+    def penetration_depth(r1, r2, d):
+        """
+        See `CircleTools.penetration_depth`.
+        """
+        return max(0.0, r1 + r2 - d)
+
+    @njit(float64(float64, float64, float64, float64), cache=True, fastmath=True)
+    def distance2_xy(x1, y1, x2, y2):
+        """
+        The squared distance between the points (x1, y1) and (x2, y2).
+        """
+        dx = x1 - x2
+        dy = y1 - y2
+        return dx * dx + dy * dy
+
+    @njit(float64(float64, float64, float64, float64), cache=True, fastmath=True)
+    def distance_xy(x1, y1, x2, y2):
+        """
+        The distance between the points (x1, y1) and (x2, y2).
+        """
+        dx = x1 - x2
+        dy = y1 - y2
+        return math.sqrt(dx * dx + dy * dy)
@@ -46,4 +46,17 @@ SPRING_STIFFNESS = 10
 SPRING_DAMPING = 1
 SPRING_BREAK_FORCE = float('inf')
 SPRING_BREAK_DISTANCE_FACTOR = 3
-NEIGHBORHOOD_RADIUS = 5
\ No newline at end of file
+NEIGHBORHOOD_RADIUS = 5
+
+# Use the CUDA Barnes-Hut backend (if a device is available) at or above this
+# many bodies; below it, the kernel launch and transfers are not worth it.
+GPU_BARNES_HUT_MIN_BODIES = 50000
+# Below this many bodies, sum the gravity over all pairs directly instead of
+# through the Barnes-Hut tree; the compiled (or vectorized) direct sum is
+# faster than the tree walk in Python up to at least this size.
+DIRECT_GRAVITY_MAX_BODIES = 2000
+# Without numba, split the pairs of a batched force kernel into minibatches
+# of at least this many pairs, run on a thread pool (NumPy releases the GIL
+# in its array loops); smaller batches run on the calling thread.
+MINIBATCH_MIN_PAIRS = 20000
+MINIBATCH_WORKERS = 4
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 from scipy.stats import truncnorm
 from pygame.math import Vector2 as vec2
 from typing import Optional
@@ -161,14 +162,15 @@ def get_orbital_body_velocity_around(
 def weighted_velocity(bodies: BodyList) -> vec2:
     """
     Calculate the weighted average velocity of a list of bodies, weighted by mass.
-    """
-    total_mass = sum(body.mass for body in bodies)
-    weighted_vel = vec2(0, 0)
 
-    for body in bodies:
-        weighted_vel += body.vel * body.mass / total_mass
+    The masses and velocities are read into arrays once, and the weighted sum
+    is a single `einsum` over them.
+    """
+    if len(bodies) == 0:
+        return vec2(0, 0)
 
-    return weighted_vel
+    masses = bodies.masses()
+    return vec2(*(np.einsum('i,ij->j', masses, bodies.velocities()) / masses.sum()))
 
 def cross(o, a, b):
     return (a.x - o.x) * (b.y - o.y) - (a.y - o.y) * (b.x - o.x)    
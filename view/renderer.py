@@ -48,10 +48,15 @@ class Renderer:
         self.screen.fill(self.background_color)
 
         if self.draw_bodies:
-            for body in self.bodies:
+            draw.draw_bodies(
+                bodies=self.bodies,
+                screen=self.screen,
+                zoom=self.zoom,
+                pan_offset=self.pan_offset)
+            if self.selected_body is not None and self.selected_body in self.bodies:
                 draw.draw_body(
-                    body=body,
-                    highlight=body is self.selected_body,
+                    body=self.selected_body,
+                    highlight=True,
                     screen=self.screen,
                     zoom=self.zoom,
                     pan_offset=self.pan_offset)